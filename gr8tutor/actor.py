@@ -0,0 +1,121 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Student, Tutor, UserProfile
+
+# Request-scoped "who is this and in which role"
+#
+# Resolved once per request by ActorMiddleware: from a snapshot kept in the
+# session (no queries), or with one joined UserProfile/Tutor/Student query
+# when the snapshot is missing or stale. Profile, Tutor and Student saves
+# bump a per-user version in the cache, which invalidates every session's
+# snapshot for that user. That only reaches every worker through a shared
+# cache - without settings.SHARED_CACHE the actor is always loaded.
+
+SESSION_KEY = "_actor"
+
+
+def version_key(user_id):
+    return f"actor-version:{user_id}"
+
+
+def current_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(version_key(user_id), version, None):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+def invalidate_actor(user_id):
+    cache.delete(version_key(user_id))
+
+
+class Actor:
+    def __init__(self, user, profile=None, tutor=None, student=None):
+        self.user = user
+        self.profile = profile
+        self.tutor = tutor
+        self.student = student
+
+    @property
+    def role(self):
+        return self.profile.role if self.profile else None
+
+    @property
+    def is_tutor(self):
+        return self.role == "tutor"
+
+    @property
+    def is_student(self):
+        return self.role == "student"
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    def snapshot(self, version):
+        return {
+            "version": version,
+            "profile_id": self.profile.id if self.profile else None,
+            "role": self.role,
+            "tutor_id": self.tutor.id if self.tutor else None,
+            "student_id": self.student.id if self.student else None,
+        }
+
+
+def _attach(user, profile, tutor, student):
+    # Prime the ORM caches so user.userprofile(.tutor/.student) are free
+    if profile is not None:
+        user.userprofile = profile
+        if tutor is not None:
+            profile.tutor = tutor
+        if student is not None:
+            profile.student = student
+    return Actor(user, profile, tutor, student)
+
+
+def _from_snapshot(user, data):
+    if data["profile_id"] is None:
+        return Actor(user)
+    profile = UserProfile.from_db(DEFAULT_DB_ALIAS, ["id", "user_id", "role"],
+                                  [data["profile_id"], user.id, data["role"]])
+    tutor = student = None
+    if data["tutor_id"]:
+        tutor = Tutor.from_db(DEFAULT_DB_ALIAS, ["id", "user_profile_id"],
+                              [data["tutor_id"], profile.id])
+    if data["student_id"]:
+        student = Student.from_db(DEFAULT_DB_ALIAS, ["id", "user_profile_id"],
+                                  [data["student_id"], profile.id])
+    return _attach(user, profile, tutor, student)
+
+
+def _from_database(user):
+    profile = (UserProfile.objects.select_related("tutor", "student")
+               .filter(user=user).first())
+    if profile is None:
+        return Actor(user)
+    # Missing reverse one-to-ones raise an AttributeError subclass
+    return _attach(user, profile, getattr(profile, "tutor", None),
+                   getattr(profile, "student", None))
+
+
+def resolve_actor(request):
+    user = request.user
+    if not user.is_authenticated:
+        return Actor(user)
+    if not getattr(settings, "SHARED_CACHE", False):
+        return _from_database(user)
+
+    version = current_version(user.id)
+    data = request.session.get(SESSION_KEY)
+    if data and data.get("version") == version:
+        return _from_snapshot(user, data)
+
+    actor = _from_database(user)
+    request.session[SESSION_KEY] = actor.snapshot(version)
+    return actor
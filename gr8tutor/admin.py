@@ -1,7 +1,16 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import UserProfile, Tutor, Student, StudentTutorRelationship, Message
+from .models import (
+    Conversation,
+    Job,
+    Lesson,
+    Message,
+    Student,
+    StudentTutorRelationship,
+    Tutor,
+    UserProfile,
+)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -31,5 +40,31 @@ class StudentTutorRelationshipAdmin(admin.ModelAdmin):
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("sender", "recipient", "time", "text")
+    list_select_related = ("sender", "recipient")
     search_fields = ("sender__username", "recipient__username", "text")
     list_filter = ("time",)
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ("user_low", "user_high", "last_message_time",
+                    "unread_low", "unread_high")
+    list_select_related = ("user_low", "user_high")
+    search_fields = ("user_low__username", "user_high__username")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("task", "status", "attempts", "run_after", "created_at")
+    list_filter = ("status", "task")
+    readonly_fields = ("last_error",)
+
+
+@admin.register(Lesson)
+class LessonAdmin(admin.ModelAdmin):
+    list_display = ("start", "end", "tutor", "student", "status")
+    list_filter = ("status",)
+    list_select_related = ("tutor__user_profile__user",
+                           "student__user_profile__user")
+    raw_id_fields = ("tutor", "student", "series")
+    date_hierarchy = "start"
@@ -7,4 +7,7 @@ class Gr8TutorConfig(AppConfig):
 
     def ready(self):
         import gr8tutor.signals
+        import gr8tutor.tasks
+        from django.db.models.signals import post_migrate
+        post_migrate.connect(gr8tutor.signals.repair_search_index, sender=self)
     
\ No newline at end of file
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .directory import invalidate_directory
+from .models import Tutor
+
+logger = logging.getLogger(__name__)
+
+# Tutor photo processing, run off the request by the jobs queue
+# (tasks.process_avatar)
+#
+# The upload is re-encoded without its EXIF block (GPS, camera serials)
+# and capped in size, then cropped to a square WebP thumbnail whose name
+# is a hash of its bytes, so it can be cached forever.
+
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+ORIGINAL_MAX_SIZE = 1600
+THUMBNAIL_DIR = "avatars/thumbs/"
+
+
+def thumbnail_size():
+    return getattr(settings, "AVATAR_THUMBNAIL_SIZE", 400)
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def render_avatar(file):
+    # Returns (clean original JPEG bytes, thumbnail WebP bytes)
+    with Image.open(file) as uploaded:
+        image = ImageOps.exif_transpose(uploaded).convert("RGB")
+    image.thumbnail((ORIGINAL_MAX_SIZE, ORIGINAL_MAX_SIZE),
+                    Image.Resampling.LANCZOS)
+    size = thumbnail_size()
+    thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    return (
+        _encode(image, "JPEG", quality=85, optimize=True),
+        _encode(thumbnail, "WEBP", quality=80, method=6),
+    )
+
+
+def thumbnail_name(data):
+    return f"{THUMBNAIL_DIR}{hashlib.sha256(data).hexdigest()[:20]}.webp"
+
+
+def process_avatar(tutor_id, upload_name):
+    tutor = Tutor.objects.only("id", "avatar", "avatar_thumbnail").filter(
+        pk=tutor_id, avatar=upload_name).first()
+    if tutor is None:
+        # Deleted, or replaced by a newer upload with its own task
+        return
+
+    # Storage errors propagate so the job is retried - only a file Pillow
+    # can't decode is thrown away
+    with default_storage.open(upload_name) as handle:
+        try:
+            original, thumbnail = render_avatar(handle)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            original = None
+    if original is None:
+        logger.warning("Tutor %s uploaded an unreadable avatar.", tutor_id)
+        Tutor.objects.filter(pk=tutor_id, avatar=upload_name).update(avatar="")
+        default_storage.delete(upload_name)
+        return
+
+    name = thumbnail_name(thumbnail)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(thumbnail))
+    base, _ = os.path.splitext(upload_name)
+    clean_name = default_storage.save(f"{base}.jpg", ContentFile(original))
+
+    # .update() so a newer upload saved meanwhile isn't overwritten
+    updated = Tutor.objects.filter(pk=tutor_id, avatar=upload_name).update(
+        avatar=clean_name, avatar_thumbnail=name)
+    default_storage.delete(upload_name if updated else clean_name)
+    if updated:
+        delete_unused_thumbnail(tutor.avatar_thumbnail.name, name)
+        invalidate_directory()
+
+
+def delete_unused_thumbnail(old_name, new_name=None):
+    # Identical photos share a thumbnail - only drop it once unreferenced
+    if old_name and old_name != new_name and not Tutor.objects.filter(
+            avatar_thumbnail=old_name).exists():
+        default_storage.delete(old_name)
@@ -0,0 +1,282 @@
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .management.commands.rebuild_conversations import rebuild
+from .models import (
+    Conversation,
+    Message,
+    StudentTutorRelationship,
+    UserProfile,
+)
+from .seeding import (
+    create_students,
+    create_tutors,
+    create_users,
+    keep_message_times,
+)
+
+# View benchmarks - not part of the default test run:
+#
+#     python manage.py test gr8tutor.benchmarks
+#
+# Seeds a directory-sized dataset (BENCHMARK_SCALE multiplies it), requests
+# each view BENCHMARK_REPEAT times through the test client and fails when
+# a view's query count is over its budget or over the committed baseline.
+# BENCHMARK_UPDATE_BASELINE=1 rewrites the baseline from this run.
+#
+# Latencies depend on the machine, so they are only checked on request:
+# BENCHMARK_TIMINGS=<file> compares p95s with timings recorded in that
+# (uncommitted) file on the same machine - more than BENCHMARK_TOLERANCE
+# times slower fails - and BENCHMARK_UPDATE_BASELINE=1 records them there.
+# Timings are only compared at the default scale.
+#
+# Query counts are the worst over all runs, so the first (cold cache) run
+# is what gets budgeted.
+
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+PASSWORD = "benchpass"
+
+# Most queries a single request to each view may make
+QUERY_BUDGETS = {
+    "tutors": 9,
+    "chat_view": 6,
+    "tutor_students": 6,
+    "tutor_dashboard": 5,
+    "login_view": 5,
+    "register_view": 3,
+    "admin_user_list": 3,
+}
+
+def env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+
+def timings_path():
+    value = os.environ.get("BENCHMARK_TIMINGS")
+    return Path(value) if value else None
+
+
+def read_json(path):
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def update_json(path, entries):
+    data = read_json(path)
+    data.update(entries)
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def most_repeated(statements):
+    # The same statement with different literals - usually an N+1
+    shapes = Counter(re.sub(r"\b\d+\b|'[^']*'", "?", sql)
+                     for sql in statements)
+    sql, count = shapes.most_common(1)[0]
+    return f"{count}x {sql[:300]}"
+
+
+def seed(scale, rng):
+    password = make_password(PASSWORD)
+    now = timezone.now()
+
+    _, profiles = create_users("tutor", 200 * scale, "tutor", password)
+    tutors = create_tutors(profiles, rng)
+    _, profiles = create_users("student", 2000 * scale, "student", password)
+    students = create_students(profiles, rng)
+
+    # One tutor with a huge roster, everyone else asks a couple of tutors
+    busy = tutors[0]
+    roster = students[:500 * scale]
+    pending = students[500 * scale:550 * scale]
+    pairs = {(student.id, busy.id): True for student in roster}
+    pairs.update({(student.id, busy.id): False for student in pending})
+    for student in students:
+        for tutor in rng.sample(tutors[1:], 2):
+            pairs.setdefault((student.id, tutor.id), rng.random() < 0.5)
+    StudentTutorRelationship.objects.bulk_create([
+        StudentTutorRelationship(student_id=student_id, tutor_id=tutor_id,
+                                 is_active=active)
+        for (student_id, tutor_id), active in pairs.items()
+    ], batch_size=1000)
+
+    # A long conversation for chat_view and a spread of shorter ones
+    busy_user_id = busy.user_profile.user_id
+    long_user_id = roster[0].user_profile.user_id
+    messages = [
+        Message(sender_id=sender, recipient_id=recipient, text=f"Message {i}",
+                time=now - timedelta(minutes=5000 * scale - i))
+        for i in range(5000 * scale)
+        for sender, recipient in [rng.sample([busy_user_id, long_user_id], 2)]
+    ]
+    for i, student in enumerate(roster[1:200 * scale]):
+        other = student.user_profile.user_id
+        for j in range(20):
+            sender, recipient = rng.sample([busy_user_id, other], 2)
+            messages.append(Message(
+                sender_id=sender, recipient_id=recipient, text=f"Hello {j}",
+                time=now - timedelta(hours=i, minutes=j)))
+    with keep_message_times():
+        Message.objects.bulk_create(messages, batch_size=1000)
+    rebuild(Message, Conversation, batch_size=1000)
+
+    User.objects.create_superuser("benchadmin", "benchadmin@example.com",
+                                  PASSWORD)
+    UserProfile.objects.filter(user__username="benchadmin").update(role="admin")
+    return {
+        "busy_tutor": busy.user_profile.user.username,
+        "student": roster[0].user_profile.user.username,
+        "student_user_id": long_user_id,
+        "admin": "benchadmin",
+    }
+
+
+# A fast hasher, so login/register time the view rather than PBKDF2, and
+# the production cache setup (Redis is shared by every worker)
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    SHARED_CACHE=True,
+)
+class ViewBenchmarks(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(env_int("BENCHMARK_SCALE", 1), random.Random(2024))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not cls.results:
+            return
+        print("\nview                  queries   p50 ms   p95 ms   max ms")
+        for name, result in sorted(cls.results.items()):
+            print(f"{name:<20}{result['queries']:>9}{result['p50_ms']:>9.1f}"
+                  f"{result['p95_ms']:>9.1f}{result['max_ms']:>9.1f}")
+        if not os.environ.get("BENCHMARK_UPDATE_BASELINE"):
+            return
+        update_json(BASELINE_PATH, {
+            name: {"queries": result["queries"]}
+            for name, result in cls.results.items()})
+        if timings_path():
+            update_json(timings_path(), {
+                name: {key: value for key, value in result.items()
+                       if key != "queries"}
+                for name, result in cls.results.items()})
+
+    def setUp(self):
+        for alias in ("default", "pages"):
+            caches[alias].clear()
+
+    def measure(self, name, request, username=None, repeat=None):
+        # request(client, i) makes one request and returns the response
+        repeat = repeat or env_int("BENCHMARK_REPEAT", 20)
+        client = self.client_class()
+        if username:
+            client.login(username=username, password=PASSWORD)
+
+        timings, worst = [], []
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(client, i)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 400, name)
+            # Savepoints only come from TestCase's wrapping transaction
+            statements = [query["sql"] for query in captured
+                          if "SAVEPOINT" not in query["sql"]]
+            if len(statements) > len(worst):
+                worst = statements
+
+        result = {
+            "queries": len(worst),
+            "p50_ms": round(percentile(timings, 0.5), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "max_ms": round(max(timings), 2),
+        }
+        self.results[name] = result
+        self.check_result(name, result, worst)
+
+    def check_result(self, name, result, statements):
+        self.assertLessEqual(
+            result["queries"], QUERY_BUDGETS[name],
+            f"{name} made {result['queries']} queries, its budget is "
+            f"{QUERY_BUDGETS[name]}; most repeated: {most_repeated(statements)}")
+        if os.environ.get("BENCHMARK_UPDATE_BASELINE"):
+            return
+        baseline = read_json(BASELINE_PATH).get(name)
+        if baseline is not None:
+            self.assertLessEqual(
+                result["queries"], baseline["queries"],
+                f"{name} made {result['queries']} queries, the baseline is "
+                f"{baseline['queries']}; most repeated: "
+                f"{most_repeated(statements)}")
+
+        timings = read_json(timings_path()).get(name) if timings_path() else None
+        if timings is None or env_int("BENCHMARK_SCALE", 1) != 1:
+            return
+        tolerance = float(os.environ.get("BENCHMARK_TOLERANCE") or 3)
+        self.assertLessEqual(
+            result["p95_ms"], timings["p95_ms"] * tolerance,
+            f"{name} p95 is {result['p95_ms']} ms, "
+            f"it was {timings['p95_ms']} ms on this machine")
+
+    def test_tutors(self):
+        self.measure("tutors",
+                     lambda client, i: client.get(reverse("tutors")),
+                     username=self.seeded["student"])
+
+    def test_chat_view(self):
+        url = reverse("chat", args=[self.seeded["student_user_id"]])
+        self.measure("chat_view", lambda client, i: client.get(url),
+                     username=self.seeded["busy_tutor"])
+
+    def test_tutor_students(self):
+        self.measure("tutor_students",
+                     lambda client, i: client.get(reverse("tutor_students")),
+                     username=self.seeded["busy_tutor"])
+
+    def test_tutor_dashboard(self):
+        self.measure("tutor_dashboard",
+                     lambda client, i: client.get(reverse("tutor_dashboard")),
+                     username=self.seeded["busy_tutor"])
+
+    def test_login_view(self):
+        def login(client, i):
+            client.cookies.clear()
+            return client.post(reverse("login"), {
+                "username": self.seeded["student"], "password": PASSWORD})
+        self.measure("login_view", login)
+
+    def test_register_view(self):
+        def register(client, i):
+            return client.post(reverse("register"), {
+                "username": f"newuser{i}", "email": f"newuser{i}@example.com",
+                "password": PASSWORD, "password_again": PASSWORD,
+                "role": "student"})
+        self.measure("register_view", register)
+
+    def test_admin_user_list(self):
+        self.measure("admin_user_list",
+                     lambda client, i: client.get(reverse("admin_user_list"),
+                                                  {"role": "student"}),
+                     username=self.seeded["admin"])
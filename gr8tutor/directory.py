@@ -0,0 +1,107 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Tutor directory cache
+#
+# Each directory page (tutors + subject facets) is cached under a key that
+# includes a directory-wide version, bumped by the Tutor/UserProfile/User
+# signals in signals.py. Entries carry a soft expiry: once it passes, one
+# worker regenerates behind a lock while the others keep serving the stale
+# copy, and a cold key is rebuilt by one worker while the rest wait for it.
+
+VERSION_KEY = "tutor-directory-version"
+STATS_KEY = "tutor-directory-stats:{}"
+STATS = ("hits", "misses", "stale", "waits")
+
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+
+def directory_version():
+    # A random token, not a counter: an evicted key starts a new version
+    # instead of reviving entries cached under an old one
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def invalidate_directory():
+    def bump():
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    bump()
+    # Again after commit, in case a reader cached the old rows meanwhile
+    transaction.on_commit(bump)
+
+
+def directory_cache_key(*parts):
+    # Built from the parsed filters, so equivalent query strings share a key
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"tutor-directory:{directory_version()}:{digest}"
+
+
+def _count(stat):
+    key = STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def directory_cache_stats():
+    values = cache.get_many([STATS_KEY.format(stat) for stat in STATS])
+    return {stat: values.get(STATS_KEY.format(stat), 0) for stat in STATS}
+
+
+def reset_directory_cache_stats():
+    cache.delete_many([STATS_KEY.format(stat) for stat in STATS])
+
+
+def _regenerate(key, compute, timeout):
+    value = compute()
+    # Kept for twice the fresh period so there is something stale to serve
+    cache.set(key, (value, time.time() + timeout), timeout * 2)
+    return value
+
+
+def cached_directory(key, compute):
+    if not getattr(settings, "SHARED_CACHE", False):
+        return compute()
+    timeout = getattr(settings, "TUTOR_DIRECTORY_CACHE_TIMEOUT", 300)
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            _count("hits")
+            return value
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            _count("stale")
+            return value
+        _count("misses")
+    else:
+        _count("misses")
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            # Someone else is already querying - wait for their result
+            _count("waits")
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0]
+            return compute()
+
+    try:
+        return _regenerate(key, compute, timeout)
+    finally:
+        cache.delete(lock_key)
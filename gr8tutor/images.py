@@ -0,0 +1,72 @@
+import io
+import os
+
+from django.conf import settings
+
+# Responsive variants of the bundled static images
+#
+# Built during collectstatic by storage.ResponsiveStaticFilesStorage: every
+# JPEG/PNG under img/ gets AVIF and WebP copies at RESPONSIVE_IMAGE_WIDTHS
+# (never upscaled), all listed in RESPONSIVE_MANIFEST for the
+# {% responsive_image %} tag. Needs Pillow, formats it can't encode are
+# skipped.
+
+RESPONSIVE_MANIFEST = "img/responsive.json"
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Best format first - browsers take the first <source> they support
+FORMATS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 78, "method": 6},
+}
+
+
+def responsive_widths():
+    return sorted(getattr(settings, "RESPONSIVE_IMAGE_WIDTHS", (480, 800, 1200)))
+
+
+def is_source_image(path):
+    return path.startswith("img/") and path.lower().endswith(SOURCE_EXTENSIONS)
+
+
+def variant_name(path, width, fmt):
+    base, _ = os.path.splitext(path)
+    return f"{base}-{width}w.{fmt}"
+
+
+def available_formats():
+    from PIL import features
+    return [fmt for fmt in FORMATS if features.check(fmt)]
+
+
+def target_widths(width):
+    # The configured widths the original can fill, plus the original size
+    # when it's no bigger than the largest configured width
+    widths = [w for w in responsive_widths() if w < width]
+    if not widths or width <= responsive_widths()[-1]:
+        widths.append(width)
+    return widths
+
+
+def build_variants(path, file, formats):
+    # Returns (manifest entry, [(variant name, encoded bytes), ...])
+    from PIL import Image, ImageOps
+
+    with Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        width, height = image.size
+
+        entry = {"width": width, "height": height, "variants": {}}
+        files = []
+        for w in target_widths(width):
+            resized = image if w == width else image.resize(
+                (w, max(1, round(height * w / width))), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, fmt.upper(), **FORMATS[fmt])
+                name = variant_name(path, w, fmt)
+                files.append((name, buffer.getvalue()))
+                entry["variants"].setdefault(fmt, []).append([w, name])
+    return entry, files
@@ -0,0 +1,137 @@
+import logging
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# DB-backed background jobs
+#
+# enqueue() inserts a Job in the caller's transaction, so a job exists only
+# if the change that caused it was committed. "manage.py run_jobs" claims
+# due jobs in batches, runs them and retries failures with exponential
+# backoff. Tasks registered with batch=True get all of a batch's payloads
+# in one call; a dedupe_key coalesces repeat enqueues into one queued job.
+
+TASKS = {}
+
+
+class Task:
+    def __init__(self, func, name, batch, max_attempts):
+        self.func = func
+        self.name = name
+        self.batch = batch
+        self.max_attempts = max_attempts
+
+
+def task(name, batch=False, max_attempts=5):
+    def register(func):
+        TASKS[name] = Task(func, name, batch, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, payload=None, delay=0, dedupe_key=None):
+    job = Job(
+        task=TASKS[name].name,
+        payload=payload or {},
+        dedupe_key=dedupe_key,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=TASKS[name].max_attempts,
+    )
+    if dedupe_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # Already queued - that run will cover this one too
+        return None
+    return job
+
+
+def _lock_timeout():
+    return getattr(settings, "JOB_LOCK_TIMEOUT", 600)
+
+
+def claim_jobs(limit):
+    # The conditional UPDATE is the lock: a row only moves to "running"
+    # for the worker whose token lands on it, on any database backend
+    now = timezone.now()
+    due = Q(status="queued", run_after__lte=now) | Q(
+        status="running", locked_at__lt=now - timedelta(seconds=_lock_timeout())
+    )
+    ids = list(Job.objects.filter(due).order_by("run_after")
+               .values_list("id", flat=True)[:limit])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    Job.objects.filter(due, id__in=ids).update(
+        status="running", locked_at=now, locked_by=token,
+        attempts=F("attempts") + 1,
+    )
+    return list(Job.objects.filter(locked_by=token, status="running"))
+
+
+def _retry_delay(attempts):
+    base = getattr(settings, "JOB_RETRY_DELAY", 30)
+    return min(base * 2 ** (attempts - 1), 3600)
+
+
+def _failed(jobs, error):
+    message = "".join(traceback.format_exception(error))
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status="failed", locked_at=None, last_error=message)
+            logger.error("Job %s gave up after %d attempts.", job, job.attempts)
+            continue
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status="queued", locked_at=None, last_error=message,
+                    run_after=timezone.now()
+                    + timedelta(seconds=_retry_delay(job.attempts)),
+                )
+        except IntegrityError:
+            # A newer job with the same dedupe key is queued and will
+            # redo this work
+            Job.objects.filter(pk=job.pk).delete()
+
+
+def _execute(jobs, call):
+    try:
+        call()
+    except Exception as e:
+        logger.exception("Job %s failed.", jobs[0].task)
+        _failed(jobs, e)
+    else:
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+
+
+def run_due_jobs(limit=100):
+    jobs = claim_jobs(limit)
+    by_task = defaultdict(list)
+    for job in jobs:
+        by_task[job.task].append(job)
+
+    for name, group in by_task.items():
+        entry = TASKS.get(name)
+        if entry is None:
+            _failed(group, LookupError(f"Unknown task {name!r}."))
+        elif entry.batch:
+            _execute(group, lambda: entry.func([job.payload for job in group]))
+        else:
+            for job in group:
+                _execute([job], lambda: entry.func(**job.payload))
+    return len(jobs)
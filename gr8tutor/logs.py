@@ -0,0 +1,109 @@
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Structured, non-blocking logging
+#
+# Records are formatted to one JSON line in the calling thread (so the
+# request id and arguments are captured as they were) and handed to a
+# queue; a single listener thread per process does the actual writing.
+# A full queue drops the record rather than making a request wait.
+#
+# Loaded from settings.LOGGING, so nothing here may import models.
+
+current_request = ContextVar("current_request", default=None)
+
+# Attributes every LogRecord has - anything else was passed in extra=
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord(
+    "", 0, "", 0, "", (), None)).keys()) | {"message", "asctime", "request_id",
+                                            "view", "taskName"}
+# Things django.request / django.server attach that don't serialise usefully
+SKIPPED_EXTRAS = frozenset({"request", "server_time"})
+
+
+def new_request_id(supplied=None):
+    # Keep the router's id (Heroku/Render send X-Request-ID) if it's sane
+    if supplied and len(supplied) <= 200 and supplied.isprintable():
+        return supplied
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    # Adds request_id and view to every record logged during a request
+    def filter(self, record):
+        # django.request logs after the middleware has returned, but passes
+        # the request along
+        request = current_request.get() or getattr(record, "request", None)
+        record.request_id = getattr(request, "request_id", None)
+        if not hasattr(record, "view"):
+            match = getattr(request, "resolver_match", None)
+            record.view = match.url_name if match else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+                    .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "view"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in SKIPPED_EXTRAS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    # Plain lines for local development (LOG_FORMAT=text)
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s "
+                         "[%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+
+class QueueingHandler(QueueHandler):
+    # Formats in the caller, writes to stream from a listener thread
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        output = logging.StreamHandler(stream or sys.stderr)
+        # Stopped, after draining the queue, by logging.shutdown() at exit
+        self.listener = QueueListener(self.queue, output)
+        self.listener.start()
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        # Already part of the formatted message
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
@@ -0,0 +1,243 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from gr8tutor.directory import invalidate_directory
+from gr8tutor.recommendations import invalidate_index
+from gr8tutor.models import Student, Tutor, UserProfile, make_bio_excerpt
+
+# Columns: username, email, password, role (tutor|student), all required
+# Optional: bio, subject, hourly_rate, experience (tutors), goals (students)
+
+
+def _init_worker():
+    # Spawned workers (macOS/Windows) need Django set up for the hashers
+    import django
+    django.setup()
+
+
+# Model fields each column is cleaned with, per role
+FIELDS = {
+    "tutor": [(User, "username"), (User, "email"), (Tutor, "bio"),
+              (Tutor, "subject"), (Tutor, "hourly_rate"),
+              (Tutor, "experience")],
+    "student": [(User, "username"), (User, "email"), (Student, "goals")],
+}
+NON_NEGATIVE = ("hourly_rate", "experience")
+
+
+def _hash_password(raw):
+    return make_password(raw)
+
+
+def clean_row(row):
+    # Every value through its model field's own clean() (max_length, the
+    # username validator, decimal digits...), so a bad row is reported on
+    # its own rather than failing the whole batch's INSERT
+    cleaned = dict(row)
+    for model, name in FIELDS[row["role"]]:
+        field = model._meta.get_field(name)
+        value = row.get(name)
+        value = field.get_default() if value in (None, "") else str(value)
+        try:
+            cleaned[name] = field.clean(value, None)
+        except ValidationError as e:
+            raise ValidationError(f"{name}: {' '.join(e.messages)}")
+        if name in NON_NEGATIVE and cleaned[name] < 0:
+            raise ValidationError(f"{name}: must not be negative.")
+    return cleaned
+
+
+def read_rows(path, fmt):
+    # Yields (line number, row dict) without loading the file into memory
+    with open(path, newline="", encoding="utf-8") as handle:
+        if fmt == "csv":
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+
+
+class Command(BaseCommand):
+    help = "Bulk import tutors and students from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"],
+                            help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Password hashing processes (0 = inline).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Validate only, write nothing.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+
+        self.dry_run = options["dry_run"]
+        self.seen_usernames = set()
+        self.seen_emails = set()
+        self.errors = 0
+        created = 0
+        started = time.monotonic()
+
+        pool = None
+        if options["workers"] > 0 and not self.dry_run:
+            pool = ProcessPoolExecutor(max_workers=options["workers"],
+                                       initializer=_init_worker)
+        try:
+            rows = read_rows(path, fmt)
+            batch_number = 0
+            while True:
+                batch = list(islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                batch_number += 1
+                batch_started = time.monotonic()
+
+                valid = self.validate(batch)
+                if not self.dry_run and valid:
+                    self.insert(valid, pool, batch_number)
+                created += len(valid)
+
+                elapsed = time.monotonic() - batch_started
+                self.stdout.write(
+                    f"Batch {batch_number}: {len(valid)}/{len(batch)} rows ok, "
+                    f"{len(batch) / elapsed if elapsed else 0:.0f} rows/s"
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.monotonic() - started
+        verb = "Validated" if self.dry_run else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {created} users in {elapsed:.1f}s "
+            f"({created / elapsed if elapsed else 0:.0f} users/s), "
+            f"{self.errors} rows rejected."
+        ))
+
+    def reject(self, number, reason):
+        self.errors += 1
+        self.stderr.write(f"Line {number}: {reason}")
+
+    def validate(self, batch):
+        candidates = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.reject(number, "not a JSON object.")
+                continue
+            row = {key: value.strip() if isinstance(value, str) else value
+                   for key, value in row.items() if key}
+            role = row.get("role")
+
+            if (row.get("username") in (None, "")
+                    or row.get("email") in (None, "")):
+                self.reject(number, "username and email are required.")
+                continue
+            if row.get("password") in (None, ""):
+                self.reject(number, "password is required.")
+                continue
+            if role not in ("tutor", "student"):
+                self.reject(number, f"invalid role {role!r}.")
+                continue
+            try:
+                row = clean_row(row)
+            except ValidationError as e:
+                self.reject(number, e.messages[0])
+                continue
+            username, email = row["username"], row["email"]
+            if username in self.seen_usernames:
+                self.reject(number, f"duplicate username {username!r} in file.")
+                continue
+            if email in self.seen_emails:
+                self.reject(number, f"duplicate email {email!r} in file.")
+                continue
+
+            self.seen_usernames.add(username)
+            self.seen_emails.add(email)
+            candidates.append((number, row))
+
+        # One lookup per batch for accounts that already exist
+        usernames = {row["username"] for _, row in candidates}
+        emails = {row["email"] for _, row in candidates}
+        taken_usernames = set(User.objects.filter(username__in=usernames)
+                              .values_list("username", flat=True))
+        taken_emails = set(User.objects.filter(email__in=emails)
+                           .values_list("email", flat=True))
+
+        valid = []
+        for number, row in candidates:
+            if row["username"] in taken_usernames:
+                self.reject(number, f"username {row['username']!r} already exists.")
+            elif row["email"] in taken_emails:
+                self.reject(number, f"email {row['email']!r} already exists.")
+            else:
+                valid.append(row)
+        return valid
+
+    def insert(self, rows, pool, batch_number):
+        raw_passwords = [str(row["password"]) for row in rows]
+        if pool is not None:
+            hashes = list(pool.map(_hash_password, raw_passwords,
+                                   chunksize=max(1, len(rows) // 32)))
+        else:
+            hashes = [_hash_password(raw) for raw in raw_passwords]
+
+        try:
+            with transaction.atomic():
+                # Signals are skipped by bulk_create, so profiles are
+                # created here with their role already set
+                users = User.objects.bulk_create([
+                    User(username=row["username"], email=row["email"],
+                         password=password)
+                    for row, password in zip(rows, hashes)
+                ])
+                profiles = UserProfile.objects.bulk_create([
+                    UserProfile(user=user, role=row["role"])
+                    for user, row in zip(users, rows)
+                ])
+                Tutor.objects.bulk_create([
+                    Tutor(
+                        user_profile=profile,
+                        bio=row.get("bio", ""),
+                        bio_excerpt=make_bio_excerpt(row.get("bio", "")),
+                        subject=row.get("subject", ""),
+                        hourly_rate=row["hourly_rate"],
+                        experience=row["experience"],
+                    )
+                    for profile, row in zip(profiles, rows)
+                    if row["role"] == "tutor"
+                ])
+                Student.objects.bulk_create([
+                    Student(user_profile=profile, goals=row.get("goals", ""))
+                    for profile, row in zip(profiles, rows)
+                    if row["role"] == "student"
+                ])
+        except IntegrityError as e:
+            raise CommandError(
+                f"Batch {batch_number} rolled back, an account was created "
+                f"concurrently: {e}"
+            )
+        # bulk_create skips the signals that normally do this
+        invalidate_directory()
+        invalidate_index()
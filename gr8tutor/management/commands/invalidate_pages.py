@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from gr8tutor.pagecache import invalidate_pages
+
+
+class Command(BaseCommand):
+    help = "Drop every cached public page (e.g. after editing a template)."
+
+    def handle(self, *args, **options):
+        version = invalidate_pages()
+        self.stdout.write(self.style.SUCCESS(
+            f"Public page cache is now at version {version}."))
@@ -0,0 +1,70 @@
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gr8tutor.profiling import SUFFIX, profile_dir, read_profile, view_of
+
+
+class Command(BaseCommand):
+    help = "Merge the sampled request profiles of every worker and show the hot paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Profile directory (default PROFILING_DIR).")
+        parser.add_argument("--view", help="Only profiles of this URL name.")
+        parser.add_argument("--since", type=float,
+                            help="Only profiles from the last N minutes.")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--output",
+                            help="Also write the merged stacks, for flamegraph.pl/speedscope.")
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"]) if options["dir"] else profile_dir()
+        paths = sorted(directory.glob(f"*{SUFFIX}"))
+        if options["view"]:
+            paths = [path for path in paths if view_of(path) == options["view"]]
+        if options["since"]:
+            cutoff = time.time() - options["since"] * 60
+            paths = [path for path in paths if path.stat().st_mtime >= cutoff]
+        if not paths:
+            raise CommandError(f"No profiles in {directory}.")
+
+        stacks = Counter()
+        views = Counter()
+        for path in paths:
+            stacks.update(read_profile(path))
+            views[view_of(path)] += 1
+        total = sum(stacks.values())
+
+        # Self time: the frame on top of the stack. Total time: anywhere in
+        # the stack, counted once per sample even when recursive.
+        own, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        top = options["top"]
+        self.stdout.write(f"{len(paths)} profiles, {total} samples: " + ", ".join(
+            f"{view} x{count}" for view, count in views.most_common()))
+        for title, counter in (("Self", own), ("Total", inclusive)):
+            self.stdout.write(f"\n{title:>6}  function")
+            for frame, count in counter.most_common(top):
+                self.stdout.write(f"{count / total:>6.1%}  {frame}")
+
+        self.stdout.write("\nHottest paths (gr8tutor frames)")
+        chains = Counter()
+        for stack, count in stacks.items():
+            frames = [frame for frame in stack.split(";")
+                      if frame.startswith("gr8tutor.")]
+            chains[" > ".join(frames) or "(outside gr8tutor)"] += count
+        for chain, count in chains.most_common(top):
+            self.stdout.write(f"{count / total:>6.1%}  {chain}")
+
+        if options["output"]:
+            Path(options["output"]).write_text("".join(
+                f"{stack} {count}\n" for stack, count in stacks.most_common()))
+            self.stdout.write(self.style.SUCCESS(
+                f"Merged stacks written to {options['output']}."))
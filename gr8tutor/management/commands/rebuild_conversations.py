@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DateTimeField,
+    F,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils.text import Truncator
+
+# Stands in for "never read" in the unread comparison
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def rebuild(Message, Conversation, batch_size=500, log=None):
+    # Recompute every inbox row from the Message table. Read watermarks
+    # are kept; pairs seen for the first time count their history as read.
+    # Called from migration 0010 with historical models, which don't
+    # carry class attributes - hence the import for PREVIEW_LENGTH.
+    from gr8tutor.models import Conversation as CurrentConversation
+
+    existing = {
+        (c.user_low_id, c.user_high_id): c
+        for c in Conversation.objects.all().iterator(chunk_size=batch_size)
+    }
+    # One grouped pass: last message id and unread counts per pair, the
+    # unread ones counted past the pair's stored watermark (all when unset)
+    watermark = Conversation.objects.filter(
+        user_low=OuterRef("low"), user_high=OuterRef("high"))
+
+    def unread(side):
+        return Count("id", filter=Q(recipient=F(side)) & Q(
+            time__gt=Coalesce(
+                Subquery(watermark.values(f"{side}_read_at")[:1]),
+                Value(EPOCH, output_field=DateTimeField()),
+            )))
+
+    pairs = (
+        Message.objects.order_by()
+        .exclude(sender=F("recipient"))
+        .annotate(low=Least("sender", "recipient"),
+                  high=Greatest("sender", "recipient"))
+        .values("low", "high")
+        .annotate(last_id=Max("id"), unread_low=unread("low"),
+                  unread_high=unread("high"))
+    ).iterator(chunk_size=batch_size)
+
+    fields = ["last_sender", "last_message_text", "last_message_time",
+              "unread_low", "unread_high", "low_read_at", "high_read_at"]
+    preview = CurrentConversation.PREVIEW_LENGTH
+    seen = set()
+    while batch := list(islice(pairs, batch_size)):
+        last_messages = Message.objects.in_bulk(
+            [pair["last_id"] for pair in batch])
+        to_create, to_update = [], []
+        for pair in batch:
+            low, high = pair["low"], pair["high"]
+            seen.add((low, high))
+            last = last_messages[pair["last_id"]]
+            conversation = existing.get((low, high))
+            if conversation is None:
+                conversation = Conversation(user_low_id=low, user_high_id=high,
+                                            low_read_at=last.time,
+                                            high_read_at=last.time)
+                to_create.append(conversation)
+            else:
+                conversation.unread_low = pair["unread_low"]
+                conversation.unread_high = pair["unread_high"]
+                to_update.append(conversation)
+
+            conversation.last_sender_id = last.sender_id
+            conversation.last_message_text = Truncator(last.text).chars(preview)
+            conversation.last_message_time = last.time
+
+        with transaction.atomic():
+            Conversation.objects.bulk_create(to_create)
+            Conversation.objects.bulk_update(to_update, fields)
+        if log:
+            log(f"Saved {len(batch)} conversations")
+
+    # Pairs whose messages are all gone
+    stale = [c.id for key, c in existing.items() if key not in seen]
+    for start in range(0, len(stale), batch_size):
+        Conversation.objects.filter(id__in=stale[start:start + batch_size]).delete()
+    return len(seen), len(stale)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Conversation inbox rows from the Message table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        from gr8tutor.models import Conversation, Message
+
+        total, removed = rebuild(Message, Conversation,
+                                 batch_size=options["batch_size"],
+                                 log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total} conversations ({removed} stale removed)."
+        ))
@@ -0,0 +1,40 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gr8tutor.jobs import run_due_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (notifications, avatar processing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--sleep", type=float, default=2.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once nothing is due instead of polling.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        # Finish the current batch on a deploy/restart instead of dying mid-job
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        total = 0
+        while not self.stopping:
+            close_old_connections()
+            count = run_due_jobs(options["batch_size"])
+            total += count
+            if count:
+                self.stdout.write(f"Ran {count} jobs.")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Stopped after {total} jobs."))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,126 @@
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from gr8tutor.directory import invalidate_directory
+from gr8tutor.recommendations import invalidate_index
+from gr8tutor.models import StudentTutorRelationship
+from gr8tutor.seeding import (
+    conversation_lengths,
+    create_students,
+    create_tutors,
+    create_users,
+    fast_sqlite_writes,
+    insert_conversations,
+    zipf_picker,
+)
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with synthetic tutors, students, relationships "
+            "and messages for scale testing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tutors", type=int, default=1000)
+        parser.add_argument("--students", type=int, default=20000)
+        parser.add_argument("--tutors-per-student", type=int, default=3,
+                            help="Most tutors a student asks for.")
+        parser.add_argument("--active-ratio", type=float, default=0.7,
+                            help="Share of requests the tutor confirmed.")
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--days", type=int, default=365,
+                            help="How far back message history goes.")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Processes writing messages (PostgreSQL).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prefix", default="seed",
+                            help="Username prefix, must not be in use yet.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Users named {prefix}-* exist already, "
+                               "pass another --prefix.")
+        workers = options["workers"]
+        if workers > 1 and connection.vendor == "sqlite":
+            # SQLite has a single writer, extra processes would only wait
+            self.stderr.write("SQLite: writing messages from one process.")
+            workers = 1
+
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        started = time.monotonic()
+        fast_sqlite_writes()
+        password = make_password(None)  # unusable
+
+        _, profiles = create_users(f"{prefix}-t", options["tutors"], "tutor",
+                                   password, batch_size)
+        tutors = create_tutors(profiles, rng, batch_size)
+        _, profiles = create_users(f"{prefix}-s", options["students"],
+                                   "student", password, batch_size)
+        students = create_students(profiles, rng, batch_size)
+        self.log(started, f"{len(tutors)} tutors, {len(students)} students")
+
+        pairs = self.create_relationships(tutors, students, rng, options)
+        self.log(started, f"{len(pairs)} confirmed tutor/student pairs")
+
+        conversations = conversation_lengths(pairs, options["messages"], rng)
+        written = self.write_messages(conversations, workers, options)
+        self.log(started, f"{written} messages in {len(conversations)} conversations")
+
+        invalidate_directory()
+        invalidate_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded in {time.monotonic() - started:.1f}s."))
+
+    def create_relationships(self, tutors, students, rng, options):
+        # Popular tutors get picked far more often - a few end up with
+        # thousands of students
+        pick = zipf_picker(tutors, rng)
+        relationships, confirmed = [], []
+        for student in students:
+            chosen = {pick() for _ in range(
+                rng.randint(1, options["tutors_per_student"]))}
+            for tutor in chosen:
+                active = rng.random() < options["active_ratio"]
+                relationships.append(StudentTutorRelationship(
+                    student=student, tutor=tutor, is_active=active))
+                if active:
+                    confirmed.append((tutor.user_profile.user_id,
+                                      student.user_profile.user_id))
+        StudentTutorRelationship.objects.bulk_create(
+            relationships, batch_size=options["batch_size"])
+        rng.shuffle(confirmed)
+        return confirmed
+
+    def write_messages(self, conversations, workers, options):
+        days, seed, batch_size = (options["days"], options["seed"],
+                                  options["batch_size"])
+        if workers <= 1:
+            return insert_conversations(conversations, days, seed, batch_size)
+
+        # Each process gets whole conversations, so inbox rows never clash.
+        # Spawned workers set Django up before unpickling the task (fork
+        # would share this process's database connection).
+        connections.close_all()
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as pool:
+            return sum(pool.map(
+                insert_conversations,
+                [conversations[i::workers] for i in range(workers)],
+                [days] * workers, [seed + i for i in range(workers)],
+                [batch_size] * workers,
+            ))
+
+    def log(self, started, message):
+        self.stdout.write(f"[{time.monotonic() - started:6.1f}s] {message}")
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates, Template
+
+# Per-request timings and Prometheus histograms
+#
+# RequestMetricsMiddleware measures each request (total time, DB queries
+# and time, template rendering) and reports it in a Server-Timing header.
+# Observations are counted per process and added to counters in the
+# default cache every METRICS_FLUSH_INTERVAL seconds, so /metrics shows
+# the sum over every gunicorn worker. That needs settings.SHARED_CACHE -
+# a locmem cache would also cull the counters - so otherwise the totals
+# stay in the process, and /metrics is only served by a single worker.
+#
+# Series are labelled with the view's URL name from gr8tutor/urls.py -
+# anything else (admin, static, 404s) is "other" - so the set of keys to
+# read back is known without keeping an index of them.
+
+slow_queries = logging.getLogger("gr8tutor.slow_queries")
+
+KEY = "metrics:{}:{}:{}"
+OTHER_VIEW = "other"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# name -> (help, buckets, sum unit); sums are stored as integers
+HISTOGRAMS = {
+    "gr8tutor_request_duration_seconds": (
+        "Time to produce the response.", DURATION_BUCKETS, 1e-6),
+    "gr8tutor_db_duration_seconds": (
+        "Time spent in database queries per request.", DURATION_BUCKETS, 1e-6),
+    "gr8tutor_db_queries": (
+        "Database queries per request.", QUERY_BUCKETS, 1),
+    "gr8tutor_template_duration_seconds": (
+        "Time spent rendering templates per request.", DURATION_BUCKETS, 1e-6),
+}
+
+
+class RequestTimings:
+    def __init__(self, slow_query=None):
+        self.slow_query = slow_query
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries += 1
+            if self.slow_query is not None and elapsed >= self.slow_query:
+                # Statement only - parameters can hold personal data
+                slow_queries.warning(
+                    "Slow query (%.0f ms)", elapsed * 1000,
+                    extra={"duration_ms": round(elapsed * 1000, 1),
+                           "sql": sql[:2000],
+                           "database": context["connection"].alias},
+                )
+
+
+current_timings = ContextVar("current_timings", default=None)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None or timings.rendering:
+            return super().render(context, request)
+        # Only the outermost render, templates rendered inside it are
+        # already part of its time
+        timings.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+            timings.rendering -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # Template backend whose templates report their render time
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+@lru_cache
+def view_names():
+    from . import urls
+
+    return sorted({pattern.name for pattern in urls.urlpatterns
+                   if pattern.name} | {OTHER_VIEW})
+
+
+def view_label(request):
+    match = request.resolver_match
+    if match is not None and match.url_name in view_names():
+        return match.url_name
+    return OTHER_VIEW
+
+
+def bucket_index(buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+def shared_metrics():
+    return getattr(settings, "SHARED_CACHE", False)
+
+
+def metrics_available():
+    return shared_metrics() or getattr(settings, "WEB_CONCURRENCY", 1) <= 1
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        # Running totals when there is no shared cache to flush to
+        self.totals = {}
+        self.flushed = time.monotonic()
+
+    def observe(self, view, timings, total):
+        values = {
+            "gr8tutor_request_duration_seconds": total,
+            "gr8tutor_db_duration_seconds": timings.db_time,
+            "gr8tutor_db_queries": timings.queries,
+            "gr8tutor_template_duration_seconds": timings.template_time,
+        }
+        with self.lock:
+            for name, value in values.items():
+                _, buckets, unit = HISTOGRAMS[name]
+                for key, amount in (
+                    (KEY.format(name, view, bucket_index(buckets, value)), 1),
+                    (KEY.format(name, view, "count"), 1),
+                    (KEY.format(name, view, "sum"), round(value / unit)),
+                ):
+                    self.pending[key] = self.pending.get(key, 0) + amount
+            due = (time.monotonic() - self.flushed
+                   >= getattr(settings, "METRICS_FLUSH_INTERVAL", 5))
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed = time.monotonic()
+            if not shared_metrics():
+                for key, amount in pending.items():
+                    self.totals[key] = self.totals.get(key, 0) + amount
+                return
+        for key, amount in pending.items():
+            if not amount:
+                continue
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.add(key, 0, None)
+                cache.incr(key, amount)
+
+
+recorder = Recorder()
+
+
+def render_metrics():
+    # Prometheus text exposition format
+    recorder.flush()
+    views = view_names()
+    keys = [KEY.format(name, view, part)
+            for name, (_, buckets, _) in HISTOGRAMS.items()
+            for view in views
+            for part in [*range(len(buckets) + 1), "count", "sum"]]
+    if shared_metrics():
+        values = cache.get_many(keys)
+    else:
+        with recorder.lock:
+            values = dict(recorder.totals)
+
+    lines = []
+    for name, (help_text, buckets, unit) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for view in views:
+            count = values.get(KEY.format(name, view, "count"), 0)
+            if not count:
+                continue
+            cumulative = 0
+            for index, bound in enumerate([*buckets, "+Inf"]):
+                cumulative += values.get(KEY.format(name, view, index), 0)
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                             f"{cumulative}")
+            total = round(values.get(KEY.format(name, view, "sum"), 0) * unit, 6)
+            lines.append(f'{name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{name}_count{{view="{view}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings, total):
+    return ", ".join([
+        f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries"',
+        f"tpl;dur={timings.template_time * 1000:.1f}",
+        f"total;dur={total * 1000:.1f}",
+    ])
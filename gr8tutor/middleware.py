@@ -0,0 +1,139 @@
+import hmac
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from .actor import resolve_actor
+from .logs import current_request, new_request_id
+from .metrics import (
+    RequestTimings,
+    current_timings,
+    recorder,
+    server_timing,
+    view_label,
+)
+from .profiling import sampler, write_profile
+
+slow_requests = logging.getLogger("gr8tutor.slow_requests")
+
+
+class RequestIdMiddleware:
+    # Gives every request an id (the router's X-Request-ID when present)
+    # that logs.RequestIdFilter adds to each log record, and echoes it back
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = new_request_id(request.headers.get("X-Request-ID"))
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+
+class ActorMiddleware:
+    # Attaches request.actor (see actor.py); must come after
+    # AuthenticationMiddleware. Lazy, so pages that never check roles pay
+    # nothing.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.actor = SimpleLazyObject(lambda: resolve_actor(request))
+        return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    # Times each request (see metrics.py); goes first so the total covers
+    # the other middleware and the DB time includes session/auth queries
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings(getattr(settings, "SLOW_QUERY_THRESHOLD", None))
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total = time.perf_counter() - started
+
+        view = view_label(request)
+        recorder.observe(view, timings, total)
+        threshold = getattr(settings, "SLOW_REQUEST_THRESHOLD", None)
+        if threshold is not None and total >= threshold:
+            slow_requests.warning(
+                "Slow request %s %s (%.0f ms)", request.method, request.path,
+                total * 1000,
+                extra={"method": request.method, "path": request.path,
+                       "status": response.status_code,
+                       "duration_ms": round(total * 1000, 1),
+                       "db_ms": round(timings.db_time * 1000, 1),
+                       "queries": timings.queries,
+                       "template_ms": round(timings.template_time * 1000, 1)},
+            )
+        if getattr(settings, "SERVER_TIMING", True):
+            response["Server-Timing"] = server_timing(timings, total)
+        return response
+
+
+class ProfilingMiddleware:
+    # Samples the stacks of PROFILING_SAMPLE_RATE of requests, requests
+    # slower than PROFILING_SLOW_THRESHOLD seconds and requests sent with
+    # "X-Profile: <PROFILING_TOKEN>" (see profiling.py). Not loaded at all
+    # unless PROFILING_ENABLED or PROFILING_TOKEN is set.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "PROFILING_ENABLED", False)
+        self.token = getattr(settings, "PROFILING_TOKEN", "")
+        if not (self.enabled or self.token):
+            raise MiddlewareNotUsed()
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        self.threshold = getattr(settings, "PROFILING_SLOW_THRESHOLD", None)
+
+    def requested(self, request):
+        supplied = request.headers.get("X-Profile")
+        return bool(self.token and supplied
+                    and hmac.compare_digest(supplied.encode(),
+                                            self.token.encode()))
+
+    def __call__(self, request):
+        forced = self.requested(request)
+        sampled = self.enabled and random.random() < self.sample_rate
+        watching_slow = self.enabled and self.threshold is not None
+        if not (forced or sampled or watching_slow):
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        sampler.start(thread_id)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            stacks = sampler.stop(thread_id)
+
+        slow = watching_slow and elapsed >= self.threshold
+        if (forced or sampled or slow) and stacks:
+            name = write_profile(view_label(request), elapsed, stacks)
+            if forced:
+                response["X-Profile-File"] = name
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+def backfill_bio_excerpt(apps, schema_editor):
+    from gr8tutor.models import make_bio_excerpt
+
+    Tutor = apps.get_model('gr8tutor', 'Tutor')
+    batch = []
+    for tutor in Tutor.objects.only('id', 'bio').iterator(chunk_size=500):
+        tutor.bio_excerpt = make_bio_excerpt(tutor.bio)
+        batch.append(tutor)
+        if len(batch) >= 500:
+            Tutor.objects.bulk_update(batch, ['bio_excerpt'])
+            batch = []
+    if batch:
+        Tutor.objects.bulk_update(batch, ['bio_excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0006_alter_message_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tutor',
+            name='bio_excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_bio_excerpt, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+def install_full_text_index(apps, schema_editor):
+    from gr8tutor.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def remove_full_text_index(apps, schema_editor):
+    from gr8tutor.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0007_tutor_bio_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tutor',
+            index=models.Index(fields=['subject', 'hourly_rate', 'experience'], name='tutor_subject_rate_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tutor',
+            index=models.Index(fields=['hourly_rate', 'experience'], name='tutor_rate_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tutor',
+            index=models.Index(fields=['experience', 'hourly_rate'], name='tutor_exp_rate_idx'),
+        ),
+        migrations.RunPython(install_full_text_index, remove_full_text_index),
+    ]
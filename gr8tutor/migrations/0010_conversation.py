@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_conversations(apps, schema_editor):
+    from gr8tutor.management.commands.rebuild_conversations import rebuild
+    rebuild(apps.get_model('gr8tutor', 'Message'),
+            apps.get_model('gr8tutor', 'Conversation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0009_message_conversation_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_text', models.CharField(blank=True, max_length=255)),
+                ('last_message_time', models.DateTimeField(blank=True, null=True)),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('low_read_at', models.DateTimeField(blank=True, null=True)),
+                ('high_read_at', models.DateTimeField(blank=True, null=True)),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_message_time'],
+                'indexes': [models.Index(fields=['user_low', '-last_message_time'], name='conversation_low_time_idx'), models.Index(fields=['user_high', '-last_message_time'], name='conversation_high_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation_pair'), models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='conversation_pair_ordered')],
+            },
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
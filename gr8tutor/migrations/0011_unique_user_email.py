@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_emails(apps, schema_editor):
+    # Nothing enforced this before - stop with a list to fix by hand
+    # instead of failing half way through CREATE UNIQUE INDEX
+    User = apps.get_model("auth", "User")
+    duplicates = (
+        User.objects.using(schema_editor.connection.alias)
+        .exclude(email="")
+        .values("email")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("email")
+        .values_list("email", flat=True)
+    )
+    problems = []
+    for email in duplicates:
+        usernames = User.objects.using(schema_editor.connection.alias).filter(
+            email=email).order_by("id").values_list("username", flat=True)
+        problems.append(f"  {email}: {', '.join(usernames)}")
+    if problems:
+        raise RuntimeError(
+            "Cannot make user emails unique, these are shared by several "
+            "accounts. Change or clear the extra accounts' emails, then "
+            "migrate again:\n" + "\n".join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+    # Registration relies on this instead of an exists() pre-check.
+    # Partial so accounts created without an email (e.g. createsuperuser)
+    # are not affected.
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('gr8tutor', '0010_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX gr8tutor_user_email_uniq ON auth_user (email)"
+            " WHERE email <> ''",
+            "DROP INDEX gr8tutor_user_email_uniq",
+        ),
+    ]
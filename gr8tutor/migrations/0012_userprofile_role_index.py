@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0011_unique_user_email'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='role',
+            field=models.CharField(blank=True, choices=[('admin', 'Admin'), ('tutor', 'Tutor'), ('student', 'Student')], db_index=True, default='', max_length=10, null=True),
+        ),
+    ]
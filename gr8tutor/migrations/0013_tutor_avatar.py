@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0012_userprofile_role_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tutor',
+            name='avatar',
+            field=models.ImageField(blank=True, upload_to='avatars/originals/'),
+        ),
+        migrations.AddField(
+            model_name='tutor',
+            name='avatar_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='avatars/thumbs/'),
+        ),
+    ]
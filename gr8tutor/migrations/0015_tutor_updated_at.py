@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0014_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tutor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
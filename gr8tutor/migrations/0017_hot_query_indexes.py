@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gr8tutor', '0016_lesson_booking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='studenttutorrelationship',
+            options={'ordering': ['-is_active', 'id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='availability',
+            name='availability_tutor_day_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='conversation',
+            name='conversation_low_time_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='conversation',
+            name='conversation_high_time_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_conversation_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['tutor', 'weekday', 'start_time'], name='availability_tutor_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_low', '-last_message_time', '-id'], name='conversation_low_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_high', '-last_message_time', '-id'], name='conversation_high_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'recipient', 'time', 'id'], name='message_conversation_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studenttutorrelationship',
+            index=models.Index(fields=['tutor', '-is_active', 'id'], name='relationship_tutor_actv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studenttutorrelationship',
+            index=models.Index(fields=['student', '-is_active', 'id'], name='relationship_student_actv_idx'),
+        ),
+    ]
@@ -1,9 +1,18 @@
+from datetime import timedelta
 from decimal import Decimal
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from django.utils.text import Truncator
+
+# Number of words shown on a tutor card in the directory
+BIO_EXCERPT_WORDS = 20
+
+
+def make_bio_excerpt(bio):
+    return Truncator(Truncator(bio).words(BIO_EXCERPT_WORDS)).chars(255)
+
 
 # Create your models here.
 class UserProfile(models.Model):
@@ -15,7 +24,8 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     # Safe profile creation
     role = models.CharField(max_length=10, choices=ROLE_CHOICES,
-                            blank=True, null=True, default='')
+                            blank=True, null=True, default='',
+                            db_index=True)
     
     def unique_role(self, new_role):
         # Admin can be both tutor and student
@@ -38,6 +48,27 @@ class Tutor(models.Model):
                                       default=Decimal('0.00'))
     subject = models.CharField(max_length=255, blank=True)
     experience = models.IntegerField(default=0)
+    # Stored card excerpt so the directory never loads the full bio
+    bio_excerpt = models.CharField(max_length=255, blank=True,
+                                   editable=False)
+    # Uploaded photo, and the content-hashed WebP built from it in the
+    # background (see avatars.py) - only the thumbnail is ever served
+    avatar = models.ImageField(upload_to="avatars/originals/", blank=True)
+    avatar_thumbnail = models.ImageField(upload_to="avatars/thumbs/",
+                                         blank=True, editable=False)
+    # Lets each worker's recommendation index pull just the changed rows
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Range filters and subject facets on the tutors page
+        indexes = [
+            models.Index(fields=["subject", "hourly_rate", "experience"],
+                         name="tutor_subject_rate_exp_idx"),
+            models.Index(fields=["hourly_rate", "experience"],
+                         name="tutor_rate_exp_idx"),
+            models.Index(fields=["experience", "hourly_rate"],
+                         name="tutor_exp_rate_idx"),
+        ]
 
     def __str__(self):
         return self.user_profile.user.username
@@ -51,6 +82,13 @@ class Tutor(models.Model):
     
     def save(self, *args, **kwargs):
         self.user_profile.unique_role("tutor")
+        self.bio_excerpt = make_bio_excerpt(self.bio)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields) | {"updated_at"}
+            if "bio" in update_fields:
+                update_fields.add("bio_excerpt")
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
 
 class Student(models.Model):
@@ -71,12 +109,103 @@ class StudentTutorRelationship(models.Model):
 
     class Meta:
         unique_together = ('student', 'tutor')
-        ordering = ['-is_active', 'tutor__user_profile__user__username']
+        # Confirmed first, then in request order - straight off the indexes
+        # below (sorting by username meant joining and sorting every row)
+        ordering = ['-is_active', 'id']
+        indexes = [
+            models.Index(fields=["tutor", "-is_active", "id"],
+                         name="relationship_tutor_actv_idx"),
+            models.Index(fields=["student", "-is_active", "id"],
+                         name="relationship_student_actv_idx"),
+        ]
 
     def __str__(self):
         status = "Active" if self.is_active else "Pending"
         return f"{self.student} - {self.tutor} ({status})"
 
+# Lesson booking (see scheduling.py)
+MAX_LESSON_MINUTES = 180
+
+
+class Availability(models.Model):
+    # Weekly window a tutor takes lessons in, site time zone
+    WEEKDAY_CHOICES = [
+        (0, "Monday"), (1, "Tuesday"), (2, "Wednesday"), (3, "Thursday"),
+        (4, "Friday"), (5, "Saturday"), (6, "Sunday"),
+    ]
+
+    tutor = models.ForeignKey(Tutor, on_delete=models.CASCADE,
+                              related_name="availability")
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ["weekday", "start_time"]
+        constraints = [
+            models.CheckConstraint(condition=Q(end_time__gt=F("start_time")),
+                                   name="availability_ends_after_start"),
+        ]
+        indexes = [
+            models.Index(fields=["tutor", "weekday", "start_time"],
+                         name="availability_tutor_day_idx"),
+        ]
+
+    def __str__(self):
+        return (f"{self.tutor} {self.get_weekday_display()} "
+                f"{self.start_time:%H:%M}-{self.end_time:%H:%M}")
+
+
+class LessonSeries(models.Model):
+    # A weekly recurring booking, its lessons are created up front
+    tutor = models.ForeignKey(Tutor, on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.student} with {self.tutor} (weekly)"
+
+
+class Lesson(models.Model):
+    STATUS_CHOICES = [
+        ("booked", "Booked"),
+        ("cancelled", "Cancelled"),
+    ]
+
+    tutor = models.ForeignKey(Tutor, on_delete=models.CASCADE,
+                              related_name="lessons")
+    student = models.ForeignKey(Student, on_delete=models.CASCADE,
+                                related_name="lessons")
+    series = models.ForeignKey(LessonSeries, on_delete=models.CASCADE,
+                               null=True, blank=True, related_name="lessons")
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default="booked")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["start"]
+        constraints = [
+            # The length cap bounds every overlap query to a start range
+            models.CheckConstraint(
+                condition=Q(end__gt=F("start"))
+                & Q(end__lte=F("start")
+                    + timedelta(minutes=MAX_LESSON_MINUTES)),
+                name="lesson_length_valid",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["tutor", "start"],
+                         name="lesson_tutor_start_idx"),
+            models.Index(fields=["student", "start"],
+                         name="lesson_student_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.student} with {self.tutor} at {self.start:%Y-%m-%d %H:%M}"
+
+
 # Messaging between Tutor and Student
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -88,14 +217,176 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['-time']
+        # Conversation history, newest first - id breaks ties in the
+        # (time, id) cursors
+        indexes = [
+            models.Index(fields=["sender", "recipient", "time", "id"],
+                         name="message_conversation_time_idx"),
+        ]
 
     def __str__(self):
         return f"From {self.sender} to {self.recipient} at {self.time}"
+
+    def save(self, *args, **kwargs):
+        # The inbox row is updated in the same transaction as the insert
+        creating = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if creating:
+                Conversation.record_message(self)
+
+
+def conversation_messages(user_a, user_b):
+    # Both directions in one OR query. Planners don't split this into two
+    # range scans on message_conversation_time_idx, so the pair's rows are
+    # read and sorted (QueryPlanTests flags it) - pages that must stay fast
+    # use conversation_directions(). Fine for the admin export.
+    return Message.objects.filter(
+        models.Q(sender=user_a, recipient=user_b)
+        | models.Q(sender=user_b, recipient=user_a)
+    )
+
+
+def conversation_directions(user_a, user_b):
+    # The same messages as one queryset per direction, for the timeline
+    # helpers in pagination.py to merge in index order
+    return [Message.objects.filter(sender=user_a, recipient=user_b),
+            Message.objects.filter(sender=user_b, recipient=user_a)]
     
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    # Automatically create UserProfile when a new User is created
-    from .models import UserProfile
-    if created:
-        UserProfile.objects.create(user=instance)
-    
\ No newline at end of file
+# Denormalised inbox - one row per user pair, kept up to date by
+# Message.save(). user_low always holds the smaller user id.
+# Rebuild with: python manage.py rebuild_conversations
+class Conversation(models.Model):
+    PREVIEW_LENGTH = 120
+
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE,
+                                 related_name="+")
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE,
+                                  related_name="+")
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                    null=True, blank=True, related_name="+")
+    last_message_text = models.CharField(max_length=255, blank=True)
+    last_message_time = models.DateTimeField(null=True, blank=True)
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+    low_read_at = models.DateTimeField(null=True, blank=True)
+    high_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-last_message_time"]
+        constraints = [
+            models.UniqueConstraint(fields=["user_low", "user_high"],
+                                    name="unique_conversation_pair"),
+            models.CheckConstraint(condition=Q(user_low__lt=F("user_high")),
+                                   name="conversation_pair_ordered"),
+        ]
+        indexes = [
+            models.Index(fields=["user_low", "-last_message_time", "-id"],
+                         name="conversation_low_time_idx"),
+            models.Index(fields=["user_high", "-last_message_time", "-id"],
+                         name="conversation_high_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_low} & {self.user_high}"
+
+    @staticmethod
+    def side(user_id, other_id):
+        # "low"/"high" - which columns belong to user_id in this pair
+        return "low" if user_id < other_id else "high"
+
+    @classmethod
+    def for_user(cls, user):
+        return cls.objects.filter(Q(user_low=user) | Q(user_high=user))
+
+    @classmethod
+    def for_user_sides(cls, user):
+        # for_user() split by column, for merged newest-first paging
+        return [cls.objects.filter(user_low=user),
+                cls.objects.filter(user_high=user)]
+
+    @classmethod
+    def record_message(cls, message):
+        if message.sender_id == message.recipient_id:
+            return
+        low, high = sorted((message.sender_id, message.recipient_id))
+        sender_side = cls.side(message.sender_id, message.recipient_id)
+        recipient_side = "high" if sender_side == "low" else "low"
+        changes = {
+            "last_sender_id": message.sender_id,
+            "last_message_text": Truncator(message.text).chars(cls.PREVIEW_LENGTH),
+            "last_message_time": message.time,
+            # Replying means the sender has read the conversation
+            f"unread_{sender_side}": 0,
+            f"{sender_side}_read_at": message.time,
+        }
+        pair = cls.objects.filter(user_low_id=low, user_high_id=high)
+
+        unread = f"unread_{recipient_side}"
+        if pair.update(**changes, **{unread: F(unread) + 1}):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_low_id=low, user_high_id=high,
+                                   **changes, **{unread: 1})
+        except IntegrityError:
+            # Created concurrently by the other participant
+            pair.update(**changes, **{unread: F(unread) + 1})
+
+    @classmethod
+    def mark_read(cls, user, other_user_id, when):
+        side = cls.side(user.id, other_user_id)
+        low, high = sorted((user.id, other_user_id))
+        return cls.objects.filter(
+            user_low_id=low, user_high_id=high, **{f"unread_{side}__gt": 0}
+        ).update(**{f"unread_{side}": 0, f"{side}_read_at": when})
+
+    @classmethod
+    def unread_total(cls, user):
+        return cls.for_user(user).aggregate(
+            total=models.Sum(models.Case(
+                models.When(user_low=user, then="unread_low"),
+                default="unread_high",
+            ))
+        )["total"] or 0
+
+
+class Job(models.Model):
+    # Background work queue drained by "manage.py run_jobs" (see jobs.py)
+    # Finished jobs are deleted, failed ones kept for inspection
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("failed", "Failed"),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default="queued")
+    # Only one queued job per key - later enqueues coalesce into it
+    dedupe_key = models.CharField(max_length=150, null=True, blank=True)
+    run_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=Q(status="queued"),
+                name="job_unique_queued_dedupe_key",
+            ),
+        ]
+        indexes = [
+            # The worker's "what's due" scan
+            models.Index(fields=["status", "run_after"],
+                         name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,110 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+# Whole-page cache for public, mostly static views
+#
+# Entries live in the "pages" cache, whose KEY_PREFIX carries the deploy
+# version, so a release invalidates everything at once. invalidate_pages()
+# replaces a version token that is part of every key for invalidation
+# between releases. Keys also vary on auth state since the navbar differs.
+# A per-process locmem cache would keep serving pages other workers have
+# invalidated, so pages are only cached when the cache is shared.
+
+PAGES_VERSION_KEY = "pages-version"
+
+
+def page_cache():
+    return caches["pages" if "pages" in settings.CACHES else "default"]
+
+
+def page_cache_enabled():
+    # The file backend is shared by every worker on the machine
+    return (getattr(settings, "SHARED_CACHE", False)
+            or getattr(settings, "PAGE_CACHE_BACKEND", "locmem") == "file")
+
+
+def pages_version():
+    # A random token, not a counter: an evicted key starts a new version
+    # instead of reviving pages cached under an old one
+    cache = page_cache()
+    version = cache.get(PAGES_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(PAGES_VERSION_KEY, version, None):
+            version = cache.get(PAGES_VERSION_KEY, version)
+    return version
+
+
+def invalidate_pages():
+    version = uuid.uuid4().hex
+    page_cache().set(PAGES_VERSION_KEY, version, None)
+    return version
+
+
+def page_cache_key(request):
+    state = "auth" if request.user.is_authenticated else "anon"
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"page:{pages_version()}:{state}:{path}"
+
+
+def _cacheable(request, response):
+    # Anything carrying cookies or a fresh CSRF token is per-visitor
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def cache_public_page(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ("GET", "HEAD")
+                or not page_cache_enabled()):
+            return view(request, *args, **kwargs)
+
+        cache = page_cache()
+        key = page_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if not _cacheable(request, response):
+                return response
+            entry = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(
+                    hashlib.md5(response.content).hexdigest()),
+                "last_modified": int(time.time()),
+            }
+            cache.set(key, entry, getattr(settings, "PAGE_CACHE_TIMEOUT", 600))
+        else:
+            response = HttpResponse(entry["content"],
+                                    content_type=entry["content_type"])
+
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        # Browsers revalidate every time and get a bodyless 304 when unchanged
+        patch_cache_control(response, private=True, max_age=0,
+                            must_revalidate=True)
+        patch_vary_headers(response, ["Cookie"])
+        return get_conditional_response(
+            request,
+            etag=entry["etag"],
+            last_modified=entry["last_modified"],
+            response=response,
+        )
+    return wrapper
@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+
+from django.db.models import Q
+
+# Keyset (seek) pagination helpers
+#
+# Pages are addressed by the id of the last/first row shown instead of an
+# OFFSET, so every page is an indexed range scan no matter how deep it is.
+
+TIME_CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def parse_cursor(value):
+    # Cursors come from the query string - ignore anything that isn't an id
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.object_list[-1].pk
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.object_list[0].pk
+        return None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def keyset_page(queryset, after=None, before=None, size=20):
+    # Walk the queryset in ascending pk order, one extra row tells us
+    # whether another page exists in the direction we are moving
+    if before is not None:
+        rows = list(queryset.filter(pk__lt=before).order_by("-pk")[:size + 1])
+        has_previous = len(rows) > size
+        rows = rows[:size]
+        rows.reverse()
+        return KeysetPage(rows, has_next=True, has_previous=has_previous)
+
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+
+    rows = list(queryset.order_by("pk")[:size + 1])
+    has_next = len(rows) > size
+    return KeysetPage(rows[:size], has_next=has_next,
+                      has_previous=after is not None)
+
+
+# (time, id) cursors for timelines such as chat history - the id breaks
+# ties between rows saved in the same microsecond
+#
+# The timeline helpers also take a list of querysets, e.g. the two
+# directions of a conversation. Each part is read in index order and the
+# database merges them (UNION ALL), where an OR filter would collect every
+# matching row and sort them before applying the LIMIT.
+
+def encode_time_cursor(obj, field="time"):
+    moment = getattr(obj, field).astimezone(timezone.utc)
+    return f"{moment.strftime(TIME_CURSOR_FORMAT)}-{obj.pk}"
+
+
+def parse_time_cursor(value):
+    try:
+        moment, pk = value.split("-")
+        moment = datetime.strptime(moment, TIME_CURSOR_FORMAT)
+        pk = int(pk)
+    except (AttributeError, ValueError):
+        return None
+    return moment.replace(tzinfo=timezone.utc), pk
+
+
+def merged(parts, *ordering):
+    if not isinstance(parts, (list, tuple)):
+        return parts.order_by(*ordering)
+    first, *rest = [part.order_by() for part in parts]
+    return first.union(*rest, all=True).order_by(*ordering)
+
+
+def filter_parts(parts, condition):
+    if not isinstance(parts, (list, tuple)):
+        return parts.filter(condition)
+    return [part.filter(condition) for part in parts]
+
+
+def newest_first_page(queryset, before=None, size=50, field="time"):
+    # Newest rows older than the cursor, returned oldest -> newest so
+    # they can be rendered (or prepended) in reading order
+    if before is not None:
+        moment, pk = before
+        queryset = filter_parts(queryset, (
+            Q(**{f"{field}__lt": moment}) | Q(**{field: moment, "pk__lt": pk})
+        ))
+    rows = list(merged(queryset, f"-{field}", "-pk")[:size + 1])
+    has_previous = len(rows) > size
+    rows = rows[:size]
+    rows.reverse()
+    page = KeysetPage(rows, has_next=False, has_previous=has_previous)
+    page.older_cursor = (encode_time_cursor(rows[0], field)
+                         if has_previous else None)
+    return page
+
+
+def rows_after(queryset, after, size=50, field="time"):
+    # Oldest rows newer than the cursor, for catching up a client
+    moment, pk = after
+    rows = list(merged(
+        filter_parts(queryset, (
+            Q(**{f"{field}__gt": moment}) | Q(**{field: moment, "pk__gt": pk})
+        )), field, "pk"
+    )[:size + 1])
+    return rows[:size], len(rows) > size
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import StudentTutorRelationship
+
+# Relationship graph cache for chat authorisation
+#
+# Maps an (unordered) user pair to "has an active student/tutor
+# relationship", so the chat hot path is one cache get. Every
+# StudentTutorRelationship change deletes its pair's key (signals.py).
+# Revoking access has to reach every worker, so without
+# settings.SHARED_CACHE the permission is always read from the database.
+
+
+def chat_pair_key(user_a_id, user_b_id):
+    low, high = sorted((user_a_id, user_b_id))
+    return f"chat-pair:{low}:{high}"
+
+
+def _active_relationship_exists(user_a_id, user_b_id):
+    return StudentTutorRelationship.objects.filter(
+        Q(tutor__user_profile__user=user_a_id,
+          student__user_profile__user=user_b_id)
+        | Q(tutor__user_profile__user=user_b_id,
+            student__user_profile__user=user_a_id),
+        is_active=True,
+    ).exists()
+
+
+def users_connected(user_a_id, user_b_id):
+    if not getattr(settings, "SHARED_CACHE", False):
+        return _active_relationship_exists(user_a_id, user_b_id)
+    key = chat_pair_key(user_a_id, user_b_id)
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = _active_relationship_exists(user_a_id, user_b_id)
+        cache.set(key, allowed,
+                  getattr(settings, "CHAT_PERMISSION_CACHE_TIMEOUT", 300))
+    return allowed
+
+
+def can_chat(current_user, other_user_id):
+    if current_user.id == other_user_id:
+        return False
+    return current_user.is_staff or users_connected(current_user.id,
+                                                    other_user_id)
+
+
+def invalidate_chat_pair(relationship):
+    key = chat_pair_key(relationship.tutor.user_profile.user_id,
+                        relationship.student.user_profile.user_id)
+    cache.delete(key)
+    # Again after commit, in case a reader cached the old state meanwhile
+    transaction.on_commit(lambda: cache.delete(key))
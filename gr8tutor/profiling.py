@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+# Sampling profiler for slow requests
+#
+# While a request is watched, a background thread snapshots its stack
+# every PROFILING_INTERVAL seconds (sys._current_frames(), no tracing), so
+# the request runs at full speed and only the slow ones need to be kept:
+# ProfilingMiddleware decides afterwards whether to write the samples out.
+# Profiles are collapsed-stack files ("outer;inner count" per line, the
+# format flamegraph.pl and speedscope read) in PROFILING_DIR, one per
+# request, oldest deleted past PROFILING_MAX_FILES.
+#
+# Every worker writes to the same directory; "manage.py profile_report"
+# merges them.
+
+SUFFIX = ".collapsed"
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.watched = {}
+        self.thread = None
+
+    def start(self, thread_id):
+        with self.lock:
+            self.watched[thread_id] = Counter()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True,
+                                               name="profiling-sampler")
+                self.thread.start()
+        self.wake.set()
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.watched.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.watched:
+                    self.wake.clear()
+            self.wake.wait()
+            time.sleep(getattr(settings, "PROFILING_INTERVAL", 0.005))
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stacks in self.watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+
+
+sampler = Sampler()
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILING_DIR"))
+
+
+def write_profile(view, elapsed, stacks):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = (f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{view}-"
+            f"{round(elapsed * 1000)}ms{SUFFIX}")
+    temporary = directory / f".{name}.tmp"
+    temporary.write_text("".join(f"{stack} {count}\n"
+                                 for stack, count in stacks.items()))
+    # Readers never see a half-written profile
+    os.replace(temporary, directory / name)
+    rotate(directory)
+    return name
+
+
+def rotate(directory):
+    keep = getattr(settings, "PROFILING_MAX_FILES", 200)
+    profiles = sorted(directory.glob(f"*{SUFFIX}"),
+                      key=lambda path: path.stat().st_mtime)
+    for path in profiles[:-keep] if keep else profiles:
+        path.unlink(missing_ok=True)
+
+
+def read_profile(path):
+    stacks = Counter()
+    for line in path.read_text().splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+def view_of(path):
+    # <timestamp>-<pid>-<view>-<ms>ms.collapsed
+    return path.name.split("-", 2)[-1].rsplit("-", 1)[0]
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub fan-out for real-time chat
+#
+# Publishers are ordinary (sync) Django code, subscribers are async
+# streaming views running on the ASGI event loop. The backend is picked by
+# settings.CHAT_PUBSUB_BACKEND:
+#   - InProcessBroker: single process only (tests, runserver, one worker)
+#   - RedisBroker: shares events between gunicorn/uvicorn workers, the
+#     default when REDIS_URL is set
+# With several workers and no shared broker a stream would miss messages
+# posted through the other workers, so chat pages poll instead (see
+# live_updates_enabled()).
+
+
+def conversation_channel(user_a_id, user_b_id):
+    low, high = sorted((user_a_id, user_b_id))
+    return f"chat.{low}.{high}"
+
+
+class Subscription:
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class BaseBroker:
+    # Whether events published in one process reach subscribers in another
+    shared = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        # Must return an async context manager yielding a Subscription
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    # Subscriber queues live on their event loop, publish() may be called
+    # from any thread (sync views run in a worker thread under ASGI)
+
+    def __init__(self, max_queued=100, **options):
+        super().__init__(**options)
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def _deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer - it can catch up from the history endpoint
+            logger.warning("Dropping chat event for a slow subscriber.")
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # Event loop already closed
+                self._remove(channel, (loop, queue))
+
+    def _remove(self, channel, entry):
+        with self._lock:
+            entries = self._subscribers.get(channel)
+            if entries and entry in entries:
+                entries.remove(entry)
+                if not entries:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        entry = (asyncio.get_running_loop(),
+                 asyncio.Queue(maxsize=self.max_queued))
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(entry)
+        try:
+            yield Subscription(entry[1])
+        finally:
+            self._remove(channel, entry)
+
+
+class RedisBroker(BaseBroker):
+    # Needs the "redis" package and CHAT_PUBSUB_OPTIONS["url"]
+    shared = True
+
+    def __init__(self, url="redis://localhost:6379/0", **options):
+        super().__init__(**options)
+        self.url = url
+        self._client = None
+
+    def publish(self, channel, message):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(message))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        queue = asyncio.Queue()
+
+        async def reader():
+            async for item in pubsub.listen():
+                if item["type"] == "message":
+                    await queue.put(json.loads(item["data"]))
+
+        task = asyncio.create_task(reader())
+        try:
+            yield Subscription(queue)
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = import_string(getattr(
+                    settings, "CHAT_PUBSUB_BACKEND",
+                    "gr8tutor.pubsub.InProcessBroker",
+                ))
+                _broker = backend(**getattr(settings, "CHAT_PUBSUB_OPTIONS", {}))
+    return _broker
+
+
+def live_updates_enabled():
+    return (get_broker().shared
+            or getattr(settings, "WEB_CONCURRENCY", 1) <= 1)
+
+
+def publish_message(message):
+    get_broker().publish(
+        conversation_channel(message.sender_id, message.recipient_id),
+        {
+            "id": message.id,
+            "sender_id": message.sender_id,
+            "recipient_id": message.recipient_id,
+            "text": message.text,
+            "time": message.time.isoformat(),
+        },
+    )
@@ -0,0 +1,49 @@
+import re
+
+from django.db import connection
+
+# EXPLAIN-based checks for hot queries (see QueryPlanTests)
+#
+# A statement fails when its plan reads a whole table or sorts rows the
+# index should have delivered in order - on SQLite "SCAN <table>" and
+# "USE TEMP B-TREE", on PostgreSQL "Seq Scan" and "Sort" nodes. Tiny test
+# tables would make PostgreSQL prefer both anyway, so they are priced out
+# for the EXPLAIN: they only show up when no index can be used at all.
+
+SQLITE_PROBLEMS = re.compile(r"^SCAN (?!CONSTANT ROW|\(subquery)|TEMP B-TREE")
+POSTGRESQL_PROBLEMS = re.compile(r"Seq Scan on |(Incremental )?Sort  \(")
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+def analyze():
+    # Fresh statistics, so the planner sees the seeded row counts
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute("SET enable_seqscan = off; SET enable_sort = off")
+        try:
+            cursor.execute(f"EXPLAIN {sql}")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute("RESET enable_seqscan; RESET enable_sort")
+
+
+def plan_problems(statements):
+    # -> [(sql, plan lines)] for every statement with a bad plan;
+    # statements are the "sql" of CaptureQueriesContext entries
+    pattern = (SQLITE_PROBLEMS if connection.vendor == "sqlite"
+               else POSTGRESQL_PROBLEMS)
+    problems = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith(EXPLAINED):
+            continue
+        plan = explain(sql)
+        if any(pattern.search(line.strip()) for line in plan):
+            problems.append((sql, plan))
+    return problems
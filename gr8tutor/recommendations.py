@@ -0,0 +1,374 @@
+import math
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StudentTutorRelationship, Tutor
+
+# "Recommended for you" ranking of tutors against a student's goals
+#
+# Each process keeps a sparse matrix of sublinear term frequencies over
+# Tutor.subject/bio (one row per tutor). IDF weights and row norms are
+# applied at query time, so an edited tutor only replaces its own row:
+# edits go to a small overlay that is merged into the main matrix once it
+# grows. Ranking is a couple of sparse mat-vec products plus an
+# argpartition - no Python loop over tutors.
+#
+# Workers notice edits made elsewhere through a version that only Tutor
+# saves and deletes replace (signals.py), then pull the changed rows by
+# Tutor.updated_at. Deletions are appended to a numbered log in the cache,
+# so a sync removes exactly the tutors deleted since the last one. Edits
+# from other workers only arrive through a shared cache - without
+# settings.SHARED_CACHE they show up at the next periodic rebuild.
+
+TOKEN_RE = re.compile(r"[a-z]+")
+STOP_WORDS = frozenset(
+    "a about all also am an and any are as at be been but by can do for "
+    "from get have help i if in into is it me more my of on or our so "
+    "some than that the their them they this to up us was we what when "
+    "who will with would you your".split()
+)
+# A subject term counts like it appeared this many times in the bio
+SUBJECT_WEIGHT = 3
+# Up to +30% for the most experienced tutors
+EXPERIENCE_WEIGHT = 0.3
+# Fold the overlay into the matrix past this many edited rows
+MAX_OVERLAY_ROWS = 256
+
+
+def tokenize(text):
+    return [term for term in TOKEN_RE.findall((text or "").lower())
+            if len(term) > 1 and term not in STOP_WORDS]
+
+
+def term_counts(subject, bio):
+    counts = Counter(tokenize(bio))
+    for term in tokenize(subject):
+        counts[term] += SUBJECT_WEIGHT
+    return counts
+
+
+class TutorIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.vocabulary = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.n_docs = 0
+        # Main matrix, rows aligned with ids/experience/rate
+        self.tf = sparse.csr_matrix((0, 0))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.experience = np.zeros(0)
+        self.rate = np.zeros(0)
+        self.row_of = {}
+        # tutor id -> (columns, weights, experience, rate), None if removed
+        self.overlay = {}
+        self._cache = {}
+        self.version = None
+        self.synced_at = None
+        self.deletions_seen = 0
+        self.built = time.monotonic()
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        indptr, indices, data = [0], [], []
+        ids, experience, rate = [], [], []
+        for row in rows:
+            columns, weights = index._vectorize(row)
+            indices.append(columns)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(columns))
+            ids.append(row["id"])
+            experience.append(row["experience"])
+            rate.append(float(row["hourly_rate"]))
+
+        size = len(index.vocabulary)
+        indices = (np.concatenate(indices) if indices
+                   else np.zeros(0, dtype=np.int64))
+        index.tf = sparse.csr_matrix(
+            (np.concatenate(data) if data else np.zeros(0), indices, indptr),
+            shape=(len(ids), size),
+        )
+        index.df = np.bincount(indices, minlength=size)
+        index.n_docs = len(ids)
+        index.ids = np.array(ids, dtype=np.int64)
+        index.experience = np.array(experience, dtype=float)
+        index.rate = np.array(rate, dtype=float)
+        index.row_of = {tutor_id: row for row, tutor_id in enumerate(ids)}
+        return index
+
+    def _vectorize(self, row, grow=True):
+        columns, weights = [], []
+        for term, count in term_counts(row.get("subject", ""),
+                                       row.get("bio", "")).items():
+            column = self.vocabulary.get(term)
+            if column is None:
+                if not grow:
+                    continue
+                column = self.vocabulary[term] = len(self.vocabulary)
+            columns.append(column)
+            weights.append(1.0 + math.log(count))
+        return np.array(columns, dtype=np.int64), np.array(weights)
+
+    def _current_columns(self, tutor_id):
+        if tutor_id in self.overlay:
+            entry = self.overlay[tutor_id]
+            return None if entry is None else entry[0]
+        row = self.row_of.get(tutor_id)
+        if row is None:
+            return None
+        return self.tf.indices[self.tf.indptr[row]:self.tf.indptr[row + 1]]
+
+    def _forget(self, tutor_id):
+        columns = self._current_columns(tutor_id)
+        if columns is not None:
+            self.df[columns] -= 1
+            self.n_docs -= 1
+
+    def update(self, row):
+        with self.lock:
+            self._forget(row["id"])
+            columns, weights = self._vectorize(row)
+            if len(self.df) < len(self.vocabulary):
+                self.df = np.pad(self.df,
+                                 (0, len(self.vocabulary) - len(self.df)))
+            self.df[columns] += 1
+            self.n_docs += 1
+            self.overlay[row["id"]] = (columns, weights, row["experience"],
+                                       float(row["hourly_rate"]))
+            self._changed()
+
+    def remove(self, tutor_id):
+        with self.lock:
+            self._forget(tutor_id)
+            self.overlay[tutor_id] = None
+            self._changed()
+
+    def _changed(self):
+        self._cache = {}
+        if len(self.overlay) > MAX_OVERLAY_ROWS:
+            self.compact()
+
+    def _overlay_matrix(self):
+        live = [(tutor_id, entry) for tutor_id, entry in self.overlay.items()
+                if entry is not None]
+        lengths = [len(entry[0]) for _, entry in live]
+        matrix = sparse.csr_matrix(
+            (np.concatenate([entry[1] for _, entry in live] or [np.zeros(0)]),
+             np.concatenate([entry[0] for _, entry in live]
+                            or [np.zeros(0, dtype=np.int64)]),
+             np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))),
+            shape=(len(live), len(self.vocabulary)),
+        )
+        return (
+            matrix,
+            np.array([tutor_id for tutor_id, _ in live], dtype=np.int64),
+            np.array([entry[2] for _, entry in live], dtype=float),
+            np.array([entry[3] for _, entry in live], dtype=float),
+        )
+
+    def _replaced_rows(self):
+        return np.array([self.row_of[tutor_id] for tutor_id in self.overlay
+                         if tutor_id in self.row_of], dtype=np.int64)
+
+    def compact(self):
+        with self.lock:
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[self._replaced_rows()] = False
+            base = self.tf[keep]
+            base.resize((base.shape[0], len(self.vocabulary)))
+            matrix, ids, experience, rate = self._overlay_matrix()
+
+            self.tf = sparse.vstack([base, matrix], format="csr")
+            self.ids = np.concatenate([self.ids[keep], ids])
+            self.experience = np.concatenate([self.experience[keep],
+                                              experience])
+            self.rate = np.concatenate([self.rate[keep], rate])
+            self.row_of = {int(tutor_id): row
+                           for row, tutor_id in enumerate(self.ids)}
+            self.overlay = {}
+            self._cache = {}
+
+    def _snapshot(self):
+        # Everything rank() needs, rebuilt only after a change
+        if "snapshot" not in self._cache:
+            matrix, ids, experience, rate = self._overlay_matrix()
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[self._replaced_rows()] = False
+            idf = np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0
+            tf = self.tf
+            if tf.shape[1] < len(idf):
+                # Terms first seen in the overlay
+                tf = tf.copy()
+                tf.resize((tf.shape[0], len(idf)))
+            if matrix.shape[0]:
+                tf = sparse.vstack([tf, matrix], format="csr")
+            norms = np.sqrt(tf.multiply(tf) @ idf ** 2)
+            live = np.concatenate([keep, np.ones(len(ids), dtype=bool)])
+            experience = np.concatenate([self.experience, experience])
+            most = experience[live].max(initial=0)
+            self._cache["snapshot"] = {
+                "tf": tf,
+                "idf": idf,
+                "norms": np.where(live & (norms > 0), norms, np.inf),
+                "ids": np.concatenate([self.ids, ids]),
+                "boost": 1.0 + EXPERIENCE_WEIGHT * np.log1p(experience)
+                / math.log1p(max(most, 1)),
+                "rate": np.concatenate([self.rate, rate]),
+            }
+        return self._cache["snapshot"]
+
+    def rank(self, goals, limit=10, budget=None, exclude=()):
+        with self.lock:
+            columns, weights = self._vectorize({"bio": goals}, grow=False)
+            if not len(columns):
+                return []
+            snapshot = self._snapshot()
+
+        query = np.zeros(len(snapshot["idf"]))
+        query[columns] = weights * snapshot["idf"][columns]
+        scores = (snapshot["tf"] @ query) / snapshot["norms"]
+        scores /= np.linalg.norm(query)
+        scores *= snapshot["boost"]
+        if budget:
+            # Full marks within budget, decaying the further above it
+            rate = snapshot["rate"]
+            scores *= np.where(rate <= budget, 1.0,
+                               np.exp(-(rate - budget) / budget))
+        if exclude:
+            scores[np.isin(snapshot["ids"], list(exclude))] = 0
+
+        matches = np.count_nonzero(scores > 0)
+        limit = min(limit, matches)
+        if not limit:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(snapshot["ids"][i]), float(scores[i])) for i in top]
+
+
+# Process-wide index, built on first use
+
+_index = None
+_index_lock = threading.Lock()
+
+TUTOR_FIELDS = ("id", "subject", "bio", "experience", "hourly_rate")
+# Rows saved just before a sync may commit just after it
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def _tutor_rows(queryset):
+    return queryset.values(*TUTOR_FIELDS).iterator(chunk_size=2000)
+
+
+VERSION_KEY = "tutor-index-version"
+DELETIONS_KEY = "tutor-index-deletions"
+DELETION_KEY = "tutor-index-deletion:{}"
+
+
+def rebuild_interval():
+    return getattr(settings, "RECOMMENDATION_REBUILD_INTERVAL", 3600)
+
+
+def index_version():
+    # A random token, not a counter: an evicted key starts a new version
+    # instead of matching an index synced under an old one
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def invalidate_index():
+    def bump():
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    bump()
+    # Again after commit, in case a reader synced the old rows meanwhile
+    transaction.on_commit(bump)
+
+
+def record_deletion(tutor_id):
+    def log():
+        try:
+            number = cache.incr(DELETIONS_KEY)
+        except ValueError:
+            cache.add(DELETIONS_KEY, 0, None)
+            number = cache.incr(DELETIONS_KEY)
+        # Older entries are covered by the periodic rebuild
+        cache.set(DELETION_KEY.format(number), tutor_id,
+                  rebuild_interval() * 2)
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    transaction.on_commit(log)
+
+
+def _build(version):
+    started = timezone.now()
+    deletions = cache.get(DELETIONS_KEY, 0)
+    index = TutorIndex.build(_tutor_rows(Tutor.objects.order_by("id")))
+    index.synced_at, index.version = started, version
+    index.deletions_seen = deletions
+    return index
+
+
+def _sync(index, version):
+    # False when the deletion log can't be followed - rebuild instead
+    started = timezone.now()
+    deletions = cache.get(DELETIONS_KEY, 0)
+    if deletions < index.deletions_seen:
+        return False
+    keys = [DELETION_KEY.format(number)
+            for number in range(index.deletions_seen + 1, deletions + 1)]
+    deleted = cache.get_many(keys)
+    if len(deleted) < len(keys):
+        return False
+
+    changed = Tutor.objects.filter(
+        updated_at__gte=index.synced_at - SYNC_OVERLAP)
+    for row in _tutor_rows(changed):
+        index.update(row)
+    for tutor_id in deleted.values():
+        index.remove(tutor_id)
+    index.synced_at, index.version = started, version
+    index.deletions_seen = deletions
+    return True
+
+
+def get_index():
+    global _index
+    version = index_version()
+    with _index_lock:
+        if (_index is None
+                or time.monotonic() - _index.built > rebuild_interval()
+                or (_index.version != version and not _sync(_index, version))):
+            _index = _build(version)
+        return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def recommend_tutors(student, limit=10, budget=None):
+    # [(tutor id, score)] best first, empty when the goals match nothing
+    if not student.goals:
+        return []
+    # Don't recommend tutors the student already has or has asked for
+    exclude = set(StudentTutorRelationship.objects.filter(student=student)
+                  .values_list("tutor_id", flat=True))
+    return get_index().rank(student.goals, limit=limit, budget=budget,
+                            exclude=exclude)
@@ -0,0 +1,270 @@
+import threading
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    MAX_LESSON_MINUTES,
+    Availability,
+    Lesson,
+    LessonSeries,
+    Student,
+    StudentTutorRelationship,
+    Tutor,
+)
+
+# Lesson booking
+#
+# Free-slot and conflict questions are answered from an IntervalIndex: the
+# merged busy intervals of one tutor (or student) over the window asked
+# about. Lessons are capped at MAX_LESSON_MINUTES, so the rows that can
+# touch a window are found with a range scan on the (tutor, start) index -
+# a tutor's past lessons are never read. Indexes are kept per process and
+# dropped when a booking or cancellation replaces the owner's version.
+# Other workers' bookings only show up through a shared cache, so without
+# settings.SHARED_CACHE every index is read from the database.
+#
+# The index only serves reads; book_lesson() locks the tutor and student
+# rows and re-checks against the database before inserting.
+
+LESSON_DURATIONS = (30, 60, 90)
+SLOT_STEP = timedelta(minutes=30)
+MAX_LESSON = timedelta(minutes=MAX_LESSON_MINUTES)
+MAX_SLOT_DAYS = 62
+MAX_SERIES_WEEKS = 26
+
+VERSION_KEY = "schedule-version:{}:{}"
+MAX_CACHED_INDEXES = 512
+
+
+class BookingError(Exception):
+    pass
+
+
+class IntervalIndex:
+    def __init__(self, intervals):
+        # Merge into disjoint, sorted intervals: both lists are then
+        # sorted and overlap tests are a single bisect
+        self.starts, self.ends = [], []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        # First interval ending after start is the only candidate
+        i = bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def busy_between(self, start, end):
+        i = bisect_right(self.ends, start)
+        busy = []
+        while i < len(self.starts) and self.starts[i] < end:
+            busy.append((max(self.starts[i], start), min(self.ends[i], end)))
+            i += 1
+        return busy
+
+
+def touching(queryset, start, end):
+    # Booked lessons overlapping [start, end); the lower bound on start
+    # keeps this a range scan on the (owner, start) index
+    return queryset.filter(status="booked", start__lt=end,
+                           start__gt=start - MAX_LESSON, end__gt=start)
+
+
+def _version_key(kind, owner_id):
+    return VERSION_KEY.format(kind, owner_id)
+
+
+def schedule_versions(*owners):
+    # Random tokens, not counters: an evicted key starts a new version
+    # instead of matching an index built under an old one
+    keys = [_version_key(kind, owner_id) for kind, owner_id in owners]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            found[key] = version
+    return [found[key] for key in keys]
+
+
+def invalidate_schedule(tutor_id, student_id):
+    def bump():
+        cache.set_many({
+            _version_key("tutor", tutor_id): uuid.uuid4().hex,
+            _version_key("student", student_id): uuid.uuid4().hex,
+        }, None)
+    transaction.on_commit(bump)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def busy_index(kind, owner_id, start, end, version):
+    # An index covering the window, from this process if still current
+    key = (kind, owner_id)
+    shared = getattr(settings, "SHARED_CACHE", False)
+    with _indexes_lock:
+        cached = _indexes.get(key) if shared else None
+        if cached is not None:
+            cached_version, covered_start, covered_end, index = cached
+            if (cached_version == version and covered_start <= start
+                    and end <= covered_end):
+                _indexes.move_to_end(key)
+                return index
+
+    lessons = touching(Lesson.objects.filter(**{f"{kind}_id": owner_id}),
+                       start, end)
+    index = IntervalIndex(lessons.values_list("start", "end"))
+    if not shared:
+        return index
+    with _indexes_lock:
+        _indexes[key] = (version, start, end, index)
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def reset_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def local_datetime(day, time):
+    return timezone.make_aware(datetime.combine(day, time))
+
+
+def free_slots(tutor, start_date, days, duration, student=None):
+    # [(start, end)] bookable with tutor (and free for student) over days
+    days = min(days, MAX_SLOT_DAYS)
+    length = timedelta(minutes=duration)
+    window_start = local_datetime(start_date, datetime.min.time())
+    window_end = local_datetime(start_date + timedelta(days=days),
+                                datetime.min.time())
+
+    windows = {}
+    for availability in Availability.objects.filter(tutor=tutor):
+        windows.setdefault(availability.weekday, []).append(availability)
+    if not windows:
+        return []
+
+    owners = [("tutor", tutor.id)]
+    if student is not None:
+        owners.append(("student", student.id))
+    indexes = [busy_index(kind, owner_id, window_start, window_end, version)
+               for (kind, owner_id), version
+               in zip(owners, schedule_versions(*owners))]
+
+    now = timezone.now()
+    slots = []
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        for availability in windows.get(day.weekday(), ()):
+            start = local_datetime(day, availability.start_time)
+            last = local_datetime(day, availability.end_time) - length
+            while start <= last:
+                end = start + length
+                if start > now and not any(index.overlaps(start, end)
+                                           for index in indexes):
+                    slots.append((start, end))
+                start += SLOT_STEP
+    slots.sort()
+    return slots
+
+
+def _check_available(tutor, start, end):
+    # Inside one of the tutor's weekly windows, as free_slots() offers
+    local_start = timezone.localtime(start)
+    local_end = timezone.localtime(end)
+    if local_end.date() != local_start.date() or not Availability.objects.filter(
+        tutor=tutor,
+        weekday=local_start.weekday(),
+        start_time__lte=local_start.time(),
+        end_time__gte=local_end.time(),
+    ).exists():
+        raise BookingError("The tutor isn't available at that time.")
+
+
+def _book(tutor, student, starts, duration, series=None):
+    if duration not in LESSON_DURATIONS:
+        raise BookingError("Choose a lesson length of 30, 60 or 90 minutes.")
+    if not StudentTutorRelationship.objects.filter(
+        tutor=tutor, student=student, is_active=True
+    ).exists():
+        raise BookingError("Lessons can only be booked with a confirmed tutor.")
+
+    length = timedelta(minutes=duration)
+    now = timezone.now()
+    for start in starts:
+        if start <= now:
+            raise BookingError("That time has already passed.")
+        _check_available(tutor, start, start + length)
+
+    # Serialises bookings per tutor and per student, so the checks below
+    # can't race another booking into the same time
+    list(Tutor.objects.select_for_update().filter(pk=tutor.pk).values("pk"))
+    list(Student.objects.select_for_update().filter(pk=student.pk).values("pk"))
+
+    for start in starts:
+        end = start + length
+        if touching(Lesson.objects.filter(tutor=tutor), start, end).exists():
+            raise BookingError(
+                f"The tutor is already booked at {timezone.localtime(start):%a %d %b %H:%M}.")
+        if touching(Lesson.objects.filter(student=student), start, end).exists():
+            raise BookingError(
+                f"You already have a lesson at {timezone.localtime(start):%a %d %b %H:%M}.")
+
+    lessons = Lesson.objects.bulk_create([
+        Lesson(tutor=tutor, student=student, series=series,
+               start=start, end=start + length)
+        for start in starts
+    ])
+    invalidate_schedule(tutor.id, student.id)
+    return lessons
+
+
+def book_lesson(tutor, student, start, duration):
+    with transaction.atomic():
+        return _book(tutor, student, [start], duration)[0]
+
+
+def book_series(tutor, student, start, duration, weeks):
+    # All of the weekly lessons or none of them
+    if not 1 <= weeks <= MAX_SERIES_WEEKS:
+        raise BookingError(f"A series can run for 1 to {MAX_SERIES_WEEKS} weeks.")
+    local_start = timezone.localtime(start)
+    # Same wall-clock time each week, across DST changes
+    starts = [
+        timezone.make_aware(local_start.replace(tzinfo=None)
+                            + timedelta(weeks=week))
+        for week in range(weeks)
+    ]
+    with transaction.atomic():
+        series = LessonSeries.objects.create(tutor=tutor, student=student)
+        _book(tutor, student, starts, duration, series=series)
+    return series
+
+
+def cancel_lesson(lesson):
+    # True if the lesson was still booked
+    cancelled = Lesson.objects.filter(pk=lesson.pk, status="booked").update(
+        status="cancelled")
+    if cancelled:
+        lesson.status = "cancelled"
+        invalidate_schedule(lesson.tutor_id, lesson.student_id)
+    return bool(cancelled)
@@ -0,0 +1,206 @@
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import OperationalError, connection
+from django.db.models import BooleanField, Count, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over Tutor.subject and Tutor.bio
+#
+# SQLite (local) keeps an FTS5 external-content table in sync with triggers,
+# Postgres (production) uses a GIN index over a tsvector expression. The
+# expression in POSTGRES_TSVECTOR must stay identical to the indexed one or
+# the planner will not use the index.
+
+FTS_TABLE = "gr8tutor_tutor_fts"
+POSTGRES_INDEX = "gr8tutor_tutor_search_gin"
+POSTGRES_TSVECTOR = (
+    "to_tsvector('english', coalesce(\"gr8tutor_tutor\".\"subject\", '')"
+    " || ' ' || coalesce(\"gr8tutor_tutor\".\"bio\", ''))"
+)
+
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        subject, bio, content='gr8tutor_tutor', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON gr8tutor_tutor BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, subject, bio)
+        VALUES (new.id, new.subject, new.bio);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON gr8tutor_tutor BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, bio)
+        VALUES ('delete', old.id, old.subject, old.bio);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON gr8tutor_tutor BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, subject, bio)
+        VALUES ('delete', old.id, old.subject, old.bio);
+        INSERT INTO {FTS_TABLE}(rowid, subject, bio)
+        VALUES (new.id, new.subject, new.bio);
+    END""",
+]
+
+FILTER_PARAMS = ("q", "subject", "min_rate", "max_rate",
+                 "min_experience", "max_experience")
+
+
+def install_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            try:
+                for statement in SQLITE_FTS_SQL:
+                    cursor.execute(statement)
+            except OperationalError:
+                logger.warning("SQLite FTS5 unavailable, tutor search will "
+                               "fall back to substring matching.")
+                return
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+            _fts_ready.pop(conn.alias, None)
+        elif conn.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON gr8tutor_tutor"
+                f" USING GIN ({POSTGRES_TSVECTOR})"
+            )
+
+
+def repair_search_index(conn):
+    # SQLite rebuilds a table to alter it, which silently drops its
+    # triggers - put them back (and resync) after every migrate
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s",
+                       [f"{FTS_TABLE}%"])
+        names = {row[0] for row in cursor.fetchall()}
+    triggers = {f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"}
+    if FTS_TABLE in names and not triggers <= names:
+        install_search_index(conn)
+
+
+def uninstall_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+            _fts_ready.pop(conn.alias, None)
+        elif conn.vendor == "postgresql":
+            cursor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
+
+
+# connection alias -> whether the FTS5 table exists, looked up once
+_fts_ready = {}
+
+
+def _fts_available():
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor != "sqlite":
+        return False
+    if connection.alias not in _fts_ready:
+        _fts_ready[connection.alias] = FTS_TABLE in (
+            connection.introspection.table_names(include_views=True))
+    return _fts_ready[connection.alias]
+
+
+def _fts5_query(text):
+    # Quote every term so user input can't break FTS5 query syntax,
+    # trailing * gives prefix matching ("gram" finds "grammar")
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms if term)
+
+
+def _parse_decimal(value):
+    try:
+        number = Decimal(value) if value not in (None, "") else None
+    except InvalidOperation:
+        return None
+    return number if number is not None and number.is_finite() else None
+
+
+def _parse_int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def parse_filters(params):
+    return {
+        "q": params.get("q", "").strip(),
+        "subject": params.get("subject", "").strip(),
+        "min_rate": _parse_decimal(params.get("min_rate")),
+        "max_rate": _parse_decimal(params.get("max_rate")),
+        "min_experience": _parse_int(params.get("min_experience")),
+        "max_experience": _parse_int(params.get("max_experience")),
+    }
+
+
+def has_filters(filters):
+    return any(value not in (None, "") for value in filters.values())
+
+
+def search_text(queryset, text):
+    if not text:
+        return queryset
+
+    if _fts_available():
+        if connection.vendor == "postgresql":
+            return queryset.filter(RawSQL(
+                f"{POSTGRES_TSVECTOR} @@ websearch_to_tsquery('english', %s)",
+                [text], output_field=BooleanField(),
+            ))
+        match = _fts5_query(text)
+        if not match:
+            return queryset
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [match],
+        ))
+
+    # No full-text index on this backend
+    for term in text.split():
+        queryset = queryset.filter(
+            Q(bio__icontains=term) | Q(subject__icontains=term))
+    return queryset
+
+
+def filter_tutors(queryset, filters, include_subject=True):
+    queryset = search_text(queryset, filters["q"])
+
+    if include_subject and filters["subject"]:
+        if filters["subject"] == "General":
+            queryset = queryset.filter(subject="")
+        else:
+            queryset = queryset.filter(subject=filters["subject"])
+    if filters["min_rate"] is not None:
+        queryset = queryset.filter(hourly_rate__gte=filters["min_rate"])
+    if filters["max_rate"] is not None:
+        queryset = queryset.filter(hourly_rate__lte=filters["max_rate"])
+    if filters["min_experience"] is not None:
+        queryset = queryset.filter(experience__gte=filters["min_experience"])
+    if filters["max_experience"] is not None:
+        queryset = queryset.filter(experience__lte=filters["max_experience"])
+    return queryset
+
+
+def subject_facets(queryset, filters):
+    # Counts ignore the selected subject so the other facets stay usable
+    rows = (
+        filter_tutors(queryset, filters, include_subject=False)
+        .order_by()
+        .values("subject")
+        .annotate(count=Count("id"))
+        .order_by("subject")
+    )
+    return [
+        {
+            "subject": row["subject"] or "General",
+            "count": row["count"],
+            "selected": (row["subject"] or "General") == filters["subject"],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,165 @@
+import random
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import (
+    Conversation,
+    Message,
+    Student,
+    Tutor,
+    UserProfile,
+    make_bio_excerpt,
+)
+
+# Synthetic data for scale testing ("manage.py seed_scale", benchmarks.py)
+#
+# Everything is written with bulk_create, so model save() methods and
+# signals don't run: bio excerpts and the Conversation inbox rows are filled
+# in here instead. Skew is what makes the data realistic - tutors are
+# picked with Zipf-like weights (a handful end up with huge rosters) and
+# conversation lengths follow a Pareto distribution.
+
+SUBJECTS = ["IELTS", "Business English", "Grammar", "Conversation",
+            "Pronunciation", "Kids", "TOEFL", "Cambridge Exams"]
+WORDS = ("exam speaking writing grammar meetings emails presentations "
+         "vocabulary pronunciation travel interviews fluency listening "
+         "reading games songs accent idioms confidence homework lesson "
+         "tomorrow thanks great practice question answer").split()
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+@contextmanager
+def keep_message_times():
+    # Message.time is auto_now_add, which bulk_create would apply to every
+    # row; seeded history needs its own timestamps
+    field = Message._meta.get_field("time")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def fast_sqlite_writes():
+    # Synthetic data isn't worth an fsync per transaction (SQLite only lets
+    # this change outside a transaction)
+    if connection.vendor == "sqlite" and not connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous = OFF")
+
+
+def create_users(prefix, count, role, password, batch_size=2000):
+    # -> (users, profiles); password is an already hashed value
+    users = User.objects.bulk_create([
+        User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com",
+             password=password)
+        for i in range(count)
+    ], batch_size=batch_size)
+    profiles = UserProfile.objects.bulk_create([
+        UserProfile(user=user, role=role) for user in users
+    ], batch_size=batch_size)
+    return users, profiles
+
+
+def create_tutors(profiles, rng, batch_size=2000):
+    tutors = []
+    for profile in profiles:
+        bio = sentence(rng, 20, 60)
+        tutors.append(Tutor(
+            user_profile=profile, subject=rng.choice(SUBJECTS), bio=bio,
+            bio_excerpt=make_bio_excerpt(bio),
+            hourly_rate=rng.randint(15, 90), experience=rng.randint(0, 25),
+        ))
+    return Tutor.objects.bulk_create(tutors, batch_size=batch_size)
+
+
+def create_students(profiles, rng, batch_size=2000):
+    return Student.objects.bulk_create([
+        Student(user_profile=profile, goals=sentence(rng, 4, 12))
+        for profile in profiles
+    ], batch_size=batch_size)
+
+
+def zipf_picker(items, rng, exponent=1.1):
+    # rank r is picked with weight 1 / r^exponent
+    cumulative = list(accumulate(1 / (rank + 1) ** exponent
+                                 for rank in range(len(items))))
+    total = cumulative[-1]
+
+    def pick():
+        return items[bisect_left(cumulative, rng.random() * total)]
+    return pick
+
+
+def conversation_lengths(pairs, total, rng, alpha=1.2):
+    # Pareto-distributed lengths summing to exactly total messages
+    if total <= 0 or not pairs:
+        return []
+    pairs = pairs[:total]
+    raw = [rng.paretovariate(alpha) for _ in pairs]
+    scale = total / sum(raw)
+    lengths = [max(1, int(value * scale)) for value in raw]
+    # Rounding goes to (or comes from) the longest conversations
+    order = sorted(range(len(lengths)), key=lengths.__getitem__, reverse=True)
+    remainder = total - sum(lengths)
+    for index in order:
+        if not remainder:
+            break
+        change = remainder if remainder > 0 else max(remainder,
+                                                     1 - lengths[index])
+        lengths[index] += change
+        remainder -= change
+    return list(zip(pairs, lengths))
+
+
+def insert_conversations(conversations, days, seed, batch_size=5000):
+    # conversations: [((tutor_user_id, student_user_id), length)]
+    # Messages plus their inbox rows, all read; returns messages written
+    rng = random.Random(seed)
+    now = timezone.now()
+    fast_sqlite_writes()
+    messages, inbox, written = [], [], 0
+
+    def flush():
+        with transaction.atomic():
+            Message.objects.bulk_create(messages, batch_size=batch_size)
+            Conversation.objects.bulk_create(inbox, batch_size=batch_size)
+        messages.clear()
+        inbox.clear()
+
+    with keep_message_times():
+        for (tutor_user_id, student_user_id), length in conversations:
+            start = now - timedelta(days=rng.uniform(0, days))
+            step = (now - start) / length
+            for k in range(length):
+                sender, recipient = ((tutor_user_id, student_user_id)
+                                     if rng.random() < 0.5
+                                     else (student_user_id, tutor_user_id))
+                message = Message(sender_id=sender, recipient_id=recipient,
+                                  text=sentence(rng, 3, 20),
+                                  time=start + step * (k + rng.random()))
+                messages.append(message)
+            low, high = sorted((tutor_user_id, student_user_id))
+            inbox.append(Conversation(
+                user_low_id=low, user_high_id=high,
+                last_sender_id=message.sender_id,
+                last_message_text=Truncator(message.text).chars(
+                    Conversation.PREVIEW_LENGTH),
+                last_message_time=message.time,
+                low_read_at=message.time, high_read_at=message.time,
+            ))
+            written += length
+            if len(messages) >= batch_size * 4:
+                flush()
+        flush()
+    return written
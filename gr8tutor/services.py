@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .models import Student, Tutor
+
+# User / profile lifecycle
+#
+# Uniqueness is left to the database (auth_user.username and the partial
+# unique index on auth_user.email), so a successful registration is three
+# INSERTs in one transaction with no pre-checks.
+
+
+class RegistrationError(Exception):
+    pass
+
+
+def register_user(username, email, password, role):
+    user = User(username=username, email=email)
+    user.set_password(password)
+    # Picked up by the create_user_profile signal
+    user._initial_role = role
+
+    try:
+        with transaction.atomic():
+            user.save()
+            profile = user.userprofile
+            if role == "tutor":
+                Tutor.objects.create(user_profile=profile)
+            else:
+                Student.objects.create(user_profile=profile)
+    except IntegrityError:
+        # Only the failure path pays for working out which field clashed
+        if User.objects.filter(username=username).exists():
+            raise RegistrationError("Username already exists.")
+        if User.objects.filter(email=email).exists():
+            raise RegistrationError("Email already exists.")
+        raise
+    return user
+
+
+def set_role(profile, role):
+    # No write when the role is unchanged
+    if profile.role == role:
+        return False
+    profile.role = role
+    profile.save(update_fields=["role"])
+    return True
@@ -1,15 +1,104 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.db import connections, transaction
+from .models import Lesson, Message, Student, StudentTutorRelationship, Tutor, UserProfile
+from . import (actor, avatars, directory, permissions, pubsub,
+               recommendations, scheduling, search, tasks)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        # Create a UserProfile whenever a new User is created
-        UserProfile.objects.get_or_create(user=instance)
+        # Create a UserProfile whenever a new User is created - the
+        # registration service passes the role along so it's one INSERT
+        UserProfile.objects.create(
+            user=instance, role=getattr(instance, "_initial_role", "")
+        )
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    # Fan out to live chat streams once the row is visible to readers
+    if created:
+        transaction.on_commit(lambda: pubsub.publish_message(instance),
+                              robust=True)
+
+
+@receiver(post_save, sender=Message)
+def queue_message_digest(sender, instance, created, **kwargs):
+    # After commit: a rolled-back message must not leave the pending flag
+    # blocking digests while no job exists
+    if created and instance.sender_id != instance.recipient_id:
+        recipient_id = instance.recipient_id
+        transaction.on_commit(
+            lambda: tasks.enqueue_message_digest(recipient_id), robust=True)
+
+@receiver(post_save, sender=StudentTutorRelationship)
+@receiver(post_delete, sender=StudentTutorRelationship)
+def invalidate_chat_permission(sender, instance, **kwargs):
+    # Request, confirm and delete all change who may chat with whom
+    permissions.invalidate_chat_pair(instance)
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_actor_for_profile(sender, instance, **kwargs):
+    actor.invalidate_actor(instance.user_id)
+
+
+@receiver(post_save, sender=Tutor)
+@receiver(post_delete, sender=Tutor)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_actor_for_role(sender, instance, **kwargs):
+    if sender.user_profile.is_cached(instance):
+        user_id = instance.user_profile.user_id
+    else:
+        user_id = (UserProfile.objects.filter(pk=instance.user_profile_id)
+                   .values_list("user_id", flat=True).first())
+    if user_id is not None:
+        actor.invalidate_actor(user_id)
+
+@receiver(post_save, sender=Tutor)
+@receiver(post_delete, sender=Tutor)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=User)
+def invalidate_tutor_directory(sender, instance, **kwargs):
+    directory.invalidate_directory()
+
+
+@receiver(post_save, sender=Tutor)
+def invalidate_recommendation_index(sender, instance, **kwargs):
+    recommendations.invalidate_index()
+
+
+@receiver(post_delete, sender=Tutor)
+def forget_recommended_tutor(sender, instance, **kwargs):
+    recommendations.record_deletion(instance.id)
+
+
+@receiver(post_delete, sender=Tutor)
+def delete_tutor_avatar(sender, instance, **kwargs):
+    if instance.avatar:
+        instance.avatar.storage.delete(instance.avatar.name)
+    avatars.delete_unused_thumbnail(instance.avatar_thumbnail.name)
+
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    # Ensure profile always saves when User is saved
-    instance.userprofile.save()
+def invalidate_tutor_directory_for_user(sender, instance, update_fields=None,
+                                        **kwargs):
+    # Every login saves last_login - that never shows in the directory
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    directory.invalidate_directory()
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_schedule(sender, instance, **kwargs):
+    # Admin edits; the booking services use bulk writes and bump it themselves
+    scheduling.invalidate_schedule(instance.tutor_id, instance.student_id)
+
+# Connected in Gr8TutorConfig.ready() - keeps the SQLite FTS triggers alive
+def repair_search_index(sender, using, **kwargs):
+    search.repair_search_index(connections[using])
@@ -72,6 +72,172 @@ document.addEventListener("DOMContentLoaded", function () {
     chatMessages.scrollTop = chatMessages.scrollHeight;
   }
 
+  /* Build a chat message row (same markup as chat.html) */
+  function buildChatMessage(msg) {
+    const wrapper = document.createElement("div");
+    const bubble = document.createElement("div");
+    const meta = document.createElement("div");
+    const time = new Date(msg.time);
+
+    bubble.className = "message-bubble " + (msg.sent ? "sent" : "received");
+    bubble.textContent = msg.text;
+    meta.className = "message-meta" + (msg.sent ? " text-end" : "");
+    meta.textContent =
+      String(time.getHours()).padStart(2, "0") + ":" +
+      String(time.getMinutes()).padStart(2, "0");
+
+    wrapper.dataset.messageId = msg.id;
+    wrapper.appendChild(bubble);
+    wrapper.appendChild(meta);
+    return wrapper;
+  }
+
+  /* Append a chat message unless it is already on the page */
+  function appendChatMessage(msg) {
+    if (chatMessages.querySelector('[data-message-id="' + msg.id + '"]')) {
+      return;
+    }
+    const empty = chatMessages.querySelector("p.text-muted");
+    if (empty) {
+      empty.remove();
+    }
+    chatMessages.appendChild(buildChatMessage(msg));
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+  }
+
+  /* Polling fallback - only fetches messages after the latest cursor */
+  let chatPolling = null;
+
+  function pollChatUpdates() {
+    const cursor = chatMessages.dataset.latestCursor;
+    const headers = cursor ? { "If-None-Match": '"' + cursor + '"' } : {};
+
+    fetch(chatMessages.dataset.updatesUrl, { credentials: "same-origin", headers: headers })
+      .then(function (response) {
+        return response.status === 200 ? response.json() : null;
+      })
+      .then(function (data) {
+        if (!data) {
+          return;
+        }
+        data.messages.forEach(appendChatMessage);
+        if (data.cursor) {
+          chatMessages.dataset.latestCursor = data.cursor;
+        }
+        if (data.has_more) {
+          pollChatUpdates();
+        }
+      })
+      .catch(function () {});
+  }
+
+  function startChatPolling() {
+    if (chatMessages && chatMessages.dataset.updatesUrl && !chatPolling) {
+      chatPolling = window.setInterval(pollChatUpdates, 5000);
+    }
+  }
+
+  /* Live chat (Server-Sent Events) */
+  const chatForm = document.querySelector("form.chat-input");
+  let chatLive = false;
+
+  // No stream without EventSource, or when the server can't share live
+  // events between its workers
+  if (chatMessages && (!window.EventSource || !chatMessages.dataset.streamUrl)) {
+    startChatPolling();
+  }
+
+  if (chatMessages && chatMessages.dataset.streamUrl && window.EventSource) {
+    const stream = new EventSource(chatMessages.dataset.streamUrl);
+
+    stream.addEventListener("open", function () {
+      chatLive = true;
+    });
+
+    stream.addEventListener("message", function (e) {
+      appendChatMessage(JSON.parse(e.data));
+    });
+
+    stream.addEventListener("error", function () {
+      // Not served over ASGI (or forbidden) - poll instead
+      if (stream.readyState === EventSource.CLOSED) {
+        chatLive = false;
+        startChatPolling();
+      }
+    });
+  }
+
+  /* Send without reloading the page while the stream is connected */
+  if (chatForm) {
+    chatForm.addEventListener("submit", function (e) {
+      const messageInput = chatForm.querySelector('input[name="message"]');
+
+      if (!chatLive || e.defaultPrevented || !messageInput.value.trim()) {
+        return;
+      }
+      e.preventDefault();
+
+      fetch(window.location.pathname, {
+        method: "POST",
+        body: new FormData(chatForm),
+        credentials: "same-origin",
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+      })
+        .then(function (response) {
+          if (!response.ok) {
+            throw new Error("Send failed");
+          }
+          return response.json();
+        })
+        .then(function (msg) {
+          appendChatMessage(msg);
+          messageInput.value = "";
+        })
+        .catch(function () {
+          chatForm.submit();
+        });
+    });
+  }
+
+  /* Load older chat messages */
+  const loadOlderBtn = document.querySelector(".chat-load-older");
+
+  if (chatMessages && loadOlderBtn) {
+    loadOlderBtn.addEventListener("click", function () {
+      const url = chatMessages.dataset.historyUrl +
+        "?before=" + encodeURIComponent(loadOlderBtn.dataset.cursor);
+      const previousHeight = chatMessages.scrollHeight;
+      const anchor = loadOlderBtn.parentElement;
+
+      loadOlderBtn.disabled = true;
+
+      fetch(url, { credentials: "same-origin" })
+        .then(function (response) {
+          return response.json();
+        })
+        .then(function (data) {
+          let last = anchor;
+          data.messages.forEach(function (msg) {
+            const row = buildChatMessage(msg);
+            last.after(row);
+            last = row;
+          });
+          // Keep the reader's position while content grows above it
+          chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+
+          if (data.older_cursor) {
+            loadOlderBtn.dataset.cursor = data.older_cursor;
+            loadOlderBtn.disabled = false;
+          } else {
+            anchor.remove();
+          }
+        })
+        .catch(function () {
+          loadOlderBtn.disabled = false;
+        });
+    });
+  }
+
   /* Reusable SweetAlert helper */
   function showSweetalert2(options) {
     if (typeof Sweetalert2 !== "undefined") {
@@ -0,0 +1,58 @@
+import json
+import logging
+
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from . import images
+
+logger = logging.getLogger(__name__)
+
+
+class ResponsiveStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    # WhiteNoise's hashed + compressed storage, with responsive image
+    # variants generated before hashing so they get far-future caching too
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            paths.update(self.build_responsive_images(paths))
+        yield from super().post_process(paths, dry_run, **options)
+
+    def build_responsive_images(self, paths):
+        try:
+            formats = images.available_formats()
+        except ImportError:
+            logger.warning("Pillow is not installed, skipping responsive "
+                           "image variants.")
+            return {}
+
+        manifest, added = {}, {}
+        for path, (storage, source) in sorted(paths.items()):
+            if not images.is_source_image(path):
+                continue
+            with storage.open(source) as handle:
+                entry, files = images.build_variants(path, handle, formats)
+            for name, data in files:
+                added[name] = (self, self._replace(name, data))
+            manifest[path] = entry
+
+        name = self._replace(images.RESPONSIVE_MANIFEST,
+                             json.dumps(manifest, sort_keys=True).encode())
+        added[name] = (self, name)
+        logger.info("Built %d responsive variants for %d images.",
+                    len(added) - 1, len(manifest))
+        return added
+
+    def _replace(self, name, data):
+        if self.exists(name):
+            self.delete(name)
+        return self._save(name, ContentFile(data))
+
+    def stored_name(self, name):
+        # Outside a collectstatic'd deploy (tests, a fresh checkout) there
+        # is no manifest - serve the plain file rather than erroring
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,44 @@
+from django.core.handlers.asgi import ASGIRequest
+
+# Constant-memory streaming of large querysets
+#
+# Rows are fetched with a chunked (server-side on Postgres) cursor and
+# encoded one chunk at a time. Under ASGI the iterator must be async -
+# Django would otherwise collect a sync iterator into a list first.
+
+
+def stream_queryset(request, queryset, encode_chunk, chunk_size=2000,
+                    prefix=None, suffix=None):
+    # encode_chunk(rows) -> str/bytes for up to chunk_size rows, suffix()
+    # is called after the last chunk (e.g. to flush a compressor)
+
+    if isinstance(request, ASGIRequest):
+        async def chunks():
+            if prefix is not None:
+                yield prefix
+            rows = []
+            async for row in queryset.aiterator(chunk_size=chunk_size):
+                rows.append(row)
+                if len(rows) >= chunk_size:
+                    yield encode_chunk(rows)
+                    rows = []
+            if rows:
+                yield encode_chunk(rows)
+            if suffix is not None:
+                yield suffix()
+        return chunks()
+
+    def chunks():
+        if prefix is not None:
+            yield prefix
+        rows = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield encode_chunk(rows)
+                rows = []
+        if rows:
+            yield encode_chunk(rows)
+        if suffix is not None:
+            yield suffix()
+    return chunks()
@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db.models import Q
+from django.urls import reverse
+
+from . import avatars
+from .jobs import enqueue, task
+from .models import Conversation, StudentTutorRelationship, User
+
+# Background tasks - registered on import from Gr8TutorConfig.ready()
+
+DIGEST_PENDING_KEY = "message-digest-pending:{}"
+
+
+def site_url(path):
+    return getattr(settings, "SITE_URL", "").rstrip("/") + path
+
+
+@task("avatars.process", max_attempts=3)
+def process_avatar(tutor_id, upload_name):
+    avatars.process_avatar(tutor_id, upload_name)
+
+
+def enqueue_message_digest(recipient_id):
+    # One digest per recipient per MESSAGE_DIGEST_DELAY, however many
+    # messages arrive - the cache flag spares the chat path the INSERT
+    # attempt, the queued-job unique constraint is the real guarantee
+    delay = getattr(settings, "MESSAGE_DIGEST_DELAY", 600)
+    if cache.add(DIGEST_PENDING_KEY.format(recipient_id), 1, delay):
+        enqueue("messages.digest", {"user_id": recipient_id}, delay=delay,
+                dedupe_key=f"message-digest:{recipient_id}")
+
+
+@task("messages.digest")
+def send_message_digest(user_id):
+    cache.delete(DIGEST_PENDING_KEY.format(user_id))
+    user = User.objects.filter(pk=user_id).only("username", "email").first()
+    if user is None or not user.email:
+        return
+
+    unread = list(
+        Conversation.objects
+        .filter(Q(user_low=user, unread_low__gt=0)
+                | Q(user_high=user, unread_high__gt=0))
+        .select_related("user_low", "user_high")
+        .order_by("-last_message_time")
+    )
+    if not unread:
+        # Read in the app before the digest went out
+        return
+
+    lines, total = [], 0
+    for conversation in unread:
+        if conversation.user_low_id == user.id:
+            other, count = conversation.user_high, conversation.unread_low
+        else:
+            other, count = conversation.user_low, conversation.unread_high
+        total += count
+        lines.append(f"- {other.username} ({count}): "
+                     f"{conversation.last_message_text}")
+
+    send_mail(
+        f"You have {total} unread message{'s' if total != 1 else ''} on Gr8tutor",
+        f"Hi {user.username},\n\n" + "\n".join(lines)
+        + f"\n\nReply at {site_url(reverse('inbox'))}\n",
+        None,
+        [user.email],
+    )
+
+
+RELATIONSHIP_EMAILS = {
+    # event: (subject, body)
+    "requested": ("New student request",
+                  "{student} would like you as their tutor. Review requests "
+                  "at {url}"),
+    "confirmed": ("Your tutor request was accepted",
+                  "{tutor} accepted your request - you can now chat at {url}"),
+}
+
+
+def enqueue_relationship_email(relationship, event):
+    enqueue("relationships.notify",
+            {"relationship_id": relationship.id, "event": event})
+
+
+@task("relationships.notify", batch=True)
+def send_relationship_emails(payloads):
+    # One query and one SMTP connection for the whole batch
+    relationships = StudentTutorRelationship.objects.select_related(
+        "student__user_profile__user", "tutor__user_profile__user",
+    ).in_bulk({payload["relationship_id"] for payload in payloads})
+
+    emails = []
+    for payload in payloads:
+        relationship = relationships.get(payload["relationship_id"])
+        if relationship is None:
+            # Cancelled before we got to it
+            continue
+        subject, body = RELATIONSHIP_EMAILS[payload["event"]]
+        student = relationship.student.user_profile.user
+        tutor = relationship.tutor.user_profile.user
+        if payload["event"] == "requested":
+            recipient, url = tutor, reverse("tutor_students")
+        else:
+            recipient, url = student, reverse("chat", args=[tutor.id])
+        if not recipient.email:
+            continue
+        emails.append(EmailMessage(
+            subject,
+            body.format(student=student.username, tutor=tutor.username,
+                        url=site_url(url)),
+            to=[recipient.email],
+        ))
+    if emails:
+        get_connection().send_messages(emails)
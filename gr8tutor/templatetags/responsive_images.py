@@ -0,0 +1,49 @@
+import json
+from functools import lru_cache
+
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from gr8tutor.images import FORMATS, RESPONSIVE_MANIFEST
+
+register = template.Library()
+
+
+@lru_cache(maxsize=1)
+def responsive_manifest():
+    # Written by collectstatic - absent in development, where the tag
+    # falls back to a plain lazy-loaded <img>
+    try:
+        with staticfiles_storage.open(RESPONSIVE_MANIFEST) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+@register.simple_tag
+def responsive_image(path, alt="", sizes="100vw", loading="lazy", **attrs):
+    entry = responsive_manifest().get(path)
+
+    img_attrs = {"src": static(path), "alt": alt, "loading": loading,
+                 "decoding": "async", **attrs}
+    if entry:
+        img_attrs.setdefault("width", entry["width"])
+        img_attrs.setdefault("height", entry["height"])
+    img = format_html("<img {}>", format_html_join(
+        " ", '{}="{}"', img_attrs.items()))
+    if not entry:
+        return img
+
+    sources = format_html_join(
+        "",
+        '<source type="image/{}" srcset="{}" sizes="{}">',
+        (
+            (fmt, ", ".join(f"{static(name)} {width}w"
+                            for width, name in entry["variants"][fmt]),
+             sizes)
+            for fmt in FORMATS if fmt in entry["variants"]
+        ),
+    )
+    return format_html("<picture>{}{}</picture>", sources, img)
@@ -1,7 +1,76 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from time import sleep
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import Context, Template
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from gr8tutor.models import UserProfile, Tutor, Student
+from django.utils import timezone
+from gr8tutor.models import (
+    Availability,
+    Conversation,
+    Job,
+    Lesson,
+    Message,
+    Student,
+    StudentTutorRelationship,
+    Tutor,
+    UserProfile,
+    conversation_directions,
+    conversation_messages,
+)
+from gr8tutor.directory import (
+    cached_directory,
+    directory_cache_stats,
+    invalidate_directory,
+)
+from gr8tutor import search
+from gr8tutor.images import build_variants
+from gr8tutor.jobs import enqueue, run_due_jobs, task
+from gr8tutor.logs import (
+    JsonFormatter,
+    QueueingHandler,
+    RequestIdFilter,
+    current_request,
+)
+from gr8tutor.metrics import recorder
+from gr8tutor.pagecache import page_cache
+from gr8tutor.pagination import encode_time_cursor, newest_first_page
+from gr8tutor.queryplans import analyze, plan_problems
+from gr8tutor.templatetags.responsive_images import responsive_manifest
+from gr8tutor.permissions import can_chat
+from gr8tutor.recommendations import TutorIndex, get_index, reset_index
+from gr8tutor.scheduling import (
+    BookingError,
+    IntervalIndex,
+    book_lesson,
+    book_series,
+    free_slots,
+    local_datetime,
+    reset_indexes,
+)
+from gr8tutor.services import set_role
+from gr8tutor.pubsub import InProcessBroker, conversation_channel, get_broker
 from django.urls import reverse
+from datetime import time, timedelta
+from decimal import Decimal
 
 # Create your tests here.
 class UserProfileAndRoleTests(TestCase):
@@ -35,4 +104,1592 @@ class UserProfileAndRoleTests(TestCase):
 
     def test_tutor_role_assigned(self):
         self.assertEqual(self.tutor_profile.role, "tutor")
-        
\ No newline at end of file
+        
+
+@override_settings(SHARED_CACHE=True)
+class TutorDirectoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user(
+            username="viewer", password="testpass"
+            )
+        for i in range(15):
+            user = User.objects.create_user(
+                username=f"tutor{i}", password="testpass"
+                )
+            profile = user.userprofile
+            profile.role = "tutor"
+            profile.save()
+            Tutor.objects.create(user_profile=profile,
+                                 bio=" ".join(["word"] * 40))
+        self.client.login(username="viewer", password="testpass")
+
+    def test_bio_excerpt_stored_on_save(self):
+        tutor = Tutor.objects.first()
+        self.assertEqual(len(tutor.bio_excerpt.split()), 20)
+
+    def test_pages_follow_keyset_cursor(self):
+        first = self.client.get(reverse("tutors"))
+        page = first.context["page"]
+        self.assertEqual(len(page), 12)
+        self.assertTrue(page.has_next)
+
+        second = self.client.get(reverse("tutors"),
+                                 {"after": page.next_cursor})
+        names = [t.user_profile.user.username for t in second.context["page"]]
+        self.assertEqual(names, ["tutor12", "tutor13", "tutor14"])
+        self.assertFalse(second.context["page"].has_next)
+
+    def test_query_count_does_not_grow_with_tutors(self):
+        # Warm up session/auth lookups, then pin the page cost
+        self.client.get(reverse("tutors"))
+        invalidate_directory()
+        with self.assertNumQueries(4):
+            self.client.get(reverse("tutors"))
+        # Served from the directory cache: session and user only
+        with self.assertNumQueries(2):
+            self.client.get(reverse("tutors"))
+
+
+class TutorSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username="viewer", password="testpass")
+        tutors = [
+            ("anna", "Business English", "Meetings and grammar drills", "40.00", 8),
+            ("ben", "IELTS", "Exam preparation and speaking practice", "25.00", 3),
+            ("cara", "IELTS", "Writing tasks and grammar", "55.00", 12),
+        ]
+        for username, subject, bio, rate, years in tutors:
+            user = User.objects.create_user(username=username, password="testpass")
+            profile = user.userprofile
+            profile.role = "tutor"
+            profile.save()
+            Tutor.objects.create(user_profile=profile, subject=subject, bio=bio,
+                                 hourly_rate=Decimal(rate), experience=years)
+        self.client.login(username="viewer", password="testpass")
+
+    def search(self, **params):
+        response = self.client.get(reverse("tutor_search"), params)
+        return response.json()
+
+    def test_full_text_search_uses_bio_and_subject(self):
+        names = [r["username"] for r in self.search(q="grammar")["results"]]
+        self.assertEqual(names, ["anna", "cara"])
+        names = [r["username"] for r in self.search(q="ielts speak")["results"]]
+        self.assertEqual(names, ["ben"])
+
+    def test_search_index_follows_updates(self):
+        tutor = Tutor.objects.get(user_profile__user__username="ben")
+        tutor.bio = "Pronunciation coaching"
+        tutor.save()
+        names = [r["username"] for r in self.search(q="pronunciation")["results"]]
+        self.assertEqual(names, ["ben"])
+        self.assertEqual(self.search(q="exam")["results"], [])
+
+    def test_range_filters_and_facets(self):
+        data = self.search(min_rate="30", max_experience="10")
+        self.assertEqual([r["username"] for r in data["results"]], ["anna"])
+
+        data = self.search(subject="IELTS")
+        self.assertEqual(len(data["results"]), 2)
+        facets = {f["subject"]: f["count"] for f in data["facets"]}
+        self.assertEqual(facets, {"Business English": 1, "IELTS": 2})
+
+    def test_tutors_page_search_mode(self):
+        response = self.client.get(reverse("tutors"), {"q": "writing"})
+        self.assertTrue(response.context["searching"])
+        self.assertEqual(len(response.context["page"]), 1)
+        self.assertContains(response, "cara")
+
+    def test_tutors_page_offers_max_experience(self):
+        response = self.client.get(reverse("tutors"), {"max_experience": "5"})
+        self.assertContains(response, 'name="max_experience"')
+        self.assertContains(response, 'value="5"')
+        self.assertEqual([t.user_profile.user.username
+                          for t in response.context["page"]], ["ben"])
+
+    def test_missing_fts_table_is_looked_up_once(self):
+        with mock.patch.dict(search._fts_ready, clear=True), mock.patch.object(
+            connection.introspection, "table_names", return_value=[]
+        ) as table_names:
+            self.search(q="grammar")
+            data = self.search(q="grammar")
+        self.assertEqual(table_names.call_count, 1)
+        # Substring fallback still finds them
+        self.assertEqual(len(data["results"]), 2)
+
+
+class ChatHistoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.student_user = User.objects.create_user(
+            username="student", password="testpass"
+            )
+        self.tutor_user = User.objects.create_user(
+            username="tutor", password="testpass"
+            )
+        student_profile = self.student_user.userprofile
+        student_profile.role = "student"
+        student_profile.save()
+        tutor_profile = self.tutor_user.userprofile
+        tutor_profile.role = "tutor"
+        tutor_profile.save()
+        StudentTutorRelationship.objects.create(
+            student=Student.objects.create(user_profile=student_profile),
+            tutor=Tutor.objects.create(user_profile=tutor_profile),
+            is_active=True,
+        )
+        for i in range(60):
+            sender, recipient = ((self.student_user, self.tutor_user) if i % 2
+                                 else (self.tutor_user, self.student_user))
+            Message.objects.create(sender=sender, recipient=recipient,
+                                   text=f"message {i}")
+        self.client.login(username="student", password="testpass")
+
+    def test_chat_page_shows_newest_page_only(self):
+        response = self.client.get(reverse("chat", args=[self.tutor_user.id]))
+        texts = [m.text for m in response.context["messages"]]
+        self.assertEqual(len(texts), 50)
+        self.assertEqual(texts[0], "message 10")
+        self.assertEqual(texts[-1], "message 59")
+        self.assertIsNotNone(response.context["older_cursor"])
+
+    def test_history_endpoint_walks_backwards(self):
+        response = self.client.get(reverse("chat", args=[self.tutor_user.id]))
+        data = self.client.get(
+            reverse("chat_history", args=[self.tutor_user.id]),
+            {"before": response.context["older_cursor"]},
+        ).json()
+        self.assertEqual([m["text"] for m in data["messages"]],
+                         [f"message {i}" for i in range(10)])
+        self.assertIsNone(data["older_cursor"])
+
+    def test_history_requires_relationship(self):
+        outsider = User.objects.create_user(username="outsider",
+                                            password="testpass")
+        response = self.client.get(reverse("chat_history", args=[outsider.id]),
+                                   {"before": "20260101000000000000-1"})
+        self.assertEqual(response.status_code, 403)
+
+
+class LiveChatTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.student_user = User.objects.create_user(
+            username="student", password="testpass"
+            )
+        self.tutor_user = User.objects.create_user(
+            username="tutor", password="testpass"
+            )
+        student_profile = self.student_user.userprofile
+        student_profile.role = "student"
+        student_profile.save()
+        tutor_profile = self.tutor_user.userprofile
+        tutor_profile.role = "tutor"
+        tutor_profile.save()
+        StudentTutorRelationship.objects.create(
+            student=Student.objects.create(user_profile=student_profile),
+            tutor=Tutor.objects.create(user_profile=tutor_profile),
+            is_active=True,
+        )
+        self.channel = conversation_channel(self.student_user.id,
+                                            self.tutor_user.id)
+
+    def test_in_process_broker_fans_out(self):
+        broker = InProcessBroker()
+
+        async def listen():
+            async with broker.subscribe(self.channel) as first, \
+                    broker.subscribe(self.channel) as second:
+                broker.publish(self.channel, {"id": 1})
+                broker.publish("chat.other", {"id": 2})
+                return await first.get(), await second.get()
+
+        self.assertEqual(asyncio.run(listen()), ({"id": 1}, {"id": 1}))
+        self.assertEqual(broker.subscriber_count(self.channel), 0)
+
+    def test_new_message_published_after_commit(self):
+        with mock.patch.object(get_broker(), "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                Message.objects.create(sender=self.student_user,
+                                       recipient=self.tutor_user, text="hi")
+        channel, payload = publish.call_args.args
+        self.assertEqual(channel, self.channel)
+        self.assertEqual(payload["text"], "hi")
+
+    async def test_stream_pushes_new_messages(self):
+        await self.async_client.aforce_login(self.tutor_user)
+        response = await self.async_client.get(
+            reverse("chat_stream", args=[self.student_user.id]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b"retry: 3000\n\n")
+        get_broker().publish(self.channel, {
+            "id": 7, "sender_id": self.student_user.id, "text": "hello",
+            "time": "2026-01-01T00:00:00+00:00",
+        })
+        event = (await anext(events)).decode()
+        self.assertIn("event: message", event)
+        self.assertIn('"sent": false', event)
+
+        # Client disconnect cancels the pending read and unsubscribes
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(get_broker().subscriber_count(self.channel), 0)
+
+    async def test_streamed_messages_are_marked_read(self):
+        unread = sync_to_async(Conversation.unread_total)
+        seen = await Message.objects.acreate(
+            sender=self.tutor_user, recipient=self.student_user, text="hello")
+        await Message.objects.acreate(
+            sender=self.student_user, recipient=self.tutor_user, text="hi")
+        await self.async_client.aforce_login(self.tutor_user)
+        response = await self.async_client.get(
+            reverse("chat_stream", args=[self.student_user.id]),
+            headers={"last-event-id": str(seen.id)})
+        events = aiter(response.streaming_content)
+        await anext(events)
+        self.assertIn(b'"text": "hi"', await anext(events))
+
+        # Each message is marked once the client asks for the next event
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.1)
+        self.assertEqual(await unread(self.tutor_user), 0)
+
+        second = await Message.objects.acreate(
+            sender=self.student_user, recipient=self.tutor_user, text="there")
+        self.assertEqual(await unread(self.tutor_user), 1)
+        get_broker().publish(self.channel, {
+            "id": second.id, "sender_id": self.student_user.id,
+            "text": "there", "time": second.time.isoformat(),
+        })
+        self.assertIn(b'"text": "there"', await pending)
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.1)
+        self.assertEqual(await unread(self.tutor_user), 0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    def test_ajax_post_returns_json(self):
+        self.client.login(username="student", password="testpass")
+        response = self.client.post(
+            reverse("chat", args=[self.tutor_user.id]), {"message": "hey"},
+            headers={"x-requested-with": "XMLHttpRequest"},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()["sent"])
+
+    def test_stream_needs_asgi(self):
+        self.client.login(username="student", password="testpass")
+        with self.assertLogs("django.request", "ERROR"):
+            response = self.client.get(reverse("chat_stream",
+                                               args=[self.tutor_user.id]))
+        self.assertEqual(response.status_code, 501)
+
+    @override_settings(WEB_CONCURRENCY=4)
+    async def test_polls_without_shared_broker(self):
+        # In-process events would only reach streams on the same worker
+        await self.async_client.aforce_login(self.student_user)
+        response = await self.async_client.get(
+            reverse("chat", args=[self.tutor_user.id]))
+        self.assertNotContains(response, "data-stream-url")
+        self.assertContains(response, "data-updates-url")
+        with self.assertLogs("django.request", "ERROR"):
+            response = await self.async_client.get(
+                reverse("chat_stream", args=[self.tutor_user.id]))
+        self.assertEqual(response.status_code, 501)
+
+
+class ChatDeltaSyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.student_user = User.objects.create_user(
+            username="student", password="testpass"
+            )
+        self.tutor_user = User.objects.create_user(
+            username="tutor", password="testpass"
+            )
+        self.tutor_user.is_staff = True
+        self.tutor_user.save()
+        self.first = Message.objects.create(sender=self.student_user,
+                                            recipient=self.tutor_user,
+                                            text="first")
+        self.client.login(username="tutor", password="testpass")
+        self.url = reverse("chat_updates", args=[self.student_user.id])
+
+    def test_returns_only_newer_messages(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual([m["text"] for m in data["messages"]], ["first"])
+
+        Message.objects.create(sender=self.tutor_user,
+                               recipient=self.student_user, text="second")
+        data = self.client.get(self.url, {"after": data["cursor"]}).json()
+        self.assertEqual([m["text"] for m in data["messages"]], ["second"])
+        self.assertTrue(data["messages"][0]["sent"])
+
+    def test_not_modified_when_nothing_new(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+
+class ConversationInboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username="alice",
+                                              password="testpass")
+        self.bob = User.objects.create_user(username="bob", password="testpass")
+        self.bob.is_staff = True
+        self.bob.save()
+
+    def conversation(self):
+        return Conversation.objects.get()
+
+    def test_messages_update_summary_and_unread_counts(self):
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="a")
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="b")
+        conversation = self.conversation()
+        self.assertEqual(conversation.last_message_text, "b")
+        self.assertEqual(conversation.unread_high, 2)
+        self.assertEqual(Conversation.unread_total(self.bob), 2)
+
+        # Replying clears the replier's unread count
+        Message.objects.create(sender=self.bob, recipient=self.alice, text="c")
+        conversation = self.conversation()
+        self.assertEqual((conversation.unread_low, conversation.unread_high),
+                         (1, 0))
+
+    def test_opening_chat_marks_conversation_read(self):
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="a")
+        self.client.login(username="bob", password="testpass")
+        self.client.get(reverse("chat", args=[self.alice.id]))
+        self.assertEqual(Conversation.unread_total(self.bob), 0)
+
+    def test_inbox_lists_conversations(self):
+        carol = User.objects.create_user(username="carol", password="testpass")
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="a")
+        Message.objects.create(sender=carol, recipient=self.bob, text="hello")
+        self.client.login(username="bob", password="testpass")
+        self.client.get(reverse("inbox"))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("inbox"))
+        rows = response.context["conversations"]
+        self.assertEqual([c.other_user.username for c in rows],
+                         ["carol", "alice"])
+        self.assertEqual([c.unread for c in rows], [1, 1])
+
+    def test_role_dashboards_show_unread_count(self):
+        set_role(self.alice.userprofile, "tutor")
+        Tutor.objects.create(user_profile=self.alice.userprofile)
+        set_role(self.bob.userprofile, "student")
+        Student.objects.create(user_profile=self.bob.userprofile)
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="a")
+        Message.objects.create(sender=self.bob, recipient=self.alice, text="b")
+        Message.objects.create(sender=self.bob, recipient=self.alice, text="c")
+
+        self.client.login(username="bob", password="testpass")
+        response = self.client.get(reverse("student_dashboard"))
+        self.assertContains(response, "0 New")
+        self.client.login(username="alice", password="testpass")
+        response = self.client.get(reverse("tutor_dashboard"))
+        self.assertContains(response, '<span class="badge bg-primary">2</span>')
+
+    def test_rebuild_command_restores_rows(self):
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="a")
+        Message.objects.create(sender=self.bob, recipient=self.alice, text="b")
+        expected = self.conversation()
+        Conversation.objects.update(last_message_text="stale", unread_low=9)
+
+        call_command("rebuild_conversations", stdout=StringIO())
+        rebuilt = self.conversation()
+        self.assertEqual(rebuilt.last_message_text, "b")
+        self.assertEqual((rebuilt.unread_low, rebuilt.unread_high),
+                         (expected.unread_low, expected.unread_high))
+
+    def test_rebuild_queries_per_batch_not_per_pair(self):
+        for i in range(5):
+            other = User.objects.create_user(username=f"u{i}")
+            Message.objects.create(sender=other, recipient=self.bob, text="x")
+            Message.objects.create(sender=other, recipient=self.bob, text="y")
+        Conversation.objects.update(unread_low=0, unread_high=0,
+                                    last_message_text="")
+        # Rows, grouped pairs, last messages, then the atomic bulk_update
+        with self.assertNumQueries(6):
+            call_command("rebuild_conversations", stdout=StringIO())
+        self.assertEqual(Conversation.unread_total(self.bob), 10)
+        self.assertEqual(set(Conversation.objects.values_list(
+            "last_message_text", flat=True)), {"y"})
+
+
+@override_settings(SHARED_CACHE=True)
+class ChatPermissionCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.student_user = User.objects.create_user(
+            username="student", password="testpass"
+            )
+        self.tutor_user = User.objects.create_user(
+            username="tutor", password="testpass"
+            )
+        student_profile = self.student_user.userprofile
+        student_profile.role = "student"
+        student_profile.save()
+        tutor_profile = self.tutor_user.userprofile
+        tutor_profile.role = "tutor"
+        tutor_profile.save()
+        self.student = Student.objects.create(user_profile=student_profile)
+        self.tutor = Tutor.objects.create(user_profile=tutor_profile)
+
+    def test_permission_is_cached(self):
+        self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+            self.assertFalse(can_chat(self.tutor_user, self.student_user.id))
+
+    def test_relationship_changes_invalidate(self):
+        self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+
+        # Student requests, tutor confirms
+        relationship = StudentTutorRelationship.objects.create(
+            student=self.student, tutor=self.tutor)
+        self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+        relationship.is_active = True
+        relationship.save()
+        self.assertTrue(can_chat(self.student_user, self.tutor_user.id))
+
+        relationship.delete()
+        self.assertFalse(can_chat(self.tutor_user, self.student_user.id))
+
+    def test_invalidation_needs_no_queries(self):
+        relationship = StudentTutorRelationship.objects.create(
+            student=self.student, tutor=self.tutor)
+        relationship.is_active = True
+        with self.assertNumQueries(1):
+            relationship.save(update_fields=["is_active"])
+
+    def test_other_pairs_stay_cached(self):
+        user = User.objects.create_user(username="other", password="testpass")
+        other = Student.objects.create(user_profile=user.userprofile)
+        self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+        StudentTutorRelationship.objects.create(student=other, tutor=self.tutor)
+        with self.assertNumQueries(0):
+            self.assertFalse(can_chat(self.student_user, self.tutor_user.id))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_not_cached_without_shared_cache(self):
+        # Another worker's delete could never clear this process's entry
+        StudentTutorRelationship.objects.create(
+            student=self.student, tutor=self.tutor, is_active=True)
+        self.assertTrue(can_chat(self.student_user, self.tutor_user.id))
+        with self.assertNumQueries(1):
+            self.assertTrue(can_chat(self.student_user, self.tutor_user.id))
+
+
+@override_settings(SHARED_CACHE=True)
+class ActorMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tutor",
+                                             password="testpass")
+        profile = self.user.userprofile
+        profile.role = "tutor"
+        profile.save()
+        self.tutor = Tutor.objects.create(user_profile=profile)
+        self.client.login(username="tutor", password="testpass")
+
+    def test_role_gated_view_reuses_session_snapshot(self):
+        self.client.get(reverse("tutor_students"))
+        # session + user, then the two relationship lists
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("tutor_students"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_role_comes_from_actor(self):
+        self.client.get(reverse("dashboard"))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Tutor Dashboard")
+
+    def test_role_change_invalidates_snapshot(self):
+        self.client.get(reverse("tutor_students"))
+        self.tutor.delete()
+        response = self.client.get(reverse("tutor_students"))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_loaded_every_request_without_shared_cache(self):
+        # Another worker's role change couldn't invalidate a snapshot, so
+        # there is none: one profile query, and no session write
+        self.client.get(reverse("tutor_students"))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("tutor_students"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_actor", self.client.session)
+
+
+class RegistrationAndLoginQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def register(self, username="newbie", email="newbie@example.com"):
+        return self.client.post(reverse("register"), {
+            "username": username,
+            "email": email,
+            "password": "s3cret-pass",
+            "password_again": "s3cret-pass",
+            "role": "tutor",
+        })
+
+    def test_registration_is_three_inserts(self):
+        # savepoint, user, profile, tutor, release
+        with self.assertNumQueries(5):
+            response = self.register()
+        self.assertTrue(response.context["registration_success"])
+        profile = UserProfile.objects.get(user__username="newbie")
+        self.assertEqual(profile.role, "tutor")
+        self.assertTrue(Tutor.objects.filter(user_profile=profile).exists())
+
+    def test_duplicates_rejected_by_constraints(self):
+        self.register()
+        response = self.register(email="other@example.com")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.context["error_message"],
+                         "Username already exists.")
+        response = self.register(username="other")
+        self.assertEqual(response.context["error_message"],
+                         "Email already exists.")
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_login_does_not_rewrite_profile(self):
+        self.register()
+        # user lookup, last_login update and the session writes - no
+        # UserProfile UPDATE
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse("login"), {
+                "username": "newbie", "password": "s3cret-pass",
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_unchanged_role_is_not_saved(self):
+        self.register()
+        profile = UserProfile.objects.get(user__username="newbie")
+        with self.assertNumQueries(0):
+            self.assertFalse(set_role(profile, "tutor"))
+
+
+class ImportUsersCommandTests(TestCase):
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(content)
+        return path
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        User.objects.create_user(username="taken", email="taken@example.com",
+                                 password="testpass")
+
+    def test_imports_csv_in_batches(self):
+        path = self.write("users.csv", (
+            "username,email,password,role,subject,bio,hourly_rate,experience\n"
+            "t1,t1@example.com,pw-one,tutor,IELTS,Exam coaching,30,4\n"
+            "s1,s1@example.com,pw-two,student,,,,\n"
+            "taken,new@example.com,pw,student,,,,\n"
+            "t2,t2@example.com,pw-three,wizard,,,,\n"
+        ))
+        out, err = StringIO(), StringIO()
+        call_command("import_users", path, "--batch-size", "2",
+                     "--workers", "0", stdout=out, stderr=err)
+
+        tutor = Tutor.objects.get(user_profile__user__username="t1")
+        self.assertEqual(tutor.user_profile.role, "tutor")
+        self.assertEqual(tutor.bio_excerpt, "Exam coaching")
+        self.assertTrue(tutor.user_profile.user.check_password("pw-one"))
+        self.assertTrue(Student.objects.filter(
+            user_profile__user__username="s1").exists())
+        self.assertIn("Line 4: username 'taken' already exists.", err.getvalue())
+        self.assertIn("Line 5: invalid role 'wizard'.", err.getvalue())
+        self.assertIn("Batch 2:", out.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write("users.jsonl", (
+            '{"username": "j1", "email": "j1@example.com", "password": "pw",'
+            ' "role": "student"}\n'
+            'not json\n'
+        ))
+        err = StringIO()
+        call_command("import_users", path, "--dry-run", stdout=StringIO(),
+                     stderr=err)
+        self.assertFalse(User.objects.filter(username="j1").exists())
+        self.assertIn("Line 2: not a JSON object.", err.getvalue())
+
+    def test_rejects_bad_numbers_and_missing_password(self):
+        path = self.write("users.csv", (
+            "username,email,password,role,hourly_rate,experience\n"
+            "t1,t1@example.com,pw,tutor,NaN,1\n"
+            "t2,t2@example.com,pw,tutor,Infinity,1\n"
+            "t3,t3@example.com,pw,tutor,100000,1\n"
+            "t4,t4@example.com,pw,tutor,-5,1\n"
+            "t5,t5@example.com,pw,tutor,30,-2\n"
+            "t6,t6@example.com,,tutor,30,2\n"
+            "t7,t7@example.com,pw,tutor,30.5,2\n"
+        ))
+        err = StringIO()
+        call_command("import_users", path, "--workers", "0",
+                     stdout=StringIO(), stderr=err)
+        for line in (2, 3, 4, 5):
+            self.assertIn(f"Line {line}: hourly_rate: ", err.getvalue())
+        self.assertIn("Line 6: experience: must not be negative.",
+                      err.getvalue())
+        self.assertIn("Line 7: password is required.", err.getvalue())
+        # The good row in the same batch still goes in
+        self.assertEqual(list(Tutor.objects.values_list(
+            "user_profile__user__username", flat=True)), ["t7"])
+
+    def test_values_are_cleaned_by_their_model_fields(self):
+        rows = [
+            {"username": "x" * 151, "email": "a@example.com"},
+            {"username": "bad name!", "email": "b@example.com"},
+            {"username": "c", "email": "not-an-email"},
+            {"username": "d", "email": "d@example.com", "subject": "s" * 256},
+            {"username": "e", "email": "e@example.com", "experience": 3.5},
+            {"username": 42, "email": "f@example.com", "bio": None,
+             "experience": 3},
+        ]
+        path = self.write("users.jsonl", "".join(
+            json.dumps(dict(row, password="pw", role="tutor")) + "\n"
+            for row in rows))
+        err = StringIO()
+        call_command("import_users", path, "--workers", "0",
+                     stdout=StringIO(), stderr=err)
+        self.assertIn("Line 1: username: Ensure this value has at most 150",
+                      err.getvalue())
+        self.assertIn("Line 2: username: Enter a valid username.",
+                      err.getvalue())
+        self.assertIn("Line 3: email: Enter a valid email address.",
+                      err.getvalue())
+        self.assertIn("Line 4: subject: Ensure this value has at most 255",
+                      err.getvalue())
+        self.assertIn("Line 5: experience: ", err.getvalue())
+        tutor = Tutor.objects.get()
+        self.assertEqual(tutor.user_profile.user.username, "42")
+        self.assertEqual((tutor.bio, tutor.experience), ("", 3))
+
+
+class AdminUserListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username="admin",
+                                              password="testpass",
+                                              is_staff=True)
+        for i in range(60):
+            user = User.objects.create_user(username=f"user{i:02d}",
+                                            email=f"user{i:02d}@example.com",
+                                            password="testpass")
+            profile = user.userprofile
+            profile.role = "tutor" if i % 3 == 0 else "student"
+            profile.save()
+        self.client.login(username="admin", password="testpass")
+
+    def test_paginated_with_one_query_per_page(self):
+        self.client.get(reverse("admin_user_list"))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("admin_user_list"))
+        page = response.context["page"]
+        self.assertEqual(len(page), 50)
+        response = self.client.get(reverse("admin_user_list"),
+                                   {"after": page.next_cursor})
+        self.assertEqual(len(response.context["page"]), 11)
+
+    def test_role_filter_and_search(self):
+        response = self.client.get(reverse("admin_user_list"),
+                                   {"role": "tutor", "q": "user0"})
+        names = [u.username for u in response.context["page"]]
+        self.assertEqual(names, ["user00", "user03", "user06", "user09"])
+
+    def test_streaming_csv_export(self):
+        response = self.client.get(reverse("admin_user_export"),
+                                   {"role": "tutor"})
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,username,email,role,is_staff,"
+                                   "is_active,date_joined,last_login")
+        self.assertEqual(len(lines), 21)
+
+    def test_streaming_jsonl_export(self):
+        response = self.client.get(reverse("admin_user_export"),
+                                   {"format": "jsonl", "q": "admin"})
+        rows = [json.loads(line) for line in
+                b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r["username"] for r in rows], ["admin"])
+
+    def test_staff_only(self):
+        self.client.login(username="user01", password="testpass")
+        response = self.client.get(reverse("admin_user_export"))
+        self.assertEqual(response.status_code, 403)
+
+
+class MessageExportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin",
+                                              password="testpass",
+                                              is_staff=True)
+        self.alice = User.objects.create_user(username="alice", password="x")
+        self.bob = User.objects.create_user(username="bob", password="x")
+        self.carol = User.objects.create_user(username="carol", password="x")
+        Message.objects.create(sender=self.alice, recipient=self.bob, text="hi")
+        Message.objects.create(sender=self.bob, recipient=self.alice, text="hey")
+        Message.objects.create(sender=self.carol, recipient=self.alice, text="yo")
+        self.client.login(username="admin", password="testpass")
+
+    def export(self, **params):
+        response = self.client.get(reverse("admin_message_export"), params)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        data = gzip.decompress(b"".join(response.streaming_content))
+        return [json.loads(line) for line in data.decode().splitlines()]
+
+    def test_conversation_export(self):
+        rows = self.export(user=self.alice.id, **{"with": self.bob.id})
+        self.assertEqual([r["text"] for r in rows], ["hi", "hey"])
+        self.assertEqual(rows[0]["sender__username"], "alice")
+        self.assertEqual(rows[0]["recipient__username"], "bob")
+
+    def test_user_and_date_filters(self):
+        self.assertEqual(len(self.export(user=self.alice.id)), 3)
+        self.assertEqual(len(self.export(user=self.carol.id)), 1)
+        self.assertEqual(self.export(until="2000-01-01"), [])
+        self.assertEqual(len(self.export(since="2000-01-01",
+                                         until="2999-02-30")), 3)
+
+    def test_staff_only(self):
+        self.client.login(username="alice", password="x")
+        response = self.client.get(reverse("admin_message_export"))
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SHARED_CACHE=True)
+class PublicPageCacheTests(TestCase):
+
+    def setUp(self):
+        page_cache().clear()
+
+    def test_second_hit_skips_rendering(self):
+        first = self.client.get(reverse("about"))
+        self.assertTemplateUsed(first, "gr8tutor/about.html")
+        second = self.client.get(reverse("about"))
+        self.assertTemplateNotUsed(second, "gr8tutor/about.html")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertIn("Cookie", second["Vary"])
+
+    def test_conditional_get_returns_304(self):
+        first = self.client.get(reverse("index"))
+        response = self.client.get(reverse("index"),
+                                   HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get(
+            reverse("index"), HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_varies_on_auth_state(self):
+        anonymous = self.client.get(reverse("contact"))
+        User.objects.create_user(username="visitor", password="testpass")
+        self.client.login(username="visitor", password="testpass")
+        signed_in = self.client.get(reverse("contact"))
+        self.assertTemplateUsed(signed_in, "gr8tutor/contact.html")
+        self.assertIn(b"Logout", signed_in.content)
+        self.assertNotIn(b"Logout", anonymous.content)
+
+    def test_invalidate_pages(self):
+        self.client.get(reverse("about"))
+        call_command("invalidate_pages", stdout=StringIO())
+        response = self.client.get(reverse("about"))
+        self.assertTemplateUsed(response, "gr8tutor/about.html")
+
+    @override_settings(SHARED_CACHE=False, PAGE_CACHE_BACKEND="locmem")
+    def test_not_cached_without_shared_cache(self):
+        self.client.get(reverse("about"))
+        response = self.client.get(reverse("about"))
+        self.assertTemplateUsed(response, "gr8tutor/about.html")
+
+
+@override_settings(SHARED_CACHE=True)
+class DirectoryCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username="viewer", password="testpass")
+        user = User.objects.create_user(username="tina", password="testpass")
+        self.tutor = Tutor.objects.create(user_profile=user.userprofile,
+                                          subject="IELTS")
+        self.client.login(username="viewer", password="testpass")
+
+    def subjects(self):
+        response = self.client.get(reverse("tutor_search"))
+        return [row["subject"] for row in response.json()["results"]]
+
+    def test_tutor_save_invalidates(self):
+        self.assertEqual(self.subjects(), ["IELTS"])
+        self.tutor.subject = "Business English"
+        self.tutor.save()
+        self.assertEqual(self.subjects(), ["Business English"])
+
+    def test_login_does_not_invalidate(self):
+        self.subjects()
+        User.objects.create_user(username="other", password="testpass")
+        self.subjects()
+        self.client.login(username="other", password="testpass")
+        self.subjects()
+        self.assertEqual(directory_cache_stats()["hits"], 1)
+
+    def test_stats_and_stale_while_revalidate(self):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cached_directory("k", load), 1)
+        self.assertEqual(cached_directory("k", load), 1)
+        # Past its soft expiry while another worker holds the lock:
+        # the old copy is served instead of querying again
+        cache.set("k", ("old", 0), 60)
+        cache.add("k:lock", 1)
+        self.assertEqual(cached_directory("k", load), "old")
+        cache.delete("k:lock")
+        self.assertEqual(cached_directory("k", load), 2)
+        self.assertEqual(directory_cache_stats(),
+                         {"hits": 1, "misses": 2, "stale": 1, "waits": 0})
+
+    @override_settings(SHARED_CACHE=False)
+    def test_not_cached_without_shared_cache(self):
+        self.subjects()
+        self.subjects()
+        self.assertEqual(directory_cache_stats()["hits"], 0)
+
+    def test_stats_endpoint_is_staff_only(self):
+        response = self.client.get(reverse("admin_cache_stats"))
+        self.assertEqual(response.status_code, 403)
+
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+@skipUnless(Image, "Pillow is not installed")
+class ResponsiveImageTests(TestCase):
+
+    def setUp(self):
+        responsive_manifest.cache_clear()
+        self.addCleanup(responsive_manifest.cache_clear)
+
+    def jpeg(self, width, height):
+        buffer = BytesIO()
+        Image.new("RGB", (width, height), "teal").save(buffer, "JPEG")
+        buffer.seek(0)
+        return buffer
+
+    def test_variants_never_upscale(self):
+        with self.settings(RESPONSIVE_IMAGE_WIDTHS=(480, 800)):
+            entry, files = build_variants("img/a.jpg", self.jpeg(600, 300),
+                                          ["webp"])
+        self.assertEqual(entry["variants"]["webp"],
+                         [[480, "img/a-480w.webp"], [600, "img/a-600w.webp"]])
+        with Image.open(BytesIO(files[0][1])) as variant:
+            self.assertEqual(variant.size, (480, 240))
+            self.assertEqual(variant.format, "WEBP")
+
+    def test_collectstatic_builds_manifest_and_tag_uses_it(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with self.settings(STATIC_ROOT=static_root,
+                           RESPONSIVE_IMAGE_WIDTHS=(160,)), \
+                mock.patch("gr8tutor.storage.images.available_formats",
+                           return_value=["webp"]):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            html = Template(
+                "{% load responsive_images %}"
+                "{% responsive_image 'img/about.jpg' alt='About' sizes='50vw' %}"
+            ).render(Context())
+
+        self.assertTrue(os.path.exists(
+            os.path.join(static_root, "img", "about-160w.webp")))
+        self.assertIn('<source type="image/webp" srcset="/static/img/about-160w.',
+                      html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="', html)
+
+    def test_tag_falls_back_without_manifest(self):
+        html = Template(
+            "{% load responsive_images %}"
+            "{% responsive_image 'img/about.jpg' alt='About' class='img-fluid' %}"
+        ).render(Context())
+        self.assertEqual(html, '<img src="/static/img/about.jpg" alt="About" '
+                               'loading="lazy" decoding="async" class="img-fluid">')
+
+
+@skipUnless(Image, "Pillow is not installed")
+class TutorAvatarTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root,
+                                 AVATAR_THUMBNAIL_SIZE=64)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = User.objects.create_user(username="tina", password="testpass")
+        set_role(user.userprofile, "tutor")
+        self.tutor = Tutor.objects.create(user_profile=user.userprofile)
+        self.client.login(username="tina", password="testpass")
+
+    def photo(self):
+        exif = Image.Exif()
+        exif[0x010F] = "SecretCam"
+        buffer = BytesIO()
+        Image.new("RGB", (300, 200), "navy").save(buffer, "JPEG", exif=exif)
+        return SimpleUploadedFile("me.jpg", buffer.getvalue(),
+                                  content_type="image/jpeg")
+
+    def test_upload_builds_hashed_thumbnail_off_request(self):
+        self.client.post(reverse("tutor_avatar"), {"avatar": self.photo()})
+        self.tutor.refresh_from_db()
+        self.assertFalse(self.tutor.avatar_thumbnail)
+
+        self.assertEqual(run_due_jobs(), 1)
+        self.tutor.refresh_from_db()
+        self.assertRegex(self.tutor.avatar_thumbnail.name,
+                         r"^avatars/thumbs/[0-9a-f]{20}\.webp$")
+        with Image.open(self.tutor.avatar_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 64))
+        with Image.open(self.tutor.avatar.path) as original:
+            self.assertNotIn(0x010F, original.getexif())
+
+        response = self.client.get(self.tutor.avatar_thumbnail.url)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        response.close()
+
+        results = self.client.get(reverse("tutor_search")).json()["results"]
+        self.assertEqual(results[0]["avatar"], self.tutor.avatar_thumbnail.url)
+
+    def test_rejects_non_images(self):
+        upload = SimpleUploadedFile("notes.txt", b"hello",
+                                    content_type="text/plain")
+        self.client.post(reverse("tutor_avatar"), {"avatar": upload})
+        self.tutor.refresh_from_db()
+        self.assertFalse(self.tutor.avatar)
+        self.assertFalse(Job.objects.exists())
+
+    def test_missing_upload_is_retried_not_discarded(self):
+        self.client.post(reverse("tutor_avatar"), {"avatar": self.photo()})
+        self.tutor.refresh_from_db()
+        upload = self.tutor.avatar.path
+        os.rename(upload, f"{upload}.away")
+        with self.assertLogs("gr8tutor.jobs", "ERROR"):
+            run_due_jobs()
+        self.tutor.refresh_from_db()
+        self.assertEqual(self.tutor.avatar.path, upload)
+        self.assertEqual(Job.objects.get().status, "queued")
+
+    def test_unreadable_thumbnail_is_404(self):
+        os.makedirs(os.path.join(self.media_root, "avatars/thumbs/dir.webp"))
+        for name in ("dir.webp", "missing.webp"):
+            response = self.client.get(
+                reverse("avatar_thumbnail", args=[name]))
+            self.assertEqual(response.status_code, 404)
+
+
+class BackgroundJobTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tutor_user = User.objects.create_user(
+            username="tina", email="tina@example.com", password="testpass")
+        self.student_user = User.objects.create_user(
+            username="sam", email="sam@example.com", password="testpass")
+        set_role(self.tutor_user.userprofile, "tutor")
+        set_role(self.student_user.userprofile, "student")
+        self.tutor = Tutor.objects.create(
+            user_profile=self.tutor_user.userprofile)
+        Student.objects.create(user_profile=self.student_user.userprofile)
+
+    def test_messages_coalesce_into_one_digest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for text in ("one", "two", "three"):
+                Message.objects.create(sender=self.student_user,
+                                       recipient=self.tutor_user, text=text)
+        self.assertEqual(Job.objects.filter(task="messages.digest").count(), 1)
+
+        Job.objects.update(run_after=timezone.now())
+        run_due_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["tina@example.com"])
+        self.assertIn("3 unread messages", mail.outbox[0].subject)
+        self.assertIn("sam (3): three", mail.outbox[0].body)
+        self.assertFalse(Job.objects.exists())
+
+    def test_rolled_back_message_does_not_block_digests(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                Message.objects.create(sender=self.student_user,
+                                       recipient=self.tutor_user, text="lost")
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.student_user,
+                                   recipient=self.tutor_user, text="kept")
+        self.assertEqual(Job.objects.filter(task="messages.digest").count(), 1)
+
+    def test_request_and_confirm_emails_are_queued_not_sent(self):
+        self.client.login(username="sam", password="testpass")
+        self.client.get(reverse("request_tutor", args=[self.tutor.id]))
+        self.client.login(username="tina", password="testpass")
+        self.client.get(reverse("confirm_student",
+                                args=[self.student_user.userprofile.student.id]))
+        self.assertEqual(mail.outbox, [])
+
+        # Claim (3), one relationship lookup for the batch, delete
+        with self.assertNumQueries(5):
+            self.assertEqual(run_due_jobs(), 2)
+        self.assertEqual([email.to for email in mail.outbox],
+                         [["tina@example.com"], ["sam@example.com"]])
+
+    def test_failures_back_off_then_give_up(self):
+        calls = []
+
+        @task("tests.flaky", max_attempts=2)
+        def flaky():
+            calls.append(1)
+            raise RuntimeError("boom")
+
+        job = enqueue("tests.flaky")
+        with self.assertLogs("gr8tutor.jobs", "ERROR"):
+            run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("boom", job.last_error)
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs("gr8tutor.jobs", "ERROR"):
+            run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, len(calls)), ("failed", 2))
+        self.assertEqual(run_due_jobs(), 0)
+
+    def test_worker_command_drains_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.student_user,
+                                   recipient=self.tutor_user, text="hi")
+        Job.objects.update(run_after=timezone.now())
+        out = StringIO()
+        call_command("run_jobs", "--once", stdout=out)
+        self.assertIn("Stopped after 1 jobs.", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class TutorRecommendationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.addCleanup(reset_index)
+        self.tutors = {}
+        for name, subject, bio, rate, years in [
+            ("anna", "IELTS", "Exam preparation, speaking and writing", "30", 2),
+            ("ben", "IELTS", "Exam strategies for the speaking test", "80", 15),
+            ("cara", "Business English", "Meetings, emails and presentations", "40", 6),
+            ("dan", "Kids", "Games and songs for young learners", "20", 4),
+        ]:
+            user = User.objects.create_user(username=name, password="testpass")
+            self.tutors[name] = Tutor.objects.create(
+                user_profile=user.userprofile, subject=subject, bio=bio,
+                hourly_rate=Decimal(rate), experience=years)
+        user = User.objects.create_user(username="sam", password="testpass")
+        set_role(user.userprofile, "student")
+        self.student = Student.objects.create(
+            user_profile=user.userprofile,
+            goals="I need IELTS speaking exam practice")
+        self.client.login(username="sam", password="testpass")
+
+    def names(self, **params):
+        response = self.client.get(reverse("tutor_recommendations"), params)
+        return [row["username"] for row in response.json()["results"]]
+
+    def test_ranks_by_goals_and_experience(self):
+        # Both IELTS tutors match, the more experienced one ranks first
+        self.assertEqual(self.names(), ["ben", "anna"])
+
+    def test_budget_penalises_expensive_tutors(self):
+        self.assertEqual(self.names(max_rate="35"), ["anna", "ben"])
+
+    def test_profile_edits_update_the_index(self):
+        self.names()
+        cara = self.tutors["cara"]
+        cara.bio = "IELTS speaking exam coaching"
+        cara.save()
+        self.assertIn("cara", self.names())
+        self.assertIn(cara.id, get_index().overlay)
+
+    def test_deleted_tutors_are_dropped(self):
+        self.names()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tutors["ben"].user_profile.user.delete()
+        self.assertEqual(self.names(), ["anna"])
+        self.assertIsNone(get_index().overlay[self.tutors["ben"].id])
+
+    def test_user_saves_do_not_touch_the_index(self):
+        index = get_index()
+        User.objects.create_user(username="newcomer", password="testpass")
+        self.tutors["anna"].user_profile.save()
+        with mock.patch.object(Tutor.objects, "filter") as tutor_filter:
+            self.assertIs(get_index(), index)
+        tutor_filter.assert_not_called()
+
+    def test_requested_tutors_are_not_recommended(self):
+        StudentTutorRelationship.objects.create(student=self.student,
+                                                tutor=self.tutors["ben"])
+        self.assertEqual(self.names(), ["anna"])
+
+    def test_tutors_page_shows_recommendations(self):
+        response = self.client.get(reverse("tutors"))
+        self.assertEqual(
+            [t.user_profile.user.username for t in response.context["recommended"]],
+            ["ben", "anna"],
+        )
+
+
+class TutorIndexTests(TestCase):
+
+    def test_overlay_matches_full_rebuild(self):
+        rows = [
+            {"id": i, "subject": subject, "bio": bio, "experience": i,
+             "hourly_rate": 20 + i}
+            for i, (subject, bio) in enumerate([
+                ("IELTS", "speaking exam practice"),
+                ("Business English", "presentations and meetings"),
+                ("Grammar", "tenses and articles for exams"),
+            ], start=1)
+        ]
+        index = TutorIndex.build(rows)
+        edited = dict(rows[1], bio="exam speaking drills")
+        index.update(edited)
+        index.remove(3)
+        rebuilt = TutorIndex.build([rows[0], edited])
+
+        for goals in ("speaking exam", "grammar"):
+            self.assertEqual(
+                [(i, round(s, 6)) for i, s in index.rank(goals)],
+                [(i, round(s, 6)) for i, s in rebuilt.rank(goals)],
+            )
+        index.compact()
+        self.assertEqual(
+            [(i, round(s, 6)) for i, s in index.rank("speaking exam")],
+            [(i, round(s, 6)) for i, s in rebuilt.rank("speaking exam")],
+        )
+
+
+@override_settings(SHARED_CACHE=True)
+class LessonBookingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_indexes()
+        self.addCleanup(reset_indexes)
+        user = User.objects.create_user(username="ted", password="testpass")
+        set_role(user.userprofile, "tutor")
+        self.tutor = Tutor.objects.create(user_profile=user.userprofile)
+        user = User.objects.create_user(username="sam", password="testpass")
+        set_role(user.userprofile, "student")
+        self.student = Student.objects.create(user_profile=user.userprofile)
+        StudentTutorRelationship.objects.create(
+            student=self.student, tutor=self.tutor, is_active=True)
+        Availability.objects.bulk_create([
+            Availability(tutor=self.tutor, weekday=day,
+                         start_time=time(9), end_time=time(12))
+            for day in range(7)
+        ])
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def at(self, hour, minute=0, day=None):
+        return local_datetime(day or self.day, time(hour, minute))
+
+    def starts(self, **kwargs):
+        return [start for start, _ in free_slots(self.tutor, self.day, 1, 60,
+                                                 **kwargs)]
+
+    def test_interval_index_merges_and_finds_overlaps(self):
+        index = IntervalIndex([(1, 3), (2, 5), (8, 9)])
+        self.assertEqual((index.starts, index.ends), ([1, 8], [5, 9]))
+        self.assertTrue(index.overlaps(4, 6))
+        self.assertFalse(index.overlaps(5, 8))
+        self.assertEqual(index.busy_between(0, 10), [(1, 5), (8, 9)])
+
+    def test_booking_removes_slot_and_rejects_conflicts(self):
+        self.assertEqual(self.starts(), [self.at(9), self.at(9, 30),
+                                         self.at(10), self.at(10, 30),
+                                         self.at(11)])
+        self.client.login(username="sam", password="testpass")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("book_tutor", args=[self.tutor.id]),
+                {"start": self.at(10).isoformat(), "duration": 60})
+        self.assertRedirects(response, reverse("lessons"))
+        self.assertEqual(self.starts(), [self.at(9), self.at(11)])
+        response = self.client.get(reverse("lessons"))
+        self.assertEqual(len(response.context["lessons"]), 1)
+        response = self.client.get(reverse("book_tutor", args=[self.tutor.id]),
+                                   {"from": self.day.isoformat(), "days": 1})
+        self.assertEqual([start for start, _ in response.context["slots"]],
+                         [self.at(9), self.at(11)])
+
+        with self.assertRaises(BookingError):
+            book_lesson(self.tutor, self.student, self.at(10, 30), 30)
+        with self.assertRaises(BookingError):
+            # Outside the tutor's availability
+            book_lesson(self.tutor, self.student, self.at(11, 30), 60)
+        self.assertEqual(Lesson.objects.count(), 1)
+
+    def test_student_lessons_with_other_tutors_are_excluded(self):
+        user = User.objects.create_user(username="una", password="testpass")
+        other = Tutor.objects.create(user_profile=user.userprofile)
+        Lesson.objects.create(tutor=other, student=self.student,
+                              start=self.at(9), end=self.at(10))
+        self.assertNotIn(self.at(9), self.starts(student=self.student))
+        self.assertIn(self.at(9), self.starts())
+
+    def test_series_is_all_or_nothing(self):
+        book_lesson(self.tutor, self.student,
+                    self.at(9, day=self.day + timedelta(weeks=2)), 60)
+        with self.assertRaises(BookingError):
+            book_series(self.tutor, self.student, self.at(9), 60, weeks=4)
+        self.assertEqual(Lesson.objects.count(), 1)
+
+        series = book_series(self.tutor, self.student, self.at(11), 60, weeks=4)
+        self.assertEqual(
+            [lesson.start for lesson in series.lessons.order_by("start")],
+            [self.at(11, day=self.day + timedelta(weeks=week))
+             for week in range(4)],
+        )
+
+    def test_cancelling_frees_the_slot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = book_lesson(self.tutor, self.student, self.at(9), 60)
+        self.assertNotIn(self.at(9), self.starts())
+        self.client.login(username="ted", password="testpass")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("cancel_lesson", args=[lesson.id]))
+        self.assertIn(self.at(9), self.starts())
+        self.assertContains(self.client.get(reverse("lessons")),
+                            "No lessons booked.")
+
+    def test_free_slots_skip_past_lessons(self):
+        # Years of past lessons stay out of the index's range query
+        start = self.at(9) - timedelta(days=3 * 365)
+        Lesson.objects.bulk_create([
+            Lesson(tutor=self.tutor, student=self.student,
+                   start=start + timedelta(days=i), end=start
+                   + timedelta(days=i, hours=1))
+            for i in range(1000)
+        ])
+        with self.assertNumQueries(2):
+            slots = free_slots(self.tutor, self.day, 28, 60)
+        self.assertEqual(len(slots), 28 * 5)
+        # Availability only, the busy index is reused
+        with self.assertNumQueries(1):
+            free_slots(self.tutor, self.day, 28, 60)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_index_not_reused_without_shared_cache(self):
+        self.assertIn(self.at(9), self.starts())
+        # Booked by another worker, whose version bump stays in its cache
+        Lesson.objects.bulk_create([Lesson(
+            tutor=self.tutor, student=self.student,
+            start=self.at(9), end=self.at(10))])
+        self.assertNotIn(self.at(9), self.starts())
+
+
+@override_settings(SHARED_CACHE=True)
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        recorder.flush()
+        recorder.totals.clear()
+        cache.clear()
+        User.objects.create_user(username="ted", password="testpass")
+        self.client.login(username="ted", password="testpass")
+
+    def scrape(self, **headers):
+        return self.client.get(reverse("metrics"), headers=headers)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("inbox"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", '
+                                 r"tpl;dur=[\d.]+, total;dur=[\d.]+$")
+
+    def test_metrics_aggregate_per_view(self):
+        self.client.get(reverse("inbox"))
+        self.client.get(reverse("inbox"))
+        with self.assertLogs("django.request", "WARNING"):
+            self.client.get("/no-such-page/")
+        User.objects.filter(username="ted").update(is_staff=True)
+
+        body = self.scrape().content.decode()
+        self.assertIn('gr8tutor_request_duration_seconds_count{view="inbox"} 2',
+                      body)
+        self.assertIn('gr8tutor_db_queries_bucket{view="inbox",le="+Inf"} 2',
+                      body)
+        self.assertIn('gr8tutor_request_duration_seconds_count{view="other"} 1',
+                      body)
+
+    @override_settings(SHARED_CACHE=False, WEB_CONCURRENCY=1)
+    def test_single_worker_keeps_totals_in_process(self):
+        self.client.get(reverse("inbox"))
+        User.objects.filter(username="ted").update(is_staff=True)
+        body = self.scrape().content.decode()
+        self.assertIn('gr8tutor_request_duration_seconds_count{view="inbox"} 1',
+                      body)
+        self.assertFalse(cache.get_many([
+            "metrics:gr8tutor_db_queries:inbox:count"]))
+
+    @override_settings(SHARED_CACHE=False, WEB_CONCURRENCY=4)
+    def test_needs_shared_cache_with_several_workers(self):
+        User.objects.filter(username="ted").update(is_staff=True)
+        with self.assertLogs("django.request", "ERROR"):
+            self.assertEqual(self.scrape().status_code, 503)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.scrape().status_code, 403)
+        response = self.scrape(Authorization="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE gr8tutor_db_queries histogram",
+                      response.content.decode())
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        User.objects.create_user(username="ted", password="testpass")
+        self.client.login(username="ted", password="testpass")
+
+    def slow_dashboard(self, **headers):
+        def slow_unread_total(user):
+            sleep(0.05)
+            return 0
+        with mock.patch.object(Conversation, "unread_total", slow_unread_total):
+            return self.client.get(reverse("dashboard"), headers=headers)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_slow_requests_are_profiled(self):
+        with self.settings(PROFILING_ENABLED=True, PROFILING_SLOW_THRESHOLD=0.04,
+                           PROFILING_INTERVAL=0.001, PROFILING_DIR=self.directory):
+            self.client.get(reverse("inbox"))
+            self.slow_dashboard()
+        [name] = self.profiles()
+        self.assertIn("-dashboard-", name)
+        with open(os.path.join(self.directory, name)) as profile:
+            self.assertIn("gr8tutor.views:dashboard;", profile.read())
+
+        out = StringIO()
+        call_command("profile_report", dir=self.directory, stdout=out)
+        self.assertIn("1 profiles", out.getvalue())
+        self.assertIn("gr8tutor.views:dashboard", out.getvalue())
+
+    def test_header_needs_the_token(self):
+        with self.settings(PROFILING_TOKEN="s3cret", PROFILING_INTERVAL=0.001,
+                           PROFILING_DIR=self.directory):
+            self.assertNotIn("X-Profile-File",
+                             self.slow_dashboard(**{"X-Profile": "guess"}))
+            response = self.slow_dashboard(**{"X-Profile": "s3cret"})
+        self.assertEqual(self.profiles(), [response["X-Profile-File"]])
+
+
+class StructuredLoggingTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username="ted", password="testpass")
+        self.client.login(username="ted", password="testpass")
+
+    def test_json_lines_carry_the_request_id(self):
+        stream = StringIO()
+        handler = QueueingHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger("gr8tutor.tests.structured")
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+
+        token = current_request.set(mock.Mock(request_id="req-1",
+                                              resolver_match=None))
+        try:
+            logger.warning("Hello %s", "there", extra={"user_id": 5})
+        finally:
+            current_request.reset(token)
+        handler.close()  # drains the queue
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(
+            {key: entry[key] for key in ("level", "message", "request_id",
+                                         "user_id")},
+            {"level": "WARNING", "message": "Hello there",
+             "request_id": "req-1", "user_id": 5},
+        )
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = QueueingHandler(StringIO(), maxsize=1)
+        handler.listener.stop()
+        for i in range(3):
+            handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+        self.assertEqual(handler.dropped, 2)
+
+    def test_request_id_is_echoed(self):
+        response = self.client.get(reverse("inbox"),
+                                   headers={"X-Request-ID": "router-id-1"})
+        self.assertEqual(response["X-Request-ID"], "router-id-1")
+        self.assertRegex(self.client.get(reverse("inbox"))["X-Request-ID"],
+                         r"^[0-9a-f]{32}$")
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_query_and_request_logs(self):
+        with self.assertLogs("gr8tutor.slow_queries", "WARNING") as queries, \
+                self.assertLogs("gr8tutor.slow_requests", "WARNING") as requests:
+            self.client.get(reverse("inbox"))
+        self.assertTrue(all(record.sql for record in queries.records))
+        [record] = requests.records
+        self.assertEqual((record.path, record.status), (reverse("inbox"), 200))
+        self.assertEqual(record.queries, len(queries.records))
+
+
+
+class SeedScaleCommandTests(TestCase):
+
+    def test_seeds_skewed_history(self):
+        out = StringIO()
+        call_command("seed_scale", "--tutors", "20", "--students", "200",
+                     "--messages", "3000", "--days", "30", "--batch-size", "500",
+                     stdout=out)
+
+        self.assertEqual(Tutor.objects.count(), 20)
+        self.assertEqual(Student.objects.count(), 200)
+        self.assertEqual(Message.objects.count(), 3000)
+        self.assertIn("3000 messages", out.getvalue())
+        active = StudentTutorRelationship.objects.filter(is_active=True)
+        # One inbox row per confirmed pair, each holding its last message
+        self.assertEqual(Conversation.objects.count(), active.count())
+        conversation = Conversation.objects.first()
+        last = Message.objects.order_by("-time").first()
+        self.assertEqual(conversation.last_message_time, last.time)
+        self.assertEqual(conversation.unread_low + conversation.unread_high, 0)
+        # History is spread out, not all stamped "now"
+        oldest = Message.objects.order_by("time").first().time
+        self.assertGreater(timezone.now() - oldest, timedelta(days=1))
+        # The most popular tutor has far more students than the median one
+        rosters = sorted(
+            StudentTutorRelationship.objects.filter(tutor=tutor).count()
+            for tutor in Tutor.objects.all())
+        self.assertGreater(rosters[-1], 5 * max(1, rosters[len(rosters) // 2]))
+
+    def test_refuses_to_reuse_prefix(self):
+        User.objects.create_user(username="seed-s0", password="testpass")
+        with self.assertRaises(CommandError):
+            call_command("seed_scale", "--tutors", "1", "--students", "1",
+                         stdout=StringIO())
+
+
+class QueryPlanTests(TestCase):
+    # Every statement behind the hot pages must be an index lookup or an
+    # index-ordered range scan (see queryplans.py)
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_scale", "--tutors", "20", "--students", "300",
+                     "--messages", "5000", "--batch-size", "1000",
+                     stdout=StringIO())
+        relationship = StudentTutorRelationship.objects.filter(
+            is_active=True).annotate(
+            roster=Count("tutor__studenttutorrelationship")).order_by(
+            "-roster").select_related("tutor__user_profile__user",
+                                      "student__user_profile__user").first()
+        cls.tutor = relationship.tutor.user_profile.user
+        cls.student = relationship.student.user_profile.user
+        analyze()
+
+    def assertGoodPlans(self, user, urls):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+        problems = plan_problems(query["sql"] for query in ctx.captured_queries)
+        self.assertFalse(problems, "\n\n".join(
+            f"{sql}\n" + "\n".join(f"  {line}" for line in plan)
+            for sql, plan in problems))
+
+    def test_tutor_pages(self):
+        page = newest_first_page(
+            conversation_directions(self.tutor, self.student))
+        cursor = encode_time_cursor(page.object_list[0])
+        self.assertGoodPlans(self.tutor, [
+            reverse("tutor_dashboard"),
+            reverse("tutor_students"),
+            reverse("lessons"),
+            reverse("inbox"),
+            reverse("chat", args=[self.student.id]),
+            reverse("chat_history", args=[self.student.id]) + f"?before={cursor}",
+            reverse("chat_updates", args=[self.student.id]) + f"?after={cursor}",
+        ])
+
+    def test_student_pages(self):
+        self.assertGoodPlans(self.student, [
+            reverse("student_dashboard"),
+            reverse("lessons"),
+            reverse("inbox"),
+            reverse("chat", args=[self.tutor.id]),
+        ])
+
+    def test_flags_full_scans_and_sorts(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(Message.objects.filter(text="hello"))
+            list(conversation_messages(self.tutor, self.student)[:50])
+        problems = plan_problems(query["sql"] for query in ctx.captured_queries)
+        self.assertEqual(len(problems), 2)
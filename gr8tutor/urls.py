@@ -7,6 +7,8 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('index/', views.index, name='index'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/tutor/', views.tutor_dashboard, name='tutor_dashboard'),
+    path('dashboard/student/', views.student_dashboard, name='student_dashboard'),
 
     # Static pages
     path('about/', views.about, name='about'),
@@ -23,15 +25,33 @@ urlpatterns = [
     path('confirm-student/<int:student_id>/', views.confirm_student, name='confirm_student'),
     path('delete-student/<int:student_id>/', views.delete_student, name='delete_student'),
     path('request-tutor/<int:tutor_id>/', views.request_tutor, name='request_tutor'),
+    path('lessons/', views.lessons, name='lessons'),
+    path('lessons/availability/', views.add_availability, name='add_availability'),
+    path('lessons/availability/<int:availability_id>/delete/', views.delete_availability, name='delete_availability'),
+    path('lessons/book/<int:tutor_id>/', views.book_tutor, name='book_tutor'),
+    path('lessons/<int:lesson_id>/cancel/', views.cancel_lesson_view, name='cancel_lesson'),
     path('choose-role/', views.choose_role, name='choose_role'),
+    path('tutor/avatar/', views.tutor_avatar, name='tutor_avatar'),
+    path('media/avatars/thumbs/<str:name>', views.avatar_thumbnail, name='avatar_thumbnail'),
 
     # Admin
     path('delete-profile/<int:user_id>/', views.delete_profile, name='delete_profile'),
     path('admin-user-list/', views.admin_user_list, name='admin_user_list'),
+    path('admin-user-list/export/', views.admin_user_export, name='admin_user_export'),
+    path('admin-messages/export/', views.admin_message_export, name='admin_message_export'),
+    path('api/admin/cache-stats/', views.admin_cache_stats, name='admin_cache_stats'),
+    path('metrics', views.metrics, name='metrics'),
 
     # Chat
+    path('inbox/', views.inbox, name='inbox'),
     path('chat/<int:other_party_id>/', views.chat_view, name='chat'),
 
     # Endpoints
+    path('api/tutors/search/', views.tutor_search, name='tutor_search'),
+    path('api/tutors/recommended/', views.tutor_recommendations, name='tutor_recommendations'),
+    path('api/tutors/<int:tutor_id>/slots/', views.tutor_slots, name='tutor_slots'),
+    path('api/chat/<int:other_party_id>/history/', views.chat_history, name='chat_history'),
+    path('api/chat/<int:other_party_id>/stream/', views.chat_stream, name='chat_stream'),
+    path('api/chat/<int:other_party_id>/updates/', views.chat_updates, name='chat_updates'),
 ]
 
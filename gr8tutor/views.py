@@ -1,58 +1,135 @@
+import asyncio
+import csv
+import hmac
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, Http404, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_image_file_extension
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
 from django.db import OperationalError, IntegrityError
 import logging
 
 from .models import (
+    Availability,
+    Conversation,
+    Lesson,
     Message,
     Tutor,
     Student,
     StudentTutorRelationship,
     User,
     UserProfile,
+    conversation_directions,
+    conversation_messages,
+)
+from .avatars import MAX_UPLOAD_SIZE, THUMBNAIL_DIR, thumbnail_size
+from .metrics import metrics_available, render_metrics
+from .directory import (
+    cached_directory,
+    directory_cache_key,
+    directory_cache_stats,
+)
+from .pagecache import cache_public_page
+from .permissions import can_chat
+from .pubsub import conversation_channel, get_broker, live_updates_enabled
+from .pagination import (
+    encode_time_cursor,
+    keyset_page,
+    newest_first_page,
+    parse_cursor,
+    parse_time_cursor,
+    rows_after,
+)
+from .scheduling import (
+    LESSON_DURATIONS,
+    MAX_SLOT_DAYS,
+    BookingError,
+    book_lesson,
+    book_series,
+    cancel_lesson,
+    free_slots,
 )
+from .services import RegistrationError, register_user, set_role
+from .streaming import stream_queryset
+from .jobs import enqueue
+from .tasks import enqueue_relationship_email
+from .recommendations import recommend_tutors
+from .search import filter_tutors, has_filters, parse_filters, subject_facets
 
 logger = logging.getLogger(__name__)
 
+TUTORS_PAGE_SIZE = 12
+CHAT_PAGE_SIZE = 50
+INBOX_PAGE_SIZE = 30
+RECOMMENDED_TUTORS = 3
+ADMIN_USERS_PAGE_SIZE = 50
+UPCOMING_LESSONS = 50
+BOOKING_DAYS = 14
+# Seconds between SSE comments that keep idle proxies from closing streams
+CHAT_STREAM_HEARTBEAT = 20
+
 # Helper functions (role & permission checks)
+# request.actor is resolved once per request by ActorMiddleware
 
-def user_is_tutor(user):
-    return hasattr(user, "userprofile") and user.userprofile.role == "tutor"
+def user_is_tutor(actor):
+    return actor.is_tutor
 
 
-def user_is_student(user):
-    return hasattr(user, "userprofile") and user.userprofile.role == "student"
+def user_is_student(actor):
+    return actor.is_student
 
 
-def get_tutor_or_forbidden(user):
-    if not user_is_tutor(user):
+def get_tutor_or_forbidden(actor):
+    if not user_is_tutor(actor):
         return None, HttpResponseForbidden("You must be a tutor to access this page.")
-    try:
-        return user.userprofile.tutor, None
-    except (AttributeError, Tutor.DoesNotExist):
+    if actor.tutor is None:
         return None, HttpResponseForbidden("Tutor profile not found.")
+    return actor.tutor, None
 
 
-def get_student_or_forbidden(user):
-    if not user_is_student(user):
+def get_student_or_forbidden(actor):
+    if not user_is_student(actor):
         return None, HttpResponseForbidden("You must be a student to access this page.")
-    try:
-        return user.userprofile.student, None
-    except (AttributeError, Student.DoesNotExist):
+    if actor.student is None:
         return None, HttpResponseForbidden("Student profile not found.")
+    return actor.student, None
 
 # Public pages
+@cache_public_page
 def index(request):
     return render(request, "gr8tutor/index.html")
 
 
+@cache_public_page
 def about(request):
     return render(request, "gr8tutor/about.html")
 
 
+@cache_public_page
 def contact(request):
     return render(request, "gr8tutor/contact.html")
 
@@ -172,45 +249,20 @@ def register_view(request):
                 }
             )
 
-        # Check if username or email already exists
-        if User.objects.filter(username=username).exists():
-            return render(
-                request,
-                "gr8tutor/register.html",
-                {
-                    "registration_error": True,
-                    "error_message": "Username already exists.",
-                }
-            )
-
-        if User.objects.filter(email=email).exists():
+        # Create user, profile and Tutor/Student in one transaction
+        try:
+            register_user(username, email, password, role)
+        except RegistrationError as e:
             return render(
                 request,
                 "gr8tutor/register.html",
                 {
                     "registration_error": True,
-                    "error_message": "Email already exists.",
-                }
+                    "error_message": str(e),
+                },
+                status=409,
             )
 
-        # Create user
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=password
-        )
-
-        # Create user profile automatically
-        profile = user.userprofile
-        profile.role = role
-        profile.save()
-
-        # Create Tutor or Student profile
-        if role == "tutor":
-            Tutor.objects.create(user_profile=profile)
-        else:
-            Student.objects.create(user_profile=profile)
-
         # Successful registration
         return render(
             request,
@@ -221,18 +273,6 @@ def register_view(request):
             }
         )
 
-    # User already exists
-    # except IntegrityError:
-    #     return render(
-    #         request,
-    #         "gr8tutor/register.html",
-    #         {
-    #             "registration_error": True,
-    #             "error_message": "Username already exists.",
-    #         },
-    #         status=409,
-    #     )
-
     except OperationalError:
         logger.exception("Database unavailable during registration.")
 
@@ -249,12 +289,16 @@ def register_view(request):
 # Dashboard (role-based redirect)
 @login_required
 def dashboard(request):
-    return render(request, "gr8tutor/dashboard.html")
+    return render(
+        request,
+        "gr8tutor/dashboard.html",
+        {"unread_messages": Conversation.unread_total(request.user)},
+    )
 
 # Tutor & Student dashboards
 @login_required
 def tutor_dashboard(request):
-    tutor, error = get_tutor_or_forbidden(request.user)
+    tutor, error = get_tutor_or_forbidden(request.actor)
     if error:
         return error
 
@@ -262,12 +306,13 @@ def tutor_dashboard(request):
     return render(
         request,
         "gr8tutor/dashboard.html",
-        {"tutor": tutor, "relationships": relationships},
+        {"tutor": tutor, "relationships": relationships,
+         "unread_messages": Conversation.unread_total(request.user)},
     )
 
 @login_required
 def student_dashboard(request):
-    student, error = get_student_or_forbidden(request.user)
+    student, error = get_student_or_forbidden(request.actor)
     if error:
         return error
 
@@ -275,28 +320,197 @@ def student_dashboard(request):
     return render(
         request,
         "gr8tutor/dashboard.html",
-        {"student": student, "relationships": relationships},
+        {"student": student, "relationships": relationships,
+         "unread_messages": Conversation.unread_total(request.user)},
     )
 
 # Tutor list (public for students)
+def tutor_directory():
+    # One joined query per page, loading only what a tutor card shows
+    return Tutor.objects.select_related("user_profile__user").only(
+        "id",
+        "subject",
+        "experience",
+        "hourly_rate",
+        "bio_excerpt",
+        "avatar_thumbnail",
+        "user_profile__id",
+        "user_profile__user__id",
+        "user_profile__user__username",
+    )
+
+
+def tutor_directory_page(request):
+    filters = parse_filters(request.GET)
+    after = parse_cursor(request.GET.get("after"))
+    before = parse_cursor(request.GET.get("before"))
+
+    def load():
+        page = keyset_page(
+            filter_tutors(tutor_directory(), filters),
+            after=after,
+            before=before,
+            size=TUTORS_PAGE_SIZE,
+        )
+        return page, subject_facets(Tutor.objects.all(), filters)
+
+    page, facets = cached_directory(
+        directory_cache_key(sorted(filters.items()), after, before), load)
+    return filters, page, facets
+
+
+def recommended_tutors(student, limit, budget=None):
+    ranked = recommend_tutors(student, limit=limit, budget=budget)
+    found = tutor_directory().in_bulk([tutor_id for tutor_id, _ in ranked])
+    # Tutors deleted since the index was built are skipped
+    return [(found[tutor_id], score) for tutor_id, score in ranked
+            if tutor_id in found]
+
+
 @login_required
 def tutors(request):
-    tutors = Tutor.objects.all()
-    return render(request, "gr8tutor/tutors.html", {"tutors": tutors})
+    filters, page, facets = tutor_directory_page(request)
+    recommended = []
+    if (request.actor.is_student and request.actor.student
+            and not has_filters(filters) and not page.has_previous):
+        recommended = [tutor for tutor, _ in recommended_tutors(
+            request.actor.student, RECOMMENDED_TUTORS)]
+    return render(
+        request,
+        "gr8tutor/tutors.html",
+        {
+            "tutors": page,
+            "page": page,
+            "filters": filters,
+            "searching": has_filters(filters),
+            "facets": facets,
+            "recommended": recommended,
+            "avatar_size": thumbnail_size(),
+        },
+    )
+
+
+def serialize_tutor(tutor):
+    return {
+        "id": tutor.id,
+        "username": tutor.user_profile.user.username,
+        "subject": tutor.subject,
+        "experience": tutor.experience,
+        "hourly_rate": str(tutor.hourly_rate),
+        "bio_excerpt": tutor.bio_excerpt,
+        "avatar": (tutor.avatar_thumbnail.url
+                   if tutor.avatar_thumbnail else None),
+    }
+
+
+@login_required
+def tutor_search(request):
+    filters, page, facets = tutor_directory_page(request)
+    return JsonResponse(
+        {
+            "results": [serialize_tutor(tutor) for tutor in page],
+            "facets": facets,
+            "next_cursor": page.next_cursor,
+            "previous_cursor": page.previous_cursor,
+        }
+    )
+
+
+@login_required
+def tutor_recommendations(request):
+    student, error_response = get_student_or_forbidden(request.actor)
+    if error_response:
+        return error_response
+
+    limit = min(parse_cursor(request.GET.get("limit")) or RECOMMENDED_TUTORS,
+                50)
+    budget = parse_filters(request.GET)["max_rate"]
+    ranked = recommended_tutors(student, limit,
+                                budget=float(budget) if budget else None)
+    return JsonResponse({
+        "results": [dict(serialize_tutor(tutor), score=round(score, 4))
+                    for tutor, score in ranked],
+    })
+
+
+@login_required
+def admin_cache_stats(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("For admins only.")
+    return JsonResponse({"tutor_directory": directory_cache_stats()})
+
+def metrics(request):
+    # Prometheus scrape target: bearer token, or staff when none is set
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponseForbidden("Invalid metrics token.")
+    elif not request.user.is_staff:
+        return HttpResponseForbidden("For admins only.")
+    if not metrics_available():
+        # Each scrape would see whichever worker answered
+        return HttpResponse("Metrics need a shared cache.", status=503)
+    return HttpResponse(render_metrics(),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@login_required
+def tutor_avatar(request):
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
+    if error_response:
+        return error_response
+    if request.method != "POST":
+        return redirect("dashboard")
+
+    upload = request.FILES.get("avatar")
+    try:
+        if upload is None:
+            raise ValidationError("Choose a photo to upload.")
+        if upload.size > MAX_UPLOAD_SIZE:
+            raise ValidationError("Photos must be 5 MB or smaller.")
+        validate_image_file_extension(upload)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return redirect("dashboard")
+
+    # Store the raw upload only - resizing happens in the background
+    previous = tutor.avatar.name
+    tutor.avatar.save(upload.name, upload, save=False)
+    tutor.save(update_fields=["avatar"])
+    if previous:
+        tutor.avatar.storage.delete(previous)
+    enqueue("avatars.process",
+            {"tutor_id": tutor.id, "upload_name": tutor.avatar.name})
+
+    messages.success(request, "Photo uploaded, your thumbnail will be ready shortly.")
+    return redirect("dashboard")
+
+
+def avatar_thumbnail(request, name):
+    # Names are content hashes, so a URL's bytes never change
+    try:
+        handle = default_storage.open(f"{THUMBNAIL_DIR}{name}")
+    except (OSError, SuspiciousFileOperation):
+        # Missing, a directory, unreadable...
+        raise Http404("No such thumbnail.")
+    response = FileResponse(handle, content_type="image/webp")
+    patch_cache_control(response, public=True, max_age=31536000,
+                        immutable=True)
+    return response
 
 # Tutor managing students
 @login_required
 def tutor_students(request):
-    tutor, error_response = get_tutor_or_forbidden(request.user)
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
     if error_response:
         return error_response
 
-    pending_students = StudentTutorRelationship.objects.filter(
-        tutor=tutor, is_active=False
-    )
-    active_students = StudentTutorRelationship.objects.filter(
-        tutor=tutor, is_active=True
-    )
+    # The template shows each student's username and links to their chat
+    relationships = StudentTutorRelationship.objects.filter(
+        tutor=tutor
+    ).select_related("student__user_profile__user")
+    pending_students = relationships.filter(is_active=False)
+    active_students = relationships.filter(is_active=True)
 
     return render(
         request,
@@ -310,17 +524,21 @@ def tutor_students(request):
 
 @login_required
 def confirm_student(request, student_id):
-    tutor, error_response = get_tutor_or_forbidden(request.user)
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
     if error_response:
         return error_response
 
-    student = get_object_or_404(Student, id=student_id)
+    # With user_profile loaded, invalidating the chat pair costs no query
+    student = get_object_or_404(Student.objects.select_related("user_profile"),
+                                id=student_id)
 
     relationship, _ = StudentTutorRelationship.objects.get_or_create(
         tutor=tutor, student=student
     )
-    relationship.is_active = True
-    relationship.save()
+    if not relationship.is_active:
+        relationship.is_active = True
+        relationship.save()
+        enqueue_relationship_email(relationship, "confirmed")
 
     messages.success(request, "Student confirmed.")
     return redirect("tutor_students")
@@ -331,13 +549,13 @@ def delete_student(request, student_id):
     if request.method != "POST":
         raise Http404()
 
-    tutor, error_response = get_tutor_or_forbidden(request.user)
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
     if error_response:
         return error_response
 
     relationship = StudentTutorRelationship.objects.filter(
         tutor=tutor, student__id=student_id
-    ).first()
+    ).select_related("tutor__user_profile", "student__user_profile").first()
 
     if not relationship:
         raise Http404("This student is not associated with you.")
@@ -349,11 +567,12 @@ def delete_student(request, student_id):
 # Student requesting a tutor
 @login_required
 def request_tutor(request, tutor_id):
-    student, error_response = get_student_or_forbidden(request.user)
+    student, error_response = get_student_or_forbidden(request.actor)
     if error_response:
         return error_response
 
-    tutor = get_object_or_404(Tutor, id=tutor_id)
+    tutor = get_object_or_404(Tutor.objects.select_related("user_profile"),
+                              id=tutor_id)
 
     relationship, created = StudentTutorRelationship.objects.get_or_create(
         student=student, tutor=tutor
@@ -362,11 +581,168 @@ def request_tutor(request, tutor_id):
     if not created:
         messages.info(request, "You have already requested this tutor.")
     else:
+        enqueue_relationship_email(relationship, "requested")
         messages.success(request, "Tutor request sent successfully.")
 
     return redirect("tutors")
 
+# Lessons
+@login_required
+def lessons(request):
+    upcoming = Lesson.objects.filter(status="booked", end__gt=timezone.now())
+    context = {"durations": LESSON_DURATIONS}
+    if user_is_tutor(request.actor):
+        tutor, error_response = get_tutor_or_forbidden(request.actor)
+        if error_response:
+            return error_response
+        upcoming = upcoming.filter(tutor=tutor)
+        context["availability"] = Availability.objects.filter(tutor=tutor)
+        context["weekdays"] = Availability.WEEKDAY_CHOICES
+    else:
+        student, error_response = get_student_or_forbidden(request.actor)
+        if error_response:
+            return error_response
+        upcoming = upcoming.filter(student=student)
+        context["tutors"] = (
+            StudentTutorRelationship.objects
+            .filter(student=student, is_active=True)
+            .select_related("tutor__user_profile__user")
+        )
+    context["lessons"] = upcoming.select_related(
+        "tutor__user_profile__user", "student__user_profile__user"
+    )[:UPCOMING_LESSONS]
+    return render(request, "gr8tutor/lessons.html", context)
+
+
+@login_required
+def add_availability(request):
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
+    if error_response:
+        return error_response
+    if request.method != "POST":
+        return redirect("lessons")
+
+    weekday = parse_cursor(request.POST.get("weekday"))
+    try:
+        start_time = parse_time(request.POST.get("start_time", ""))
+        end_time = parse_time(request.POST.get("end_time", ""))
+    except ValueError:
+        start_time = end_time = None
+    if (weekday is None or weekday > 6 or start_time is None
+            or end_time is None or end_time <= start_time):
+        messages.error(request, "Enter a day and a start time before the end time.")
+        return redirect("lessons")
+
+    Availability.objects.create(tutor=tutor, weekday=weekday,
+                                start_time=start_time, end_time=end_time)
+    messages.success(request, "Availability added.")
+    return redirect("lessons")
+
+
+@login_required
+def delete_availability(request, availability_id):
+    if request.method != "POST":
+        raise Http404()
+    tutor, error_response = get_tutor_or_forbidden(request.actor)
+    if error_response:
+        return error_response
+
+    get_object_or_404(Availability, id=availability_id, tutor=tutor).delete()
+    messages.success(request, "Availability removed.")
+    return redirect("lessons")
+
+
+def parse_slot_params(params):
+    today = timezone.localdate()
+    start_date = parse_date(params.get("from") or "") or today
+    days = min(parse_cursor(params.get("days")) or BOOKING_DAYS, MAX_SLOT_DAYS)
+    duration = parse_cursor(params.get("duration")) or 60
+    if duration not in LESSON_DURATIONS:
+        duration = 60
+    return max(start_date, today), days, duration
+
+
+@login_required
+def tutor_slots(request, tutor_id):
+    tutor = get_object_or_404(Tutor, id=tutor_id)
+    start_date, days, duration = parse_slot_params(request.GET)
+    # Students also see their own lessons taken out of the tutor's slots
+    student = request.actor.student if user_is_student(request.actor) else None
+    return JsonResponse({
+        "duration": duration,
+        "slots": [{"start": start.isoformat(), "end": end.isoformat()}
+                  for start, end in free_slots(tutor, start_date, days,
+                                               duration, student=student)],
+    })
+
+
+@login_required
+def book_tutor(request, tutor_id):
+    student, error_response = get_student_or_forbidden(request.actor)
+    if error_response:
+        return error_response
+    relationship = get_object_or_404(
+        StudentTutorRelationship.objects.select_related("tutor__user_profile__user"),
+        student=student, tutor_id=tutor_id, is_active=True,
+    )
+    tutor = relationship.tutor
+
+    if request.method == "POST":
+        try:
+            start = parse_datetime(request.POST.get("start", ""))
+        except ValueError:
+            start = None
+        duration = parse_cursor(request.POST.get("duration"))
+        weeks = parse_cursor(request.POST.get("weeks")) or 1
+        try:
+            if start is None or timezone.is_naive(start) or duration is None:
+                raise BookingError("Choose a time from the list.")
+            if weeks > 1:
+                book_series(tutor, student, start, duration, weeks)
+            else:
+                book_lesson(tutor, student, start, duration)
+        except BookingError as e:
+            messages.error(request, str(e))
+            return redirect("book_tutor", tutor_id=tutor.id)
+        messages.success(request, "Lesson booked.")
+        return redirect("lessons")
+
+    start_date, days, duration = parse_slot_params(request.GET)
+    slots = free_slots(tutor, start_date, days, duration, student=student)
+    return render(request, "gr8tutor/book_lesson.html", {
+        "tutor": tutor,
+        "slots": slots,
+        "duration": duration,
+        "durations": LESSON_DURATIONS,
+        "start_date": start_date,
+        "next_date": start_date + timedelta(days=days),
+    })
+
+
+@login_required
+def cancel_lesson_view(request, lesson_id):
+    if request.method != "POST":
+        raise Http404()
+    lesson = get_object_or_404(
+        Lesson,
+        Q(tutor__user_profile__user=request.user)
+        | Q(student__user_profile__user=request.user),
+        id=lesson_id,
+    )
+    if cancel_lesson(lesson):
+        messages.success(request, "Lesson cancelled.")
+    return redirect("lessons")
+
 # Messaging between Tutor and Student
+def serialize_message(message, current_user):
+    return {
+        "id": message.id,
+        "text": message.text,
+        "time": message.time.isoformat(),
+        "sent": message.sender_id == current_user.id,
+    }
+
+
 @login_required
 def chat_view(request, other_party_id):
     current_user = request.user
@@ -375,29 +751,9 @@ def chat_view(request, other_party_id):
     if current_user == other_user:
         return HttpResponseForbidden("Chatting with yourself is not allowed.")
 
-    allowed = (
-        StudentTutorRelationship.objects.filter(
-            tutor__user_profile__user=current_user,
-            student__user_profile__user=other_user,
-            is_active=True,
-        ).exists()
-        or StudentTutorRelationship.objects.filter(
-            tutor__user_profile__user=other_user,
-            student__user_profile__user=current_user,
-            is_active=True,
-        ).exists()
-        or current_user.is_staff
-    )
-
-    if not allowed:
+    if not can_chat(current_user, other_user.id):
         return HttpResponseForbidden("You are not allowed to chat with this user.")
 
-    sent_messages = Message.objects.filter(sender=current_user, recipient=other_user)
-    received_messages = Message.objects.filter(
-        sender=other_user, recipient=current_user
-    )
-    chat_messages = sent_messages.union(received_messages).order_by("id")
-
     if request.method == "POST":
         text = request.POST.get("message", "").strip()
 
@@ -405,27 +761,222 @@ def chat_view(request, other_party_id):
             messages.error(request, "Message cannot be empty.")
             return redirect("chat", other_party_id=other_user.id)
 
-        Message.objects.create(
+        message = Message.objects.create(
             sender=current_user,
             recipient=other_user,
             text=text,
         )
 
+        # Live chat posts via fetch and skips the redirect + full render
+        if request.headers.get("x-requested-with") == "XMLHttpRequest":
+            return JsonResponse(serialize_message(message, current_user),
+                                status=201)
+
         return redirect("chat", other_party_id=other_user.id)
 
+    # Only the newest page, older history is fetched on demand
+    page = newest_first_page(
+        conversation_directions(current_user, other_user), size=CHAT_PAGE_SIZE
+    )
+    if page:
+        Conversation.mark_read(current_user, other_user.id,
+                               page.object_list[-1].time)
+
     return render(
         request,
         "gr8tutor/chat.html",
         {
-            "messages": chat_messages,
+            "messages": page,
+            "older_cursor": page.older_cursor,
+            "latest_cursor": (encode_time_cursor(page.object_list[-1])
+                              if page else ""),
             "other_user": other_user,
+            "live_updates": live_updates_enabled(),
         },
     )
 
+
+@login_required
+def chat_history(request, other_party_id):
+    other_user = get_object_or_404(User, id=other_party_id)
+
+    if not can_chat(request.user, other_user.id):
+        return HttpResponseForbidden("You are not allowed to chat with this user.")
+
+    before = parse_time_cursor(request.GET.get("before"))
+    if before is None:
+        return JsonResponse({"error": "Missing or invalid cursor."}, status=400)
+
+    page = newest_first_page(
+        conversation_directions(request.user, other_user),
+        before=before,
+        size=CHAT_PAGE_SIZE,
+    )
+    return JsonResponse(
+        {
+            "messages": [serialize_message(m, request.user) for m in page],
+            "older_cursor": page.older_cursor,
+        }
+    )
+
+@login_required
+def inbox(request):
+    # One indexed read of the user's conversation rows, newest first
+    page = newest_first_page(
+        [side.select_related("user_low", "user_high")
+         for side in Conversation.for_user_sides(request.user)],
+        before=parse_time_cursor(request.GET.get("before")),
+        size=INBOX_PAGE_SIZE,
+        field="last_message_time",
+    )
+    conversations = list(reversed(page.object_list))
+    for conversation in conversations:
+        mine = "low" if conversation.user_low_id == request.user.id else "high"
+        conversation.other_user = (conversation.user_high if mine == "low"
+                                   else conversation.user_low)
+        conversation.unread = getattr(conversation, f"unread_{mine}")
+
+    return render(
+        request,
+        "gr8tutor/inbox.html",
+        {"conversations": conversations, "older_cursor": page.older_cursor},
+    )
+
+
+def parse_etag(value):
+    # If-None-Match: "<cursor>" (weak validators from proxies are fine too)
+    if not value:
+        return None
+    value = value.split(",")[0].strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return value.strip('"')
+
+
+@login_required
+def chat_updates(request, other_party_id):
+    # Delta sync for polling clients: only messages after the client's
+    # (time, id) cursor, and a bodyless 304 when there is nothing new
+    if not can_chat(request.user, other_party_id):
+        return HttpResponseForbidden("You are not allowed to chat with this user.")
+
+    cursor = (request.GET.get("after")
+              or parse_etag(request.headers.get("if-none-match")))
+    after = parse_time_cursor(cursor)
+    conversation = conversation_directions(request.user.id, other_party_id)
+
+    if after is None:
+        page = newest_first_page(conversation, size=CHAT_PAGE_SIZE)
+        rows, has_more = page.object_list, False
+    else:
+        rows, has_more = rows_after(conversation, after, size=CHAT_PAGE_SIZE)
+
+    if not rows:
+        if after is None:
+            return JsonResponse({"messages": [], "cursor": None,
+                                 "has_more": False})
+        response = HttpResponseNotModified()
+        response["ETag"] = f'"{cursor}"'
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    Conversation.mark_read(request.user, other_party_id, rows[-1].time)
+    latest = encode_time_cursor(rows[-1])
+    response = JsonResponse(
+        {
+            "messages": [serialize_message(m, request.user) for m in rows],
+            "cursor": latest,
+            "has_more": has_more,
+        }
+    )
+    response["ETag"] = f'"{latest}"'
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def sse_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+@login_required
+async def chat_stream(request, other_party_id):
+    # Server-Sent Events - only meaningful when served through asgi.py
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live updates need the ASGI server.", status=501)
+    if not live_updates_enabled():
+        # Other workers' messages would never arrive - the client polls
+        return HttpResponse("Live updates need a shared broker.", status=501)
+
+    current_user = await request.auser()
+    other_user = await User.objects.filter(id=other_party_id).afirst()
+    if other_user is None:
+        raise Http404()
+    if not await sync_to_async(can_chat)(current_user, other_user.id):
+        return HttpResponseForbidden("You are not allowed to chat with this user.")
+
+    last_seen = parse_cursor(request.headers.get("last-event-id"))
+    channel = conversation_channel(current_user.id, other_user.id)
+
+    def as_event(payload):
+        payload = dict(payload, sent=payload["sender_id"] == current_user.id)
+        return sse_event("message", payload, event_id=payload["id"])
+
+    # Delivered messages count as read, like a page load, so the email
+    # digest doesn't report what the user already saw here
+    mark_read = sync_to_async(Conversation.mark_read)
+
+    async def events():
+        async with get_broker().subscribe(channel) as subscription:
+            yield "retry: 3000\n\n"
+
+            # Reconnect: replay whatever was missed while disconnected, in
+            # (time, id) order from the last message the client saw
+            seen_time = None
+            if last_seen is not None:
+                seen_time = await Message.objects.filter(
+                    id=last_seen).values_list("time", flat=True).afirst()
+            if seen_time is not None:
+                missed, _ = await sync_to_async(rows_after)(
+                    conversation_directions(current_user.id, other_user.id),
+                    (seen_time, last_seen), size=CHAT_PAGE_SIZE)
+                received = None
+                for message in missed:
+                    yield as_event({
+                        "id": message.id,
+                        "sender_id": message.sender_id,
+                        "text": message.text,
+                        "time": message.time.isoformat(),
+                    })
+                    if message.sender_id == other_user.id:
+                        received = message.time
+                if received is not None:
+                    await mark_read(current_user, other_user.id, received)
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(
+                        subscription.get(), timeout=CHAT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield as_event(payload)
+                if payload["sender_id"] == other_user.id:
+                    await mark_read(current_user, other_user.id,
+                                    parse_datetime(payload["time"]))
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 # Role selection
 @login_required
 def choose_role(request):
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.actor.profile
+    if profile is None:
+        profile, _ = UserProfile.objects.get_or_create(user=request.user)
 
     if profile.role in ["tutor", "student"]:
         return redirect("dashboard")
@@ -434,8 +985,7 @@ def choose_role(request):
         role = request.POST.get("role")
 
         if role in ["tutor", "student"]:
-            profile.role = role
-            profile.save()
+            set_role(profile, role)
 
             if role == "tutor":
                 Tutor.objects.get_or_create(user_profile=profile)
@@ -471,10 +1021,160 @@ def delete_profile(request, user_id):
     return redirect("admin_user_list")
 
 
+def admin_users_queryset(params):
+    # Role filter and search run in SQL over a single users+profiles join
+    users = User.objects.select_related("userprofile").only(
+        "id",
+        "username",
+        "email",
+        "is_staff",
+        "is_active",
+        "date_joined",
+        "last_login",
+        "userprofile__id",
+        "userprofile__role",
+    )
+    role = params.get("role", "")
+    if role in dict(UserProfile.ROLE_CHOICES):
+        users = users.filter(userprofile__role=role)
+    elif role == "none":
+        users = users.filter(Q(userprofile__isnull=True)
+                             | Q(userprofile__role__isnull=True)
+                             | Q(userprofile__role=""))
+
+    query = params.get("q", "").strip()
+    if query:
+        users = users.filter(Q(username__istartswith=query)
+                             | Q(email__istartswith=query))
+    return users
+
+
 @login_required
 def admin_user_list(request):
     if not request.user.is_staff:
         return HttpResponseForbidden("For admins only.")
 
-    users = User.objects.all()
-    return render(request, "gr8tutor/admin_user_list.html", {"users": users})
+    page = keyset_page(
+        admin_users_queryset(request.GET),
+        after=parse_cursor(request.GET.get("after")),
+        before=parse_cursor(request.GET.get("before")),
+        size=ADMIN_USERS_PAGE_SIZE,
+    )
+    return render(
+        request,
+        "gr8tutor/admin_user_list.html",
+        {
+            "users": page,
+            "page": page,
+            "role": request.GET.get("role", ""),
+            "query": request.GET.get("q", ""),
+            "role_choices": UserProfile.ROLE_CHOICES,
+        },
+    )
+
+
+EXPORT_FIELDS = ["id", "username", "email", "userprofile__role", "is_staff",
+                 "is_active", "date_joined", "last_login"]
+
+
+def export_csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [value.isoformat() if hasattr(value, "isoformat") else value
+         for value in row]
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def export_jsonl_chunk(rows, fields=EXPORT_FIELDS):
+    return "".join(
+        json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + "\n"
+        for row in rows
+    )
+
+
+@login_required
+def admin_user_export(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("For admins only.")
+
+    fmt = request.GET.get("format", "csv")
+    if fmt not in ("csv", "jsonl"):
+        return HttpResponse("Unknown export format.", status=400)
+
+    rows = (admin_users_queryset(request.GET)
+            .order_by("id").values_list(*EXPORT_FIELDS))
+    if fmt == "csv":
+        header = ",".join(EXPORT_FIELDS).replace("userprofile__", "") + "\r\n"
+        content = stream_queryset(request, rows, export_csv_chunk,
+                                  prefix=header)
+        content_type = "text/csv"
+    else:
+        content = stream_queryset(request, rows, export_jsonl_chunk)
+        content_type = "application/x-ndjson"
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="users.{fmt}"'
+    return response
+
+
+MESSAGE_EXPORT_FIELDS = ["id", "sender_id", "sender__username", "recipient_id",
+                         "recipient__username", "time", "text"]
+
+
+def _day_start(value):
+    try:
+        day = parse_date(value or "")
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    return timezone.make_aware(
+        datetime.combine(day, datetime.min.time()))
+
+
+def admin_messages_queryset(params):
+    # user=<id> alone: everything they sent or received,
+    # user + with=<id>: a single conversation
+    messages_qs = Message.objects.all()
+    user_id = parse_cursor(params.get("user"))
+    other_id = parse_cursor(params.get("with"))
+    if user_id and other_id:
+        messages_qs = conversation_messages(user_id, other_id)
+    elif user_id:
+        messages_qs = messages_qs.filter(Q(sender_id=user_id)
+                                         | Q(recipient_id=user_id))
+
+    # Dates are inclusive, compared as ranges so the time index is usable
+    since = _day_start(params.get("since"))
+    if since is not None:
+        messages_qs = messages_qs.filter(time__gte=since)
+    until = _day_start(params.get("until"))
+    if until is not None:
+        messages_qs = messages_qs.filter(time__lt=until + timedelta(days=1))
+    return messages_qs
+
+
+@login_required
+def admin_message_export(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("For admins only.")
+
+    rows = (admin_messages_queryset(request.GET)
+            .order_by("id").values_list(*MESSAGE_EXPORT_FIELDS))
+    # gzip container (wbits=31) fed one chunk at a time
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def encode_chunk(chunk):
+        return compressor.compress(
+            export_jsonl_chunk(chunk, MESSAGE_EXPORT_FIELDS).encode())
+
+    response = StreamingHttpResponse(
+        stream_queryset(request, rows, encode_chunk, suffix=compressor.flush),
+        content_type="application/gzip",
+    )
+    stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+    response["Content-Disposition"] = (
+        f'attachment; filename="messages-{stamp}.jsonl.gz"')
+    return response
@@ -2,6 +2,9 @@
 ASGI config for gr8tutor_english_online project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI worker so long-lived chat streams (Server-Sent Events)
+don't tie up a sync worker each, e.g.
+``gunicorn gr8tutor_english_online.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,6 +15,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE',
-                      'settings')
+                      'gr8tutor_english_online.settings')
 
 application = get_asgi_application()
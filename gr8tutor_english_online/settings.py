@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from urllib.parse import urlparse
 import environ
 import dj_database_url
@@ -79,12 +80,16 @@ INSTALLED_APPS = [
 # LOGOUT_REDIRECT_URL = 'index'
 
 MIDDLEWARE = [
+    'gr8tutor.middleware.RequestIdMiddleware',
+    'gr8tutor.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gr8tutor.middleware.ActorMiddleware',
+    'gr8tutor.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     ]
@@ -93,7 +98,8 @@ ROOT_URLCONF = 'gr8tutor_english_online.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time (see gr8tutor/metrics.py)
+        'BACKEND': 'gr8tutor.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -102,6 +108,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gr8tutor.context_processors.actor',
             ],
         },
     },
@@ -149,13 +156,148 @@ STATIC_URL = "/static/"
 # Static files for production
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
-# WhiteNoise configuration for serving static files
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# WhiteNoise configuration for serving static files - hashed, compressed,
+# plus AVIF/WebP variants of img/ at these widths (see gr8tutor/images.py)
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "gr8tutor.storage.ResponsiveStaticFilesStorage",
+    },
+}
+RESPONSIVE_IMAGE_WIDTHS = (480, 800, 1200)
 
 # Media files (user uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# The run_jobs worker is a separate service with its own disk, so in
+# production uploads go to an S3-compatible bucket both can reach
+# (credentials from the usual AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY)
+if os.environ.get("MEDIA_BUCKET"):
+    STORAGES["default"] = {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            "bucket_name": os.environ["MEDIA_BUCKET"],
+            "endpoint_url": os.environ.get("MEDIA_ENDPOINT_URL") or None,
+            "custom_domain": os.environ.get("MEDIA_CUSTOM_DOMAIN") or None,
+            "querystring_auth": False,
+            "file_overwrite": False,
+        },
+    }
+
+# Cache - LocMemCache is per process, so share Redis between workers in
+# production (cache invalidation must reach every worker)
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Caches that writes invalidate (chat permissions, ...) are only correct
+# when every process reads the same cache. Without Redis they are bypassed,
+# unless SHARED_CACHE=True says one process serves everything.
+SHARED_CACHE = (bool(os.environ.get("REDIS_URL"))
+                or os.environ.get("SHARED_CACHE") == "True")
+
+# Rendered public pages (see gr8tutor/pagecache.py) - locmem, file or redis.
+# Keys are prefixed with the deploy version so a release starts cold.
+DEPLOY_VERSION = (os.environ.get("DEPLOY_VERSION")
+                  or os.environ.get("RENDER_GIT_COMMIT", "dev")[:12])
+PAGE_CACHE_BACKEND = os.environ.get(
+    "PAGE_CACHE_BACKEND", "redis" if os.environ.get("REDIS_URL") else "locmem"
+)
+PAGE_CACHE_TIMEOUT = int(os.environ.get("PAGE_CACHE_TIMEOUT", 600))
+if PAGE_CACHE_BACKEND == "redis":
+    CACHES["pages"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+elif PAGE_CACHE_BACKEND == "file":
+    CACHES["pages"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "PAGE_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "gr8tutor-pages"),
+        ),
+    }
+else:
+    CACHES["pages"] = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pages",
+    }
+CACHES["pages"]["KEY_PREFIX"] = f"pages-{DEPLOY_VERSION}"
+CACHES["pages"]["TIMEOUT"] = PAGE_CACHE_TIMEOUT
+
+# Square tutor photo thumbnails, built off-request (see gr8tutor/avatars.py)
+AVATAR_THUMBNAIL_SIZE = 400
+
+# Background jobs (see gr8tutor/jobs.py) - run "manage.py run_jobs"
+JOB_LOCK_TIMEOUT = 600
+JOB_RETRY_DELAY = 30
+# New-message emails are coalesced into one digest per recipient per window
+MESSAGE_DIGEST_DELAY = 600
+
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
+)
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 587))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = True
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL",
+                                    "Gr8tutor <gr8tutorjack@gmail.com>")
+SITE_URL = os.environ.get("SITE_URL", "https://gr8tutor-english-online.onrender.com")
+
+# Request timings (see gr8tutor/metrics.py). Workers add their counts to
+# the shared cache every METRICS_FLUSH_INTERVAL seconds; /metrics needs
+# "Authorization: Bearer $METRICS_TOKEN", or a staff login if no token is set
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "True") == "True"
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Sampling profiler (see gr8tutor/profiling.py), off unless enabled here or
+# a token is set for "X-Profile: <token>" requests. Summarise the profiles
+# with "manage.py profile_report".
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED") == "True"
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_SLOW_THRESHOLD = float(os.environ.get("PROFILING_SLOW_THRESHOLD", 1.0))
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = os.environ.get(
+    "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "gr8tutor-profiles")
+)
+PROFILING_MAX_FILES = 200
+
+# Seconds a tutor directory page stays fresh (see gr8tutor/directory.py)
+TUTOR_DIRECTORY_CACHE_TIMEOUT = 300
+
+# Seconds a user pair's chat permission stays cached (see gr8tutor/permissions.py)
+CHAT_PERMISSION_CACHE_TIMEOUT = 300
+
+# Real-time chat fan-out between workers (see gr8tutor/pubsub.py)
+# In-process only works for a single worker: with WEB_CONCURRENCY > 1 and
+# no Redis, chat pages poll for new messages instead of streaming them
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+CHAT_PUBSUB_BACKEND = os.environ.get(
+    "CHAT_PUBSUB_BACKEND",
+    "gr8tutor.pubsub.RedisBroker" if os.environ.get("REDIS_URL")
+    else "gr8tutor.pubsub.InProcessBroker",
+)
+CHAT_PUBSUB_OPTIONS = {}
+if os.environ.get("REDIS_URL"):
+    CHAT_PUBSUB_OPTIONS["url"] = os.environ["REDIS_URL"]
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = 'index'
 LOGOUT_REDIRECT_URL = 'index'
@@ -181,16 +323,46 @@ else:
     CSRF_COOKIE_SECURE = False
 
 # Logging to help debug on Heroku
+# One JSON object per line, written from a background thread so logging
+# never blocks a request on stdout (see gr8tutor/logs.py).
+# LOG_FORMAT=text gives plain lines for local development.
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD", 0.2))
+SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_THRESHOLD", 1.0))
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'gr8tutor.logs.RequestIdFilter',
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'gr8tutor.logs.JsonFormatter',
+        },
+        'text': {
+            '()': 'gr8tutor.logs.TextFormatter',
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'gr8tutor.logs.QueueingHandler',
+            'formatter': os.environ.get('LOG_FORMAT', 'json'),
+            'filters': ['request_id'],
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'INFO',
+        'level': os.environ.get('LOG_LEVEL', 'INFO'),
+    },
+    'loggers': {
+        # Statements over SLOW_QUERY_THRESHOLD seconds, with their view
+        'gr8tutor.slow_queries': {
+            'level': 'WARNING',
+        },
+        # Requests over SLOW_REQUEST_THRESHOLD seconds, with DB/template time
+        'gr8tutor.slow_requests': {
+            'level': 'WARNING',
+        },
     },
 }